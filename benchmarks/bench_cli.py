@@ -0,0 +1,245 @@
+"""Benchmark every pykeypass command against synthetic app databases
+
+Generates pykeypass app databases with 10, 1,000 and 10,000 group/entry pairs (shaped like the ones
+written by 'pykeypass manage') and times 'list', 'path', 'open' (with a stub launcher), 'manage',
+'journal' ('manage' with the change journal turned on, see 'pykeypass.journal') and 'setup'. Every
+command is timed end to end through the Click CLI ('total') and broken down into the phases it goes
+through:
+
+- unlock: key derivation (KDF) of the app database password
+- parse: decrypting, decompressing and parsing the payload with a known transformed key
+- lookup: finding the entry/entries the command needs
+- save: writing the app database back to disk (appending to the journal for 'journal')
+- launch: starting Keepass ('stub' launcher backend, so this is pykeypass' own overhead)
+
+Results are written to a JSON file that 'benchmarks/compare.py' can diff between commits.
+
+Usage:
+    python benchmarks/bench_cli.py --output bench.json
+    python benchmarks/bench_cli.py --sizes 10,1000 --repeat 5 --output bench.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+from click.testing import CliRunner
+
+PASSWORD = "benchmark"  # noqa: S105
+DEFAULT_SIZES = (10, 1000, 10000)
+
+
+def timed(function, *args, **kwargs):
+    """Run 'function' and return (seconds, result)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def database_name(index):
+    return f"database_{index:05d}"
+
+
+def generate_app_database(pykeypass_db, size):
+    """Create an app database holding 'size' group/entry pairs, like 'pykeypass manage' writes them
+
+    Every third entry gets a 'key' custom property, as if the target database used a key file.
+    """
+    from pykeypass import create_app_database
+
+    kp = create_app_database(pykeypass_db, password=PASSWORD)
+    for index in range(size):
+        name = database_name(index)
+        group = kp.add_group(kp.root_group, name)
+        entry = kp.add_entry(
+            group, name, name, f"password-{index}", url=rf"\\fileserver\keepass\{name}.kdbx", force_creation=True
+        )
+        if index % 3 == 0:
+            entry.set_custom_property("key", rf"\\fileserver\keepass\{name}.key")
+    kp.save()
+
+
+@contextmanager
+def pykeypass_environment(pykeypass_folder):
+    """Point pykeypass (the commands and the client session they use) at 'pykeypass_folder'."""
+    import pykeypass
+    from pykeypass import client
+
+    def path_selection(test=False):
+        return pykeypass_folder, pykeypass_folder / "keepass.exe", pykeypass_folder / "pykeepass.kdbx"
+
+    with mock.patch.object(pykeypass, "path_selection", path_selection), mock.patch.object(
+        client, "app_folder", lambda test=False: pykeypass_folder
+    ):
+        yield
+
+
+def invoke(args, input_text, env=None):
+    """Run a pykeypass command through Click, with the stub launcher, and return its wall clock time."""
+    from pykeypass import cli
+
+    seconds, result = timed(CliRunner().invoke, cli, ["--launcher", "stub", *args], input=input_text, env=env)
+    if result.exception is not None and not isinstance(result.exception, SystemExit):
+        raise RuntimeError(f"'pykeypass {' '.join(args)}' failed") from result.exception
+    if "ERROR:" in result.output or "ISSUE:" in result.output:
+        raise RuntimeError(f"'pykeypass {' '.join(args)}' failed:\n{result.output}")
+    return seconds
+
+
+def measure_phases(pykeypass_db, command, name):
+    """Time the phases of 'command' with the same library calls the command makes."""
+    from pykeepass import PyKeePass
+    from pykeypass import create_app_database, launch_entry, save_app_database
+    from pykeypass.index import EntryIndex
+    from pykeypass.journal import ChangeJournal, entry_row, journal_path
+    from pykeypass.launchers import StubLauncher
+    from pykeypass.reader import AppDatabaseReader
+
+    phases = {}
+    phases["unlock"], transformed_key = timed(
+        lambda: PyKeePass(pykeypass_db, password=PASSWORD, decrypt=False).transformed_key
+    )
+    if command in ("list", "path", "open", "all", "journal"):
+        # read-only commands stream the payload instead of parsing all of it (see 'pykeypass.reader')
+        phases["parse"], reader = timed(lambda: AppDatabaseReader(pykeypass_db).unlock(transformed_key))
+        if command == "list":
+            phases["lookup"], _ = timed(reader.names)
+        elif command == "all":
+            phases["lookup"], databases = timed(reader.databases)
+            launcher = StubLauncher()
+            phases["launch"], _ = timed(lambda: [launch_entry(launcher, e) for _, e in databases])
+        else:
+            phases["lookup"], entry = timed(reader.entry, name)
+            if command == "open":
+                phases["launch"], _ = timed(launch_entry, StubLauncher(), entry)
+            elif command == "journal":
+                journal = ChangeJournal(journal_path(pykeypass_db), transformed_key)
+                journal.changes()
+                row = {**entry_row(name, entry), "password": "new-password"}
+                phases["save"], _ = timed(journal.append, {name: row})
+        return phases
+    phases["parse"], kp = timed(PyKeePass, pykeypass_db, transformed_key=transformed_key)
+    if command == "manage":
+        def lookup():
+            EntryIndex(kp).entry(name)
+            return kp.find_groups(name=name, group=kp.root_group, recursive=False)
+
+        phases["lookup"], _ = timed(lookup)
+        phases["save"], _ = timed(save_app_database, kp, transformed_key=kp.transformed_key)
+    elif command == "setup":
+        # setup creates the database ('save') and unlocks it once to verify it
+        phases["save"], _ = timed(create_app_database, pykeypass_db, PASSWORD)
+        unlock_and_parse, kp = timed(PyKeePass, pykeypass_db, password=PASSWORD)
+        phases["parse"], _ = timed(PyKeePass, pykeypass_db, transformed_key=kp.transformed_key)
+        phases["unlock"] = max(unlock_and_parse - phases["parse"], 0.0)
+    return phases
+
+
+COMMANDS = {
+    # command: (CLI arguments, stdin) - '{name}' is replaced with an existing entry name
+    "list": (["list"], f"{PASSWORD}\n"),
+    "path": (["path", "{name}"], f"{PASSWORD}\n"),
+    "open": (["open", "{name}"], f"{PASSWORD}\n"),
+    "all": (["all"], f"{PASSWORD}\n"),
+    "manage": (["manage", "{name}"], f"{PASSWORD}\ny\n\\\\fileserver\\keepass\\{{name}}.kdbx\nnew-password\nn\n"),
+    "journal": (["manage", "{name}"], f"{PASSWORD}\ny\n\\\\fileserver\\keepass\\{{name}}.kdbx\nnew-password\nn\n"),
+    "setup": (["setup"], f"y\n{PASSWORD}\n"),
+}
+ENVIRONMENTS = {"journal": {"PYKEYPASS_JOURNAL": "1"}}  # command: environment variables of its run
+
+
+def run_size(size, repeat, commands, work_dir):
+    """Benchmark all 'commands' against an app database with 'size' entries."""
+    from pykeypass.journal import journal_path
+
+    template_folder = work_dir / f"template_{size}"
+    template_folder.mkdir()
+    template_db = template_folder / "pykeepass.kdbx"
+    generation, _ = timed(generate_app_database, template_db, size)
+    name = database_name(size // 2)
+    results = {"generate": {"total": generation}}
+    for command in commands:
+        if command == "all" and size > 1000:
+            continue  # launching 10,000 stub processes measures the thread pool, not pykeypass
+        args, input_text = COMMANDS[command]
+        args = [arg.format(name=name) for arg in args]
+        input_text = input_text.format(name=name)
+        samples = {}
+        for _ in range(repeat):
+            pykeypass_folder = work_dir / f"run_{size}_{command}"
+            shutil.copytree(template_folder, pykeypass_folder)
+            (pykeypass_folder / "keepass.exe").touch()
+            pykeypass_db = pykeypass_folder / "pykeepass.kdbx"
+            with pykeypass_environment(pykeypass_folder):
+                samples.setdefault("total", []).append(invoke(args, input_text, ENVIRONMENTS.get(command)))
+            shutil.copyfile(template_db, pykeypass_db)
+            journal_path(pykeypass_db).unlink(missing_ok=True)
+            for phase, seconds in measure_phases(pykeypass_db, command, name).items():
+                samples.setdefault(phase, []).append(seconds)
+            shutil.rmtree(pykeypass_folder)
+        results[command] = {phase: statistics.median(values) for phase, values in samples.items()}
+        print(f"{size:>6} {command:<7} " + " ".join(f"{k}={v * 1000:.1f}ms" for k, v in results[command].items()))
+    return results
+
+
+def metadata():
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = {}
+    for package in ("pykeepass", "lxml", "construct", "argon2-cffi", "pycryptodomex", "click"):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(  # noqa: S603, S607
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": versions,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per command; the median is reported.")
+    parser.add_argument("--output", default="bench.json", help="JSON results file.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    commands = [command for command in args.commands.split(",") if command]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(sorted(unknown))}")
+
+    report = {"meta": metadata(), "results": {}}
+    with tempfile.TemporaryDirectory(prefix="pykeypass-bench-") as work_dir:
+        for size in sizes:
+            report["results"][str(size)] = run_size(size, args.repeat, commands, Path(work_dir))
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
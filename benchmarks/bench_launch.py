@@ -0,0 +1,208 @@
+"""Benchmark the launch scheduler: time until every Keepass database is ready
+
+Starting Keepass is mostly CPU (key derivation) and file server reads, shared by every process
+started at the same time. This benchmark replaces Keepass with a simulated machine: every launch
+needs 'work' seconds of CPU, the running launches share 'cores' cores, and every launch beyond the
+number of cores costs 'contention' of the throughput (cache thrashing, file server queueing). The
+scheduler ('pykeypass.scheduler.LaunchScheduler') starts the simulated launches exactly like
+'pykeypass all' starts real ones and sees them ready when the simulated work is done.
+
+Reported per configuration: time from the first launch until the last database is ready
+('all ready'), and until the first one is ready ('first ready').
+
+Usage:
+    python benchmarks/bench_launch.py
+    python benchmarks/bench_launch.py --databases 24 --cores 8 --work 0.2 --output launch.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+class SimulatedMachine:
+    """Processor sharing between simulated Keepass launches, advanced lazily on every query
+
+    Args:
+        cores (int): Launches that run at full speed at the same time.
+        work (float): CPU seconds one launch needs to be ready.
+        contention (float): Throughput lost per launch running beyond 'cores'.
+    """
+
+    def __init__(self, cores, work, contention):
+        self.cores = cores
+        self.work = work
+        self.contention = contention
+        self.lock = threading.Lock()
+        self.running = {}  # SimulatedProcess: remaining work
+        self.clock = time.perf_counter()
+
+    def rate(self, running):
+        """Work done per second by each of 'running' launches."""
+        efficiency = 1 / (1 + self.contention * max(running - self.cores, 0))
+        return self.cores / max(running, self.cores) * efficiency
+
+    def _advance(self, now):
+        while self.running and self.clock < now:
+            rate = self.rate(len(self.running))
+            remaining = min(self.running.values())
+            finish = self.clock + remaining / rate
+            step = min(finish, now) - self.clock
+            for running in self.running:
+                self.running[running] -= step * rate
+            self.clock += step
+            if finish <= now:
+                for done in [running for running, left in self.running.items() if left <= 1e-9]:
+                    del self.running[done]
+                    done.ready = self.clock
+        self.clock = max(self.clock, now)
+
+    def start(self, name):
+        with self.lock:
+            now = time.perf_counter()
+            self._advance(now)
+            process = SimulatedProcess(name, now)
+            self.running[process] = self.work
+            return process
+
+    def poll(self):
+        with self.lock:
+            self._advance(time.perf_counter())
+
+    def wait_all(self):
+        """Block until every launch is ready."""
+        while True:
+            with self.lock:
+                self._advance(time.perf_counter())
+                if not self.running:
+                    return
+                remaining = min(self.running.values()) / self.rate(len(self.running))
+            time.sleep(min(remaining, 0.01) + 0.0005)
+
+
+class SimulatedProcess:
+    """Stands in for a Keepass process; 'ready' is set by the machine once its work is done."""
+
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.ready = None
+        self.pid = None
+
+    def poll(self):
+        return None
+
+
+def run_configuration(machine_options, databases, concurrency, gate, delay=None, history=None):
+    """Launch every database with one scheduler configuration
+
+    Returns:
+        dict: 'all_ready' and 'first_ready' in seconds, and the scheduler settings used.
+    """
+    from pykeypass.client import OpenResult
+    from pykeypass.scheduler import LaunchScheduler
+
+    machine = SimulatedMachine(**machine_options)
+    processes = []
+
+    def start(name, entry):
+        process = machine.start(name)
+        processes.append(process)
+        return OpenResult(name, process=process)
+
+    def is_ready(launch, elapsed):
+        machine.poll()
+        ready = launch.process.ready
+        return None if ready is None else ready - launch.process.started
+
+    names = [name for name, entry in databases]
+    scheduler = LaunchScheduler(
+        start,
+        max_concurrent=concurrency or history.concurrency(explore=False),
+        gate=gate,
+        delay=history.delay(names) if delay is None and history is not None else delay,
+        expected=history.expected_times(names) if history is not None else None,
+        is_ready=is_ready,
+    )
+    run_start = time.perf_counter()
+    scheduler.run(databases, wait_last=True)
+    machine.wait_all()
+    if history is not None:
+        history.record(scheduler)
+    ready = [process.ready - run_start for process in processes]
+    return {
+        "concurrency": scheduler.max_concurrent,
+        "gate": gate,
+        "delay": scheduler.delay if gate == "delay" else None,
+        "all_ready": max(ready),
+        "first_ready": min(ready),
+    }
+
+
+def configurations(databases, cores):
+    """(label, concurrency, gate, delay) of the fixed configurations."""
+    yield "all at once", len(databases), "none", None
+    yield "one by one", 1, "ready", None
+    for concurrency in sorted({2, cores, 2 * cores}):
+        yield f"waves of {concurrency}, ready gate", concurrency, "ready", None
+    yield f"waves of {cores}, delay gate", cores, "delay", None
+
+
+class FakeEntry:
+    """Entry without custom properties (priority 0)."""
+
+    def get_custom_property(self, key):
+        return None
+
+
+def main(argv=None):
+    from pykeypass.scheduler import LaunchHistory
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--databases", type=int, default=16, help="Number of databases launched.")
+    parser.add_argument("--cores", type=int, default=4, help="Simulated CPU cores.")
+    parser.add_argument("--work", type=float, default=0.25, help="CPU seconds per simulated launch.")
+    parser.add_argument("--contention", type=float, default=0.15, help="Throughput lost per extra launch.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration; the median is reported.")
+    parser.add_argument("--output", help="Optional JSON results file.")
+    args = parser.parse_args(argv)
+
+    machine_options = {"cores": args.cores, "work": args.work, "contention": args.contention}
+    databases = [(f"database_{index:03d}", FakeEntry()) for index in range(args.databases)]
+    report = {"machine": machine_options, "databases": args.databases, "results": {}}
+
+    def measure(label, concurrency, gate, delay=None, history=None):
+        runs = [
+            run_configuration(machine_options, databases, concurrency, gate, delay, history)
+            for _ in range(args.repeat)
+        ]
+        result = dict(runs[-1])
+        for key in ("all_ready", "first_ready"):
+            result[key] = statistics.median(run[key] for run in runs)
+        report["results"][label] = result
+        print(
+            f"{label:<32} concurrency={result['concurrency']:<3} all ready={result['all_ready']:.2f}s "
+            f"first ready={result['first_ready']:.2f}s"
+        )
+
+    for label, concurrency, gate, delay in configurations(databases, args.cores):
+        measure(label, concurrency, gate, delay)
+    with tempfile.TemporaryDirectory(prefix="pykeypass-launch-") as work_dir:
+        history = LaunchHistory(Path(work_dir))
+        for concurrency in (1, 2, args.cores, 2 * args.cores):
+            run_configuration(machine_options, databases, concurrency, "ready", history=history)
+        measure("learned defaults, ready gate", None, "ready", history=history)
+        measure("learned defaults, delay gate", None, "delay", history=history)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
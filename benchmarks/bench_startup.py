@@ -0,0 +1,128 @@
+"""Benchmark the startup of 'pykeypass --help' and of shell completion
+
+'pykeypass --help' (and shell completion) never touch a database, so they should only pay for
+importing pykeypass and click; pykeepass, lxml, construct and pycryptodome are imported lazily (see
+test/test_startup.py, which checks that they are not imported). This benchmark times the import
+with 'python -X importtime' in a fresh interpreter and compares the best run with a budget.
+
+It also times completing 'pykeypass open database_0<TAB>' from a name cache of COMPLETION_NAMES
+names (see 'pykeypass.completion'), once pykeypass is imported, against a second budget.
+
+Timings depend on the machine (and a lot on the operating system: process start and file system
+are slower on Windows). test/test_startup.py checks the import budget with 'help_import_time_us'
+too, and test/test_local.py and test/test_github.py the completion budget; both are skipped on
+Windows unless 'PYKEYPASS_TIMING_TESTS=1'.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --budget-ms 150 --completion-budget-ms 50 --output startup.json
+
+Exits with status 1 when the best run of either measurement is over its budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+# Measured at ~60ms on Linux (most of it click) once pykeepass and friends are imported lazily;
+# importing pykeepass alone costs more than this budget.
+DEFAULT_BUDGET_MS = 150
+# Reading the name cache and filtering it; a few ms on Linux.
+DEFAULT_COMPLETION_BUDGET_MS = 50
+COMPLETION_NAMES = 5000
+
+HELP_SCRIPT = """
+from pykeypass import cli
+try:
+    cli(["--help"])
+except SystemExit:
+    pass
+"""
+
+
+def import_time_us(importtime_output):
+    """Cumulative import time of the top level 'pykeypass' package from 'python -X importtime' output."""
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if name.rstrip() == " pykeypass":
+            return int(cumulative_us)
+    raise RuntimeError("pykeypass import not found in -X importtime output")
+
+
+def help_import_time_us():
+    """Import time of pykeypass in a fresh 'pykeypass --help' interpreter, in microseconds."""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", HELP_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,  # not the repository root, whose legacy 'pykeypass.py' would be imported
+    )
+    return import_time_us(result.stderr)
+
+
+def completion_ms(names=COMPLETION_NAMES):
+    """Time to complete 'pykeypass open database_0' from a name cache of 'names' names, in milliseconds."""
+    from click.shell_completion import ShellComplete
+
+    from pykeypass import cli, client
+    from pykeypass.completion import NAME_CACHE_ENV, store_names
+
+    with tempfile.TemporaryDirectory() as folder:
+        pykeypass_folder = Path(folder)
+        with mock.patch.dict(os.environ, {NAME_CACHE_ENV: "1"}), mock.patch.object(
+            client, "app_folder", lambda test=False: pykeypass_folder
+        ):
+            store_names(pykeypass_folder, [f"database_{number:05}" for number in range(names)])
+            completer = ShellComplete(cli, {}, "pykeypass", "_PYKEYPASS_COMPLETE")
+            start = time.perf_counter()
+            completions = completer.get_completions(["open"], "database_0")
+            seconds = time.perf_counter() - start
+    if len(completions) != names:
+        raise RuntimeError(f"{len(completions)} completions instead of {names}")
+    return seconds * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs; the best one is compared with the budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Import time budget.")
+    parser.add_argument(
+        "--completion-budget-ms",
+        type=float,
+        default=DEFAULT_COMPLETION_BUDGET_MS,
+        help=f"Budget to complete {COMPLETION_NAMES} names.",
+    )
+    parser.add_argument("--output", help="Optional JSON results file.")
+    args = parser.parse_args(argv)
+
+    timings = [help_import_time_us() / 1000 for _ in range(args.repeat)]
+    best = min(timings)
+    print(f"import pykeypass (--help): best={best:.1f}ms worst={max(timings):.1f}ms budget={args.budget_ms:g}ms")
+    completion_timings = [completion_ms() for _ in range(args.repeat)]
+    best_completion = min(completion_timings)
+    print(
+        f"complete {COMPLETION_NAMES} names: best={best_completion:.1f}ms worst={max(completion_timings):.1f}ms "
+        f"budget={args.completion_budget_ms:g}ms"
+    )
+    if args.output:
+        report = {
+            "help_import_ms": timings,
+            "budget_ms": args.budget_ms,
+            "completion_ms": completion_timings,
+            "completion_budget_ms": args.completion_budget_ms,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    return 0 if best < args.budget_ms and best_completion < args.completion_budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
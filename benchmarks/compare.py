@@ -0,0 +1,67 @@
+"""Compare two 'bench_cli.py' result files
+
+Prints every command/phase timing of the baseline next to the candidate with the relative change,
+and exits with status 1 when any timing regressed by more than the threshold.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json
+    python benchmarks/compare.py baseline.json candidate.json --threshold 5 --min-ms 1
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path):
+    return json.loads(Path(path).read_text())
+
+
+def describe(meta):
+    packages = ", ".join(f"{name} {version}" for name, version in meta.get("packages", {}).items() if version)
+    return f"{meta.get('commit') or 'unknown commit'} (python {meta.get('python')}; {packages})"
+
+
+def compare(baseline, candidate, threshold, min_ms):
+    """Yield (size, command, phase, baseline_ms, candidate_ms, change_percent, regressed) rows."""
+    for size, commands in candidate["results"].items():
+        for command, phases in commands.items():
+            for phase, seconds in phases.items():
+                try:
+                    base_seconds = baseline["results"][size][command][phase]
+                except KeyError:
+                    continue
+                base_ms, new_ms = base_seconds * 1000, seconds * 1000
+                change = (new_ms - base_ms) / base_ms * 100 if base_ms else 0.0
+                # ignore tiny absolute differences, they are timer noise
+                regressed = change > threshold and new_ms - base_ms > min_ms
+                yield size, command, phase, base_ms, new_ms, change, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed slowdown in percent.")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="Ignore slowdowns smaller than this.")
+    args = parser.parse_args(argv)
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"baseline:  {describe(baseline['meta'])}")
+    print(f"candidate: {describe(candidate['meta'])}")
+    print(f"{'size':>6} {'command':<8} {'phase':<7} {'baseline':>11} {'candidate':>11} {'change':>8}")
+    regressions = 0
+    for size, command, phase, base_ms, new_ms, change, regressed in compare(
+        baseline, candidate, args.threshold, args.min_ms
+    ):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{size:>6} {command:<8} {phase:<7} {base_ms:>9.1f}ms {new_ms:>9.1f}ms {change:>+7.1f}%{flag}")
+    if regressions:
+        print(f"{regressions} timing(s) regressed by more than {args.threshold}%.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,92 +1,475 @@
+# pykeepass (with construct, lxml and pycryptodome), subprocess, shutil and concurrent.futures are
+# imported inside the functions that use them. 'pykeypass --help' and shell completion never touch a
+# database, so they should not pay for those imports (see test/test_startup.py).
 import getpass
-import subprocess
+from os import getenv
 from os import path as ospath
-from pathlib import Path
-from shutil import copyfile
 
-import pykeepass
+from click import Choice as cchoice
 from click import argument as cargument
 from click import echo as cecho
+from click import get_current_context as cget_current_context
 from click import group as cgroup
 from click import option as coption
-from construct import ChecksumError
-from pykeepass import PyKeePass, create_database
-from pykeepass import exceptions as pykeepass_exceptions
+from click import pass_context as cpass_context
+
+from .agent import DEFAULT_TTL, Agent, AgentEntry, AgentUnavailable, request
+from .client import (  # noqa: F401 (re-exported: database_entries, launch_entry)
+    AlreadyOpen,
+    PyKeypassClient,
+    create_app_database,
+    database_entries,
+    launch_entry,
+    path_selection,
+    replay_journal,
+    save_app_database,
+    unlock_app_database,
+)
+from .completion import clear_names, complete_database
+from .index import EntryIndex, split_tags
+from .journal import clear_journal
+from .keycache import clear_key, store_key
+from .launchers import LAUNCHER_ENV, LAUNCHERS, launcher_for
+from .manifest import ManifestError, load_manifest, validate_rows
+from .profiling import TRACE_ENV, span, tracer
+from .scheduler import GATE_DELAY, GATE_READY, GATES, READY_TIMEOUT, LaunchHistory, LaunchScheduler
+from .shell import DEFAULT_IDLE_TIMEOUT
+from .supervisor import DEFAULT_WINDOW, supervise_launches
+
+
+def select_launcher(pykeypass_app):
+    """Launcher backend picked with 'pykeypass --launcher' (or 'PYKEYPASS_LAUNCHER')
+
+    Args:
+        pykeypass_app (Path): KeePass 2.x executable installed by 'pykeypass setup'.
+
+    Returns:
+        Launcher: The backend (see 'pykeypass.launchers').
+    """
+    ctx = cget_current_context(silent=True)
+    name = ctx.find_root().params.get("launcher") if ctx is not None else None
+    return launcher_for(name or getenv(LAUNCHER_ENV, "auto"), pykeypass_app)
+
+
+def session_client(quiet=False, **kwargs):
+    """Session of the running 'pykeypass shell', or a new PyKeypassClient(**kwargs) outside of it
+
+    A new session prints its pykeypass folder like the other commands do (see 'path_selection'),
+    unless 'quiet'.
+    """
+    ctx = cget_current_context(silent=True)
+    client = ctx.find_object(PyKeypassClient) if ctx is not None else None
+    if client is not None:
+        return client
+    if not quiet:
+        kwargs["pykeypass_folder"] = path_selection(kwargs.get("test", False))[0]
+    return PyKeypassClient(**kwargs)
+
+
+def wait_unsupported(launcher):
+    """True (after reporting it) if '--wait' has no process of 'launcher' to follow (e.g. 'stub')."""
+    if launcher.spawns:
+        return False
+    cecho(f"ERROR: --wait follows Keepass processes, the {launcher.name} launcher starts none.")
+    return True
+
+
+def wait_for_launches(launcher, databases, window, registry=None):
+    """Launch Keepass for each (name, entry) and supervise the processes until they exit
+
+    Readiness, startup failures and exit statuses are reported as they happen (see
+    'pykeypass.supervisor'). Ready processes are kept in 'registry' (a ProcessRegistry) until they
+    exit.
+
+    Returns:
+        int: Number of databases that started successfully.
+    """
+    def on_ready(result):
+        tracer.record("launch", result.ready_seconds, database=result.name)
+        if registry is not None:
+            registry.add(result.name, result.pid)
+        cecho(f"STATUS: {result.name} keepass database ready after {result.ready_seconds:.2f}s (pid {result.pid}).")
+
+    def on_exit(result):
+        if registry is not None and result.pid is not None:
+            registry.remove(result.name, result.pid)
+        if result.error is not None:
+            cecho(f"ERROR: {result.name} keypass database failed to launch: {result.error}")
+        elif result.early_exit and result.returncode == 0:
+            cecho(
+                f"NOTICE: {result.name} keepass database exited with status 0 during startup "
+                "(handed over to a running Keepass?)."
+            )
+        elif result.early_exit:
+            cecho(
+                f"ERROR: {result.name} keepass database exited with status {result.returncode} "
+                f"after {result.seconds:.2f}s."
+            )
+        else:
+            cecho(
+                f"STATUS: {result.name} keepass database closed with status {result.returncode} "
+                f"after {result.seconds:.1f}s."
+            )
+        if result.output and (result.error is not None or result.returncode != 0):
+            for line in result.output.splitlines():
+                cecho(f"OUTPUT: {line}")
+
+    launches = [(name, launcher.arguments([entry]), launcher.stdin([entry])) for name, entry in databases]
+    results = supervise_launches(launches, window, on_ready=on_ready, on_exit=on_exit)
+    return sum(result.ready_seconds is not None or result.returncode == 0 for result in results)
+
+
+def open_batch(launcher, databases, registry, window):
+    """Open databases in a single Keepass process and report each of them (see 'pykeypass.batch')
+
+    Returns:
+        int: Number of databases opened.
+    """
+    from .batch import FAILED, HANDED_OVER, SEPARATE, launch_batch
+
+    results = launch_batch(launcher, databases, registry, window)
+    for result in results:
+        if result.outcome == FAILED:
+            cecho(f"ERROR: {result.name} keypass database failed to launch: {result.error}")
+        elif result.outcome == HANDED_OVER:
+            running = f" (pid {result.pid})" if result.pid is not None else ""
+            cecho(f"STATUS: {result.name} keypass database handed over to the running Keepass{running}.")
+        elif result.outcome == SEPARATE:
+            cecho(f"STATUS: {result.name} keypass database launched in its own Keepass (pid {result.pid}).")
+        else:
+            cecho(f"STATUS: {result.name} keypass database launched successfully.")
+    return sum(result.outcome != FAILED for result in results)
+
+
+def prefetch_databases(pykeypass_folder, databases):
+    """Copy databases and key files to the local cache and point their entries at the copies
+
+    Every file is copied concurrently (see 'pykeypass.cache'). A database that could not be cached
+    (e.g. its share is unreachable) keeps its original location, so Keepass reports the problem.
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the cache.
+        databases (list): (name, entry) tuples.
+
+    Returns:
+        list: (name, entry) tuples, with read-only copies of the entries for the cached databases.
+    """
+    from .cache import FAILED, DatabaseCache
+
+    cache = DatabaseCache(pykeypass_folder)
+    sources = []
+    for name, entry in databases:
+        sources.append(entry.url)
+        if entry.get_custom_property("key"):
+            sources.append(entry.get_custom_property("key"))
+    with span("prefetch"):
+        results = cache.prefetch(sources)
+    cached = []
+    for name, entry in databases:
+        key_file = entry.get_custom_property("key")
+        fetched = [results[entry.url]] + ([results[key_file]] if key_file else [])
+        failed = [result for result in fetched if result.status == FAILED]
+        if failed:
+            cecho(f"WARNING: {name} keepass database not cached ({failed[0].error}); opening it from its location.")
+            cached.append((name, entry))
+            continue
+        size = sum(result.size for result in fetched) / 1024 / 1024
+        seconds = max(result.seconds for result in fetched)
+        cecho(f"STATUS: {name} keepass database {fetched[0].status} in cache ({size:.1f} MB, {seconds:.2f}s).")
+        custom_properties = {"key": str(fetched[1].local)} if key_file else {}
+        cached.append((name, AgentEntry(entry.title, str(fetched[0].local), entry.password, custom_properties)))
+    return cached
 
 
-def path_selection(test=False):
-    """Setup path variables for pykeypass
+def launch_databases(
+    client,
+    databases,
+    workers=None,
+    wait=False,
+    window=DEFAULT_WINDOW,
+    batch=False,
+    force=False,
+    cache=False,
+    gate=GATE_READY,
+    delay=None,
+):
+    """Open several databases of one session ('pykeypass all', 'pykeypass open --profile')
 
-    Normal Operation: pykeypass creates a '.pykeypass' folder in the user's home directory to
-    house the Keepass.exe and the app's Keepass database.
-    Testing Operation: Similar to nomral option, but the '.pykeypass' folder is created in the
-    'test' directory at the root of the application folder.
+    Databases already open in a Keepass started by pykeypass are skipped unless 'force'. The others
+    are started in waves by the launch scheduler (see 'pykeypass.scheduler'), or followed from a
+    single event loop with 'wait' (see 'wait_for_launches'), or share a single Keepass process with
+    'batch' (see 'open_batch').
 
     Args:
-        test (bool, optional): The test directory is set if 'test' is passed in as True. Defaults
-        to False.
+        client (PyKeypassClient): Unlocked session.
+        databases (list): (name, entry) tuples to open.
+        workers (int, optional): Databases per wave. Defaults to the best measured wave size.
+        gate (str, optional): Gate between waves (GATE_READY, GATE_DELAY or GATE_NONE).
+        delay (float, optional): Seconds between waves with GATE_DELAY. Defaults to the median
+        measured launch time of the databases.
+    """
+    pending = []
+    for name, entry in databases:
+        record = None if force else client.registry.running(name)
+        if record is None:
+            pending.append((name, entry))
+        else:
+            report_already_open(name, record)
+    launcher = client.launcher = select_launcher(client.pykeypass_app)
+    if wait and wait_unsupported(launcher):
+        return
+    already_open = len(databases) - len(pending)
+    if cache:
+        pending = prefetch_databases(client.pykeypass_folder, pending)
+    if wait:
+        launched = wait_for_launches(launcher, pending, window, client.registry)
+    elif batch:
+        launched = open_batch(launcher, pending, client.registry, window)
+    else:
+        launched = schedule_launches(client, pending, workers, gate, delay)
+    cecho(
+        f"DONE: {launched} of {len(databases)} keepass databases launched"
+        + (f", {already_open} already open." if already_open else ".")
+    )
+
+
+def schedule_launches(client, databases, workers=None, gate=GATE_READY, delay=None):
+    """Start databases in prioritized waves and learn from the launch times (see 'pykeypass.scheduler')
 
     Returns:
-        [multiple variables]: Returns all three path variables. Populates three comma separated
-        variables from the function.
+        int: Number of databases launched.
     """
-    pykeypass_folder = (
-        Path.home() / ".pykeypass" if test is False else Path(__file__).resolve().parent.parent.parent / "test" / ".pykeypass"
+
+    def on_start(launch):
+        if launch.ok:
+            cecho(f"STATUS: {launch.name} keypass database launched successfully.")
+        else:
+            cecho(f"ERROR: {launch.name} keypass database failed to launch: {launch.error}")
+
+    def on_ready(launch):
+        if launch.process is not None:
+            tracer.record("launch", launch.ready_seconds, database=launch.name)
+            cecho(f"STATUS: {launch.name} keepass database ready after {launch.ready_seconds:.2f}s.")
+
+    history = LaunchHistory(client.pykeypass_folder)
+    names = [name for name, entry in databases]
+    scheduler = LaunchScheduler(
+        lambda name, entry: client.launch_result(name, entry, force=True),
+        max_concurrent=workers or history.concurrency(),
+        gate=gate,
+        delay=history.delay(names) if delay is None else delay,
+        expected=history.expected_times(names),
+        on_start=on_start,
+        on_ready=on_ready,
+    )
+    waves = -(-len(databases) // scheduler.max_concurrent)
+    if waves > 1:
+        gate_description = f"{scheduler.delay:.2f}s apart" if gate == GATE_DELAY else f"{gate} gate"
+        cecho(
+            f"STATUS: Launching {len(databases)} keepass databases in {waves} waves of up to "
+            f"{scheduler.max_concurrent} ({gate_description})."
+        )
+    launches = scheduler.run(databases)
+    history.record(scheduler)
+    try:
+        history.save()
+    except OSError:
+        pass  # only the defaults of the next run are lost
+    return sum(launch.ok for launch in launches)
+
+
+def report_already_open(database, record):
+    """Tell the user that 'database' is already open in the Keepass process of 'record'."""
+    import time
+
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["started"]))
+    cecho(
+        f"NOTICE: {database} keepass database is already open (pid {record['pid']}, started {started}). "
+        "Use --force to open it again."
     )
-    print(pykeypass_folder)
-    pykeypass_app = pykeypass_folder / "keepass.exe"
-    pykeypass_db = pykeypass_folder / "pykeepass.kdbx"
-    return pykeypass_folder, pykeypass_app, pykeypass_db
 
 
 @cgroup()
-def cli():
+@coption("--profile", "profile", is_flag=True, help="Print the time spent in each phase of the command on stderr.")
+@coption(
+    "--launcher",
+    "launcher",
+    type=cchoice(["auto", *LAUNCHERS]),
+    default="auto",
+    show_default=True,
+    envvar=LAUNCHER_ENV,
+    help="Keepass client used to open databases.",
+)
+@cpass_context
+def cli(ctx, profile, launcher):
     """KEEPASS CLI TOOL
 
     This tool can be configured to launch any number of Keepass databases with a single command
     (and password).
     """
+    trace_path = getenv(TRACE_ENV)
+    if not profile and not trace_path:
+        tracer.stop()
+        return
+    tracer.start()
+
+    def report():
+        tracer.stop()
+        if profile:
+            for line in tracer.summary():
+                cecho(line, err=True)
+        if trace_path:
+            try:
+                tracer.write_chrome_trace(trace_path)
+            except OSError as e:
+                cecho(f"ERROR: pykeypass trace could not be written to {trace_path}: {e}", err=True)
+
+    ctx.call_on_close(report)
+    # resources are released before the callbacks registered earlier, so the span ends before 'report'
+    ctx.with_resource(span(ctx.invoked_subcommand or "pykeypass"))
 
 
 @cli.command("setup", help="Initial setup of pykeypass app database.")
+@coption(
+    "--target-unlock-ms",
+    "target_unlock_ms",
+    type=int,
+    help="Calibrate the app database key derivation (Argon2) to take this long to unlock on this machine.",
+)
 @coption("-t", "--test", "test", is_flag=True, hidden=True)
-def pykeypass_setup(test):
+def pykeypass_setup(test, target_unlock_ms=None):
     """Intial setup
 
-    - Copies Keepass.exe to .pykeypass folder in home directory
-    - Creates pykeypass.kdbx in .pykeypass folder in hom directory
+    - Installs the bundled Keepass.exe to .pykeypass folder in home directory, unless the same
+      executable is already installed (see 'pykeypass.install')
+    - Creates pykeypass.kdbx in .pykeypass folder in hom directory, with Argon2 parameters
+      calibrated for '--target-unlock-ms' when given (see 'pykeypass.kdf')
     """
+    import time
+
+    from pykeepass import PyKeePass
+
+    from .install import UP_TO_DATE, install_keepass
+    from .kdf import KDF_SETTINGS, calibrate, save_kdf_settings
+
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
     try:
-        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
-        if ospath.exists(pykeypass_app) is False:
-            Path(pykeypass_folder).mkdir(parents=True, exist_ok=True)
-            copyfile(Path.cwd() / "thirdparty" / "keepass_portable" / "keepass.exe", pykeypass_app)
-        if ospath.exists(pykeypass_db):
-            confirmation = input(
-                "WARNING: If an app database already exists, this process will delete it and "
-                "create a fresh one.\nProceed? (y/n) "
-            )
-        else:
-            confirmation = "y"
-        if confirmation == "y":
-            cecho("STEP 1: Create pykeypass app database.")
-            new_password = getpass.getpass(prompt="Create a pykeypass password: ")
-            create_database(pykeypass_db, password=new_password)
-            PyKeePass(pykeypass_db, password=new_password)
-            cecho(
-                "DONE: pykeypass app database created.\n"
-                "Setup keepass databases by using:\n"
-                "- 'pykeypass open <new_name> -s'\n"
-            )
-        else:
-            cecho("pykeypass setup cancelled.")
+        with span("install"):
+            outcome, method = install_keepass(pykeypass_folder, pykeypass_app)
     except FileNotFoundError:
+        cecho("ERROR: pykeypass app not setup: the bundled Keepass executable is missing. Reinstall pykeypass.")
+        return
+    except OSError as e:
+        cecho(f"ERROR: Keepass executable could not be installed to {pykeypass_app}: {e}")
+        return
+    if outcome == UP_TO_DATE:
+        cecho("STATUS: Keepass executable is up to date.")
+    else:
+        cecho(f"STATUS: Keepass executable {outcome} ({method}).")
+    if ospath.exists(pykeypass_db):
+        confirmation = input(
+            "WARNING: If an app database already exists, this process will delete it and "
+            "create a fresh one.\nProceed? (y/n) "
+        )
+    else:
+        confirmation = "y"
+    if confirmation != "y":
+        cecho("pykeypass setup cancelled.")
+        return
+    try:
+        cecho("STEP 1: Create pykeypass app database.")
+        new_password = getpass.getpass(prompt="Create a pykeypass password: ")
+        kdf = None
+        if target_unlock_ms is not None:
+            cecho(f"STATUS: Calibrating the key derivation for a {target_unlock_ms} ms unlock.")
+            with span("calibrate"):
+                kdf = calibrate(target_unlock_ms)[0]
+        create_app_database(pykeypass_db, password=new_password, kdf=kdf)
+        clear_journal(pykeypass_db)
+        clear_key(pykeypass_folder)
+        clear_names(pykeypass_folder)
+        start = time.perf_counter()
+        kp = PyKeePass(pykeypass_db, password=new_password)
+        unlock_seconds = time.perf_counter() - start
+        store_key(pykeypass_folder, pykeypass_db, kp.transformed_key)
+        if kdf is None:
+            (pykeypass_folder / KDF_SETTINGS).unlink(missing_ok=True)
+        else:
+            save_kdf_settings(pykeypass_folder, target_unlock_ms, kdf, unlock_seconds)
+            cecho(f"STATUS: Argon2 {kdf}; unlock takes {unlock_seconds * 1000:.0f} ms.")
         cecho(
-            """ERROR: pykeypass app not setup. To setup, perform one of the following:
-(1) Run 'install.bat' from pykeypass app folder.
-(2) Open CMD/terminal in root of pykeypass app directory and run 'pykeypass setup' (all other 
-functionality is global)"""
+            "DONE: pykeypass app database created.\n"
+            "Setup keepass databases by using:\n"
+            "- 'pykeypass open <new_name> -s'\n"
         )
+    except OSError as e:
+        cecho(f"ERROR: pykeypass app database could not be created at {pykeypass_db}: {e}")
+
+
+@cli.command("rekdf", help="Re-tunes the key derivation (Argon2) of the pykeypass app database.")
+@coption(
+    "--target-unlock-ms",
+    "target_unlock_ms",
+    type=int,
+    help="Unlock time to calibrate for.  [default: the target of the last calibration]",
+)
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def pykeypass_rekdf(test, target_unlock_ms=None):
+    """Calibrates Argon2 on this machine and re-encrypts the app database with the new parameters.
+
+    The entries are kept; the database only gets a new salt and new Argon2 parameters. The password
+    is always prompted for (never taken from the key cache or the agent): the new key is derived
+    from it. The change journal is folded in first, since it is encrypted with the old key.
+    """
+    import time
+    from functools import partial
+
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    from .kdf import (
+        apply_kdf,
+        argon2_seconds,
+        calibrate,
+        kdf_parameters,
+        load_kdf_settings,
+        save_kdf_settings,
+        transform_key,
+    )
+
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        target_unlock_ms = target_unlock_ms or load_kdf_settings(pykeypass_folder).get("target_ms")
+        if not target_unlock_ms:
+            cecho("ERROR: No earlier calibration found. Use 'pykeypass rekdf --target-unlock-ms <ms>'.")
+            return
+        password = getpass.getpass(prompt="pykeypass password: ")
+        kp = unlock_app_database(pykeypass_folder, pykeypass_db, password=password)
+        journal = replay_journal(kp, EntryIndex(kp), pykeypass_db)
+        cecho(f"STATUS: Argon2 {kdf_parameters(kp)} before.")
+        cecho(f"STATUS: Calibrating the key derivation for a {target_unlock_ms} ms unlock.")
+        argon2_id = kp.kdf_algorithm == "argon2id"
+        with span("calibrate"):
+            kdf = calibrate(target_unlock_ms, measure=partial(argon2_seconds, argon2_id=argon2_id))[0]
+        apply_kdf(kp, kdf)
+        start = time.perf_counter()
+        with span("unlock"):
+            transformed_key = transform_key(kp, password)
+        unlock_seconds = time.perf_counter() - start
+        save_app_database(kp, transformed_key=transformed_key)
+        journal.remove()
+        clear_key(pykeypass_folder)
+        store_key(pykeypass_folder, pykeypass_db, transformed_key)
+        save_kdf_settings(pykeypass_folder, target_unlock_ms, kdf, unlock_seconds)
+        cecho(f"DONE: Argon2 {kdf}; unlock takes {unlock_seconds * 1000:.0f} ms.")
+    except ValueError as e:
+        cecho(f"ERROR: pykeypass app database cannot be re-tuned: {e}")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+    except ChecksumError:
+        cecho("ERROR: pykeypass login information invalid.\n")
 
 
 @cli.command("list", help="Lists available databases to open.")
@@ -97,26 +480,38 @@ functionality is global)"""
     hidden=True,
     help="Reserved for use with 'pykeepass all'",
 )
+@coption("--tag", "tag", help="Only list the databases with this tag (launch profile).")
 @coption("-t", "--test", "test", is_flag=True, hidden=True)
-def keepass_list(test, input_password=None):
+def keepass_list(test, input_password=None, tag=None):
     """Lists available Keepass databases to launch."""
+    from pykeepass import exceptions as pykeepass_exceptions
+
     try:
-        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
-        kp = PyKeePass(pykeypass_db, password=getpass.getpass(prompt="pykeypass password: "))
-        groups = kp.find_groups(name=".", regex=True)
-        cecho("ENTRIES AVAILABLE: ")
-        for i in groups[1:]:
-            if str(i)[8:-2] != "Recycle Bin":
-                # print("HEREHEREHERE", str(i))
-                print(str(i)[8:-1])
-    except pykeepass.exceptions.CredentialsError:
+        client = session_client(test=test)
+        names = client.list() if tag is None else client.tagged(tag)
+        cecho("ENTRIES AVAILABLE: " if tag is None else f"ENTRIES TAGGED {tag}: ")
+        for name in names:
+            print(name)
+    except pykeepass_exceptions.CredentialsError:
         cecho("ERROR: pykeypass login information invalid.\n")
     except FileNotFoundError:
         cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
 
 
 @cli.command("manage", help="Add or replace the requsested database entry.")
-@cargument("database", required=True)
+@cargument("database", required=False, shell_complete=complete_database)
+@coption(
+    "-f",
+    "--from-file",
+    "from_file",
+    help="CSV, JSON or YAML manifest of databases to add in bulk (name, url, password, key).",
+)
+@coption(
+    "--replace",
+    "replace",
+    is_flag=True,
+    help="With --from-file: replace existing entries instead of skipping them.",
+)
 @coption(
     "-i",
     "--input_password",
@@ -124,54 +519,129 @@ def keepass_list(test, input_password=None):
     hidden=True,
     help="Reserved for use with 'pykeepass all'",
 )
+@coption("--tags", "tags", help="Comma separated tags (launch profiles) of the new entry.")
+@coption("--priority", "priority", type=int, help="Launch priority of the new entry, higher starts first.")
 @coption("-t", "--test", "test", is_flag=True, hidden=True)
-def keepass_manage(database, test, input_password=None):
-    """Launches wizard for specified database entry."""
+def keepass_manage(
+    database, test, from_file=None, replace=False, input_password=None, tags=None, priority=None
+):
+    """Launches wizard for specified database entry.
+
+    The whole change is one transaction: the app database is unlocked once, the removal of the old
+    entry, the new entry and its key file are staged in memory, and the result is written once
+    (atomically, see 'save_app_database'). Declining the replacement leaves the database untouched.
+
+    With '--from-file', every row of the manifest is validated first and all of them are applied in
+    the same single unlock and single save.
+    """
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    if (database is None) == (from_file is None):
+        cecho("ERROR: Use either 'pykeypass manage <name>' or 'pykeypass manage --from-file <manifest>'.")
+        return
     try:
-        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        client = session_client(password=input_password, use_agent=False, key_cache=False, test=test)
+        if from_file is not None:
+            manage_from_file(client, from_file, replace)
+            return
         cecho(f"START: Setup {database} keepass.")
-        password = getpass.getpass(prompt="pykeypass password: ")
-        kp = PyKeePass(pykeypass_db, password=password)
-        group = kp.find_groups(kp.root_group, f"{database}")
-        entry = kp.find_entries(title=f"{database}", first=True)
-        if entry is None:
-            confirmation = "y"
-        else:
-            confirmation = input(
-                f"WARNING: An entry for {database} already exists, this process will delete it "
-                "and create a fresh one.\nProceed? (y/n) "
-            )
-            kp.delete_entry(entry)
-            try:
-                kp.delete_group(group)
-            except AttributeError as e:
-                if "'NoneType' object has no attribute 'delete'" not in str(e):
-                    raise AttributeError(e) from e
-            kp.save()
-        if confirmation == "y":
-            kp = PyKeePass(pykeypass_db, password=password)
+        with client:
+            if database not in client:
+                confirmation = "y"
+            else:
+                confirmation = input(
+                    f"WARNING: An entry for {database} already exists, this process will delete it "
+                    "and create a fresh one.\nProceed? (y/n) "
+                )
+            if confirmation != "y":
+                cecho(f"{database} keepass setup cancelled.")
+                return
             keepass_url = input(f"Set {database} Keepass url: ")
             keepass_pw = getpass.getpass(prompt=f"Set {database} Keepass Password: ")
-            group = kp.add_group(kp.root_group, f"{database}")
-            kp.add_entry(group, f"{database}", f"{database}", keepass_pw, url=keepass_url)
-            kp.save()
+            key_file = None
             key_question = input("Does this Keepass database use a key file? (y/n) ")
             if key_question == "y":
-                kp = PyKeePass(pykeypass_db, password=password)
-                entry = kp.find_entries(title=f"{database}", first=True)
-                key_file = input("Set key file (file path + file name): ")
-                entry.set_custom_property("key", str(key_file))
-        kp.save()
+                key_file = str(input("Set key file (file path + file name): "))
+            if tags is None and database in client:
+                tags = ",".join(client.tags(database))  # a replaced entry keeps its profiles
+            if priority is None and database in client:
+                priority = client.priority(database)
+            client.upsert(database, keepass_url, keepass_pw, key=key_file, tags=split_tags(tags), priority=priority)
         cecho(f"DONE: {database} keepass password setup.")
         cecho(f'Try launching with "pykeypass open {database}", or "pykeypass all"')
-    except pykeepass.exceptions.CredentialsError:
+    except pykeepass_exceptions.CredentialsError:
         cecho("ERROR: pykeypass login information invalid.\n")
     except FileNotFoundError:
         cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
 
 
-@cli.command("open", help="Launches requested Keepass database.")
-@cargument("database", required=True)
+def manage_from_file(client, from_file, replace=False):
+    """Apply a bulk provisioning manifest to the app database (see 'pykeypass.manifest')
+
+    Nothing is written unless every row is valid. All rows are applied in memory and saved once.
+
+    Args:
+        client (PyKeypassClient): Session of the app database (not unlocked yet).
+        from_file (str): Manifest path.
+        replace (bool, optional): Replace existing entries instead of skipping them. Defaults to False.
+    """
+    cecho(f"START: Setup keepass entries from {from_file}.")
+    try:
+        databases, errors = validate_rows(load_manifest(from_file))
+    except ManifestError as e:
+        cecho(f"ERROR: {e}")
+        return
+    if errors:
+        cecho(f"ERROR: {len(errors)} invalid manifest row(s), nothing was changed:")
+        for error in errors:
+            cecho(f"- {error}")
+        return
+    report = []
+    with client:
+        for database in databases:
+            if not replace and database["name"] in client:
+                report.append((database["name"], "skipped"))
+            else:
+                report.append((database["name"], client.upsert(**database)))
+    for name, action in report:
+        cecho(f"{action.upper()}: {name}" + (" (already exists, use --replace)" if action == "skipped" else ""))
+    actions = [action for name, action in report]
+    cecho(
+        f"DONE: {actions.count('added')} added, {actions.count('replaced')} replaced, "
+        f"{actions.count('skipped')} skipped."
+    )
+
+
+@cli.command("open", help="Launches requested Keepass database (or every database of a profile).")
+@cargument("database", required=False, shell_complete=complete_database)
+@coption(
+    "--profile",
+    "profile",
+    help="Open every database tagged with this profile (see 'pykeypass tag') instead of DATABASE.",
+)
+@coption(
+    "-w",
+    "--workers",
+    "workers",
+    type=int,
+    help="With --profile: maximum number of Keepass databases launched at the same time (one wave).  "
+    "[default: best measured in .pykeypass/launches.json (every fifth run half or twice it), else 4]",
+)
+@coption(
+    "--gate",
+    "gate",
+    type=cchoice(GATES),
+    default=GATE_READY,
+    show_default=True,
+    help="What holds a wave of launches back until the next one starts: the previous wave being ready, "
+    "a fixed --delay, or nothing.",
+)
+@coption(
+    "--delay",
+    "delay",
+    type=float,
+    help="With --gate delay: seconds between waves.  [default: median measured launch time]",
+)
 @coption(
     "-i",
     "--input_password",
@@ -179,30 +649,98 @@ def keepass_manage(database, test, input_password=None):
     hidden=True,
     help="Reserved for use with 'pykeepass all'",
 )
+@coption(
+    "--wait",
+    "wait",
+    is_flag=True,
+    help="Follow the Keepass process and report startup failures and exit status.",
+)
+@coption(
+    "--window",
+    "window",
+    default=DEFAULT_WINDOW,
+    show_default=True,
+    type=float,
+    help="With --wait: seconds a Keepass process must keep running to count as started.",
+)
+@coption(
+    "--force",
+    "force",
+    is_flag=True,
+    help="Open the database even if pykeypass already opened it in a running Keepass.",
+)
+@coption(
+    "--cache",
+    "cache",
+    is_flag=True,
+    help="Open a local read-only copy of the database (copied to '.pykeypass/cache' if it changed).",
+)
 @coption("-t", "--test", "test", is_flag=True, hidden=True)
-def keepass_open(database, test, input_password=None):
-    """Launches requested Keepass database."""
-    try:
-        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
-        password = (
-            getpass.getpass(prompt="pykeepass password: ") if input_password is None else input_password
-        )
+def keepass_open(
+    database,
+    test,
+    input_password=None,
+    wait=False,
+    window=DEFAULT_WINDOW,
+    force=False,
+    cache=False,
+    profile=None,
+    workers=None,
+    gate=GATE_READY,
+    delay=None,
+):
+    """Launches requested Keepass database.
+
+    With '--profile', every database tagged with the profile is resolved from the same unlock and
+    launched like 'pykeypass all' does, at most '--workers' at the same time.
+    """
+    import subprocess
+
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
 
-        kp = PyKeePass(pykeypass_db, password=password)
-        entry = kp.find_entries(title=f"{database}", first=True)
-        if entry.get_custom_property("key") is not None:
-            key_file = entry.get_custom_property("key")
-            subprocess.Popen(
-                f'{pykeypass_app} "{entry.url}" -pw:{entry.password} -keyfile:"{key_file}"',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+    if (database is None) == (profile is None):
+        cecho("ERROR: Use either 'pykeypass open <name>' or 'pykeypass open --profile <profile>'.")
+        return
+    try:
+        entry = None
+        client = session_client(password=input_password, prompt="pykeepass password: ", test=test)
+        if profile is not None:
+            names = client.tagged(profile)
+            if not names:
+                cecho(f"NOTICE: No keepass database in profile {profile}. Use 'pykeypass tag <name> {profile}'.")
+                return
+            cecho(f"START: Open profile {profile} ({len(names)} keepass databases).")
+            launch_databases(
+                client, client.databases(names), workers, wait, window, force=force, cache=cache, gate=gate, delay=delay
             )
+            return
+        client.launcher = select_launcher(client.pykeypass_app)
+        if wait and wait_unsupported(client.launcher):
+            return
+        if not (wait or cache):
+            client.open(database, force=force)
+            return
+        entry = client.entry(database)
+        if entry is None:
+            raise KeyError(database)
+        record = None if force else client.registry.running(database)
+        if record is not None:
+            raise AlreadyOpen(database, record)
+        if cache:
+            ((database, entry),) = prefetch_databases(client.pykeypass_folder, [(database, entry)])
+        if wait:
+            wait_for_launches(client.launcher, [(database, entry)], window, client.registry)
         else:
-            subprocess.Popen(
-                f'{pykeypass_app} "{entry.url}" -pw:{entry.password}',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
+            client.launch(database, entry, force=True)
+    except AlreadyOpen as e:
+        report_already_open(database, e.record)
+    except KeyError:
+        cecho(f"ERROR: Setup item for {database} file missing or incorrect")
+        cecho(
+            f"ISSUE: All or part of the {database} Keepass entry was not found.\nFIX: Setup "
+            f'this entry using: "pykeypass open {database} -s"'
+        )
     except pykeepass_exceptions.CredentialsError:
         cecho("ERROR: pykeypass login information invalid.\n")
     except AttributeError as e:
@@ -223,12 +761,14 @@ def keepass_open(database, test, input_password=None):
         cecho(e)
     except FileNotFoundError:
         cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+    except OSError as e:
+        cecho(f"ERROR: {database} keypass database failed to launch: {e}")
     except ChecksumError:
         cecho("ERROR: pykeypass login information invalid.\n")
 
 
 @cli.command("path", help="Launches functionality for a specific Keepass database.")
-@cargument("database", required=True)
+@cargument("database", required=True, shell_complete=complete_database)
 @coption(
     "-i",
     "--input_password",
@@ -239,17 +779,16 @@ def keepass_open(database, test, input_password=None):
 @coption("-t", "--test", "test", is_flag=True, hidden=True)
 def keepass_path(database, test, input_password=None):
     """Shows file(s) for database entry."""
+    from pykeepass import exceptions as pykeepass_exceptions
+
     try:
-        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
-        kp = PyKeePass(pykeypass_db, password=getpass.getpass(prompt="pykeypass password: "))
-        entry = kp.find_entries(title=f"{database}", first=True)
-        cecho(f"{database.upper()} PATH: {entry.url}")
-        if entry.get_custom_property("key"):
-            key_name = entry.get_custom_property("key")
+        url, key_name = session_client(test=test).path(database)
+        cecho(f"{database.upper()} PATH: {url}")
+        if key_name:
             cecho(f"{database.upper()} KEY: {key_name}")
-    except pykeepass.exceptions.CredentialsError:
+    except pykeepass_exceptions.CredentialsError:
         cecho("ERROR: pykeypass login information invalid.\n")
-    except AttributeError:
+    except (KeyError, AttributeError):
         cecho(
             f"ISSUE: All or part of the {database} Keepass entry was not found.\nFIX: Setup this "
             f'entry using: "pykeypass open {database} -s"'
@@ -258,39 +797,469 @@ def keepass_path(database, test, input_password=None):
         cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
 
 
-# @cli.command("all", help="Starts all configured Keepass databases.")
-# @coption("-t", "--test", "test", is_flag=True, hidden=True)
-# def keepass_all(test):
-#     """Launches all database entries."""
-#     try:
-#         mode = "-t" if test is True else ""
-#         pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
-#         password = getpass.getpass(prompt="pykeepass password: ")
-#         kp = PyKeePass(pykeypass_db, password=password)
-#         groups = kp.find_groups(name=".", regex=True)
-#         if len(groups) > 1:
-#             for i in groups[1:]:
-#                 database_entry = str(i)[8:-1]
-#                 print(database_entry)
-#                 pipe_local = subprocess.Popen(
-#                     f"pykeypass open {database_entry} -i {password} {mode}",
-#                     stdout=subprocess.PIPE,
-#                     stderr=subprocess.PIPE,
-#                 )
-#                 if pipe_local.communicate() and pipe_local.returncode == 0:
-#                     cecho(f"STATUS: {database_entry} keypass database launched successfully.")
-#         else:
-#             cecho(
-#                 "NOTICE: No entry created. Use 'pykeypass open <new_name> -s'" + "to get started."
-#             )
-#     except pykeepass_exceptions.CredentialsError:
-#         cecho("ERROR: pykeypass login information invalid.\n")
-#     except FileNotFoundError:
-#         cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
-#     except subprocess.CalledProcessError as e:
-#         cecho(e)
-#     except Exception as e:
-#         raise Exception(e)
+@cli.command("tag", help="Shows, adds or removes tags (launch profiles) of a Keepass database entry.")
+@cargument("database", required=True, shell_complete=complete_database)
+@cargument("tags", nargs=-1)
+@coption("-r", "--remove", "remove", is_flag=True, help="Remove TAGS instead of adding them.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_tag(database, tags, test, remove=False):
+    """Adds TAGS to (or removes them from) a database entry, or shows its tags when none are given.
+
+    Tags are launch profiles: 'pykeypass open --profile <tag>' opens every database carrying one.
+    """
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    try:
+        client = session_client(use_agent=not tags, key_cache=not tags, test=test)
+        current = client.tags(database)
+        if tags:
+            changes = split_tags(",".join(tags))
+            if remove:
+                updated = [tag for tag in current if tag not in changes]
+            else:
+                updated = current + [tag for tag in changes if tag not in current]
+            with client:
+                client.set_tags(database, updated)
+            current = updated
+        cecho(f"{database.upper()} TAGS: {', '.join(current) if current else '-'}")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except KeyError:
+        cecho(
+            f"ISSUE: All or part of the {database} Keepass entry was not found.\nFIX: Setup this "
+            f'entry using: "pykeypass open {database} -s"'
+        )
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+
+
+@cli.command("priority", help="Shows or sets the launch priority of a Keepass database entry.")
+@cargument("database", required=True, shell_complete=complete_database)
+@cargument("priority", type=int, required=False)
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_priority(database, test, priority=None):
+    """Sets the launch priority of a database entry, or shows it when none is given.
+
+    'pykeypass all' and 'pykeypass open --profile' start higher priorities first; 0 (the default)
+    removes the priority.
+    """
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    try:
+        client = session_client(use_agent=priority is None, key_cache=priority is None, test=test)
+        if priority is None:
+            priority = client.priority(database)
+        else:
+            with client:
+                client.set_priority(database, priority)
+        cecho(f"{database.upper()} PRIORITY: {priority}")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except KeyError:
+        cecho(
+            f"ISSUE: All or part of the {database} Keepass entry was not found.\nFIX: Setup this "
+            f'entry using: "pykeypass open {database} -s"'
+        )
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+
+
+@cli.command("compact", help="Writes the changes kept in the change journal into the pykeypass app database.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_compact(test):
+    """Folds the change journal into the app database.
+
+    With 'PYKEYPASS_JOURNAL=1', saves append the changed entries to a journal next to the app
+    database instead of writing all of it (see 'pykeypass.journal'). 'compact' writes the app
+    database once, with every journaled change, and removes the journal. Saves also compact the
+    journal on their own once it passes 'PYKEYPASS_JOURNAL_COMPACT_KB'.
+    """
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    try:
+        client = session_client(use_agent=False, key_cache=False, test=test)
+        compacted = client.compact()
+        if compacted:
+            cecho(f"DONE: {compacted} journaled change(s) written to the pykeypass app database.")
+        else:
+            cecho("STATUS: No journaled changes to compact.")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+
+
+@cli.command(
+    "all",
+    help="Starts all configured Keepass databases, in waves. With the default '--gate ready' every wave "
+    f"but the last one is waited for until its Keepass processes are ready (up to {READY_TIMEOUT:g}s per wave) "
+    "before the next one starts; use '--gate none' to start them all at once.",
+)
+@coption(
+    "-w",
+    "--workers",
+    "workers",
+    type=int,
+    help="Maximum number of Keepass databases launched at the same time (one wave).  "
+    "[default: best measured in .pykeypass/launches.json (every fifth run half or twice it), else 4]",
+)
+@coption(
+    "--gate",
+    "gate",
+    type=cchoice(GATES),
+    default=GATE_READY,
+    show_default=True,
+    help="What holds a wave of launches back until the next one starts: the previous wave being ready, "
+    "a fixed --delay, or nothing.",
+)
+@coption(
+    "--delay",
+    "delay",
+    type=float,
+    help="With --gate delay: seconds between waves.  [default: median measured launch time]",
+)
+@coption(
+    "--wait",
+    "wait",
+    is_flag=True,
+    help="Follow the Keepass processes and report startup failures and exit status.",
+)
+@coption(
+    "--window",
+    "window",
+    default=DEFAULT_WINDOW,
+    show_default=True,
+    type=float,
+    help="With --wait or --batch: seconds a Keepass process gets to start (or to hand over its database).",
+)
+@coption(
+    "--batch",
+    "batch",
+    is_flag=True,
+    help="Open all databases in one Keepass process (a running one if pykeypass started it).",
+)
+@coption(
+    "--force",
+    "force",
+    is_flag=True,
+    help="Also open databases that pykeypass already opened in a running Keepass.",
+)
+@coption(
+    "--cache",
+    "cache",
+    is_flag=True,
+    help="Open local read-only copies of the databases (copied to '.pykeypass/cache' if they changed).",
+)
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_all(
+    test,
+    workers=None,
+    wait=False,
+    window=DEFAULT_WINDOW,
+    batch=False,
+    force=False,
+    cache=False,
+    gate=GATE_READY,
+    delay=None,
+):
+    """Launches all database entries.
+
+    The app database is unlocked once and every entry is resolved from that single session. The
+    Keepass processes are then started by the launch scheduler (see 'pykeypass.scheduler'): in
+    waves of '--workers' databases, highest priority first, the wave size defaulting to the best
+    one measured in '.pykeypass/launches.json'. '--gate' decides what holds the next wave back: with
+    the default 'ready', 'all' waits until every process of the wave is ready (up to READY_TIMEOUT
+    seconds per wave), with 'delay' for '--delay' seconds (default: the median measured launch
+    time), with 'none' not at all. With '--wait' all of them are started and followed from a single
+    event loop instead (see 'wait_for_launches'); with '--batch' they share a single Keepass process
+    (see 'open_batch').
+    """
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    if wait and batch:
+        cecho("ERROR: --wait and --batch cannot be combined.")
+        return
+    try:
+        client = session_client(prompt="pykeepass password: ", test=test)
+        databases = client.databases()
+        if not databases:
+            cecho("NOTICE: No entry created. Use 'pykeypass open <new_name> -s' to get started.")
+            return
+        launch_databases(client, databases, workers, wait, window, batch, force, cache, gate, delay)
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+    except ChecksumError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+
+
+@cli.command("verify", help="Test-unlocks configured Keepass databases with their stored credentials.")
+@cargument("databases", nargs=-1, shell_complete=complete_database)
+@coption(
+    "-w",
+    "--workers",
+    "workers",
+    type=int,
+    help="Number of databases checked at the same time.  [default: number of CPUs]",
+)
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_verify(databases, test, workers=None):
+    """Checks the stored url, password and key file of the requested (default: all) databases.
+
+    The app database is unlocked once; every Keepass database is then opened with pykeepass in a
+    process pool (see 'pykeypass.verify'), so the key derivations run on all cores.
+    """
+    import time
+
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    from .verify import verify_entries
+
+    try:
+        start = time.perf_counter()
+        targets = session_client(prompt="pykeepass password: ", test=test).databases(databases)
+        if not targets:
+            cecho("NOTICE: No entry created. Use 'pykeypass open <new_name> -s' to get started.")
+            return
+        width = max(len("DATABASE"), *(len(name) for name, entry in targets))
+        cecho(f"{'DATABASE':<{width}}  {'STATUS':<17}  TIME")
+        verified = 0
+        for result in verify_entries(targets, workers):
+            tracer.record("verify", result.seconds, database=result.name)
+            verified += result.ok
+            cecho(f"{result.name:<{width}}  {result.status:<17}  {result.seconds:.2f}s")
+        cecho(f"DONE: {verified} of {len(targets)} keepass databases verified in {time.perf_counter() - start:.2f}s.")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+    except ChecksumError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+
+
+@cli.command("status", help="Checks which configured Keepass databases are reachable right now.")
+@cargument("databases", nargs=-1, shell_complete=complete_database)
+@coption(
+    "--timeout",
+    "timeout",
+    default=2.0,
+    show_default=True,
+    type=float,
+    help="Seconds each database and key file gets to answer.",
+)
+@coption("--json", "as_json", is_flag=True, help="Print the result as JSON.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_status(databases, test, timeout=2.0, as_json=False):
+    """Stats the database and key file of the requested (default: all) databases.
+
+    The app database is unlocked once; every file is then checked at the same time, each with its
+    own timeout (see 'pykeypass.status'), so one dead share costs at most '--timeout' seconds.
+    """
+    import json
+    import time
+
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    from .status import check_paths
+
+    try:
+        # with --json, stdout carries nothing but the JSON document
+        client = session_client(quiet=as_json, prompt="pykeepass password: ", test=test)
+        targets = client.databases(databases)
+        with span("status"):
+            statuses = check_paths(targets, timeout)
+        reachable = {name for name, entry in targets}
+        for status in statuses:
+            if not status.reachable:
+                reachable.discard(status.name)
+        if as_json:
+            report = {name: {"database": name, "reachable": name in reachable, "files": []} for name, entry in targets}
+            for status in statuses:
+                report[status.name]["files"].append(status.as_dict())
+            cecho(json.dumps(list(report.values()), indent=2))
+            return
+        if not targets:
+            cecho("NOTICE: No entry created. Use 'pykeypass open <new_name> -s' to get started.")
+            return
+        width = max(len("DATABASE"), *(len(name) for name, entry in targets))
+        cecho(f"{'DATABASE':<{width}}  {'FILE':<8}  {'STATUS':<11}  {'SIZE':>9}  {'MODIFIED':<16}  LATENCY")
+        for status in statuses:
+            size = f"{status.size / 1024:.1f} KB" if status.reachable else "-"
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(status.modified)) if status.reachable else "-"
+            latency = f"{status.latency * 1000:.0f} ms" if status.latency is not None else "-"
+            state = "reachable" if status.reachable else "unreachable"
+            line = f"{status.name:<{width}}  {status.kind:<8}  {state:<11}  {size:>9}  {modified:<16}  {latency}"
+            cecho(line if status.reachable else f"{line} ({status.error})")
+        cecho(f"DONE: {len(reachable)} of {len(targets)} keepass databases reachable.")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+    except ChecksumError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+
+
+@cli.command("shell", help="Interactive session: unlocks once, then runs list, path, open, manage... until 'exit'.")
+@coption(
+    "--idle-timeout",
+    "idle_timeout",
+    default=DEFAULT_IDLE_TIMEOUT,
+    show_default=True,
+    type=float,
+    help="Seconds without a command after which staged changes are saved and the session is locked (0: never).",
+)
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def keepass_shell(test, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Runs pykeypass commands against a single unlocked session (see 'pykeypass.shell').
+
+    Each command line is handed to the regular Click command with the session as context object,
+    so 'session_client' returns it instead of unlocking the app database again.
+    """
+    from click.exceptions import Abort, ClickException
+    from construct import ChecksumError
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    from .shell import PyKeypassShell, ShellClient
+
+    root_params = cget_current_context().find_root().params
+    root_args = ["--launcher", root_params["launcher"]] + (["--profile"] if root_params["profile"] else [])
+
+    def run(argv):
+        try:
+            cli.main([*root_args, *argv], prog_name="pykeypass", obj=client, standalone_mode=False)
+        except ClickException as e:
+            e.show()
+        except Abort:
+            cecho("Aborted!")
+
+    client = ShellClient(
+        pykeypass_folder=path_selection(test)[0],
+        prompt="pykeepass password: ",
+        use_agent=False,
+        key_cache=False,
+        test=test,
+    )
+    try:
+        client.unlock()
+    except (pykeepass_exceptions.CredentialsError, ChecksumError):
+        cecho("ERROR: pykeypass login information invalid.\n")
+        return
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+        return
+    shell = PyKeypassShell(client, run, idle_timeout)
+    try:
+        while True:
+            try:
+                shell.cmdloop()
+                break
+            except KeyboardInterrupt:
+                cecho("")
+                shell.intro = None
+    finally:
+        saved = shell.close()
+    cecho("DONE: pykeypass shell closed" + (", changes saved." if saved else "."))
+
+
+@cli.group("agent", help="Keeps the pykeypass app database unlocked between commands.")
+def keepass_agent():
+    """Unlock agent
+
+    Similar to ssh-agent: 'pykeypass agent start' holds the decrypted app database in memory and
+    'list', 'open', 'path' and 'all' ask it for entries before falling back to a password prompt.
+    """
+
+
+@keepass_agent.command("start", help="Starts the pykeypass agent in the foreground.")
+@coption(
+    "--ttl",
+    "ttl",
+    default=DEFAULT_TTL,
+    show_default=True,
+    type=int,
+    help="Seconds without a request before the agent locks itself (0 never locks).",
+)
+@coption("-u", "--unlock", "unlock", is_flag=True, help="Unlock the agent right away.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def agent_start(ttl, unlock, test):
+    """Runs the agent until 'pykeypass agent stop' or Ctrl+C."""
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        if ospath.exists(pykeypass_db) is False:
+            raise FileNotFoundError(pykeypass_db)
+        try:
+            request(pykeypass_folder, "status")
+            cecho("NOTICE: pykeypass agent already running.")
+            return
+        except AgentUnavailable:
+            pass
+        agent = Agent(pykeypass_db, ttl=ttl)
+        if unlock:
+            agent.unlock(getpass.getpass(prompt="pykeypass password: "))
+        cecho("STATUS: pykeypass agent started. Use 'pykeypass agent stop' or Ctrl+C to stop it.")
+        agent.serve(pykeypass_folder)
+    except KeyboardInterrupt:
+        cecho("STATUS: pykeypass agent stopped.")
+    except pykeepass_exceptions.CredentialsError:
+        cecho("ERROR: pykeypass login information invalid.\n")
+    except FileNotFoundError:
+        cecho("ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n")
+
+
+@keepass_agent.command("unlock", help="Unlocks the running pykeypass agent.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def agent_unlock(test):
+    """Sends the pykeypass password to the running agent."""
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        request(pykeypass_folder, "status")
+        request(pykeypass_folder, "unlock", password=getpass.getpass(prompt="pykeypass password: "))
+        cecho("STATUS: pykeypass agent unlocked.")
+    except AgentUnavailable as e:
+        cecho(f"ERROR: {e}\n")
+
+
+@keepass_agent.command("lock", help="Locks the running pykeypass agent.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def agent_lock(test):
+    """Drops the decrypted app database from the agent's memory."""
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        request(pykeypass_folder, "lock")
+        cecho("STATUS: pykeypass agent locked.")
+    except AgentUnavailable as e:
+        cecho(f"ERROR: {e}\n")
+
+
+@keepass_agent.command("stop", help="Stops the running pykeypass agent.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def agent_stop(test):
+    """Stops the agent."""
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        request(pykeypass_folder, "stop")
+        cecho("STATUS: pykeypass agent stopped.")
+    except AgentUnavailable as e:
+        cecho(f"ERROR: {e}\n")
+
+
+@keepass_agent.command("status", help="Shows whether the pykeypass agent is running and unlocked.")
+@coption("-t", "--test", "test", is_flag=True, hidden=True)
+def agent_status(test):
+    """Shows agent state."""
+    try:
+        pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(test)
+        status = request(pykeypass_folder, "status")
+        state = "locked" if status["locked"] else "unlocked"
+        cecho(f"STATUS: pykeypass agent running (pid {status['pid']}, {state}, ttl {status['ttl']}s).")
+    except AgentUnavailable as e:
+        cecho(f"ERROR: {e}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,315 @@
+"""pykeypass unlock agent
+
+Keeps the decrypted pykeypass app database in memory between CLI calls, similar to ssh-agent.
+The agent listens on a local, per-user endpoint (a Unix-domain socket inside the '.pykeypass'
+folder on Linux/macOS, a named pipe on Windows). Every connection is authenticated with a random
+key that only the current user can read, so other local users cannot query the agent.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from .index import EntryIndex
+from .journal import journal_path
+from .profiling import span
+
+DEFAULT_TTL = 900
+CONNECTION_TIMEOUT = 5.0  # seconds an authenticated client has to send its command
+
+
+class AgentUnavailable(Exception):
+    """No unlocked pykeypass agent could answer the request."""
+
+
+class AgentEntry:
+    """Read-only copy of an app database entry served by the agent
+
+    Exposes the same attributes used by the CLI on pykeepass 'Entry' objects, so commands can use
+    entries from the agent and from a direct unlock the same way.
+    """
+
+    def __init__(self, title, url, password, custom_properties=None):
+        self.title = title
+        self.url = url
+        self.password = password
+        self.custom_properties = custom_properties or {}
+
+    def get_custom_property(self, key):
+        return self.custom_properties.get(key)
+
+
+def agent_address(pykeypass_folder):
+    """Listener address and family for the agent of a '.pykeypass' folder
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder (see 'path_selection').
+
+    Returns:
+        tuple: (address, family) accepted by 'multiprocessing.connection'.
+    """
+    if sys.platform == "win32":
+        folder_hash = hashlib.sha256(str(pykeypass_folder).lower().encode("utf-8")).hexdigest()[:16]
+        return rf"\\.\pipe\pykeypass-agent-{folder_hash}", "AF_PIPE"
+    return str(pykeypass_folder / "agent.sock"), "AF_UNIX"
+
+
+def _authkey_path(pykeypass_folder):
+    return pykeypass_folder / "agent.key"
+
+
+def _write_authkey(pykeypass_folder):
+    """Create a fresh authentication key readable only by the current user."""
+    import secrets
+
+    authkey = secrets.token_bytes(32)
+    key_path = _authkey_path(pykeypass_folder)
+    if key_path.exists():
+        key_path.unlink()
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(authkey)
+    return authkey
+
+
+def _serialize_entry(entry):
+    if entry is None:
+        return None
+    return {
+        "title": entry.title,
+        "url": entry.url,
+        "password": entry.password,
+        "custom_properties": dict(entry.custom_properties),
+    }
+
+
+def _deserialize_entry(entry):
+    return None if entry is None else AgentEntry(**entry)
+
+
+def request(pykeypass_folder, command, **kwargs):
+    """Send a single command to a running agent
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder the agent was started for.
+        command (str): One of 'status', 'unlock', 'lock', 'list', 'entry', 'entries' or 'stop'.
+        **kwargs: Command arguments.
+
+    Raises:
+        AgentUnavailable: No agent is running, it could not be authenticated, or it is locked.
+
+    Returns:
+        The command result.
+    """
+    from multiprocessing.connection import AuthenticationError, Client
+
+    address, family = agent_address(pykeypass_folder)
+    try:
+        with span("agent", command=command):
+            authkey = _authkey_path(pykeypass_folder).read_bytes()
+            with Client(address, family=family, authkey=authkey) as connection:
+                connection.send((command, kwargs))
+                status, result = connection.recv()
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise AgentUnavailable(f"pykeypass agent not running ({e})") from e
+    if status == "locked":
+        raise AgentUnavailable("pykeypass agent is locked.")
+    if status == "error":
+        raise AgentUnavailable(result)
+    return result
+
+
+def agent_list(pykeypass_folder):
+    """Names of the configured Keepass databases, served by the agent."""
+    return request(pykeypass_folder, "list")
+
+
+def agent_entry(pykeypass_folder, database):
+    """Entry for 'database' served by the agent ('None' if it does not exist)."""
+    return _deserialize_entry(request(pykeypass_folder, "entry", name=database))
+
+
+def agent_entries(pykeypass_folder):
+    """(name, entry) tuples of every configured Keepass database, served by the agent."""
+    return [(name, _deserialize_entry(entry)) for name, entry in request(pykeypass_folder, "entries")]
+
+
+class Agent:
+    """In-memory holder of the unlocked app database
+
+    Args:
+        pykeypass_db (Path): pykeypass app database.
+        ttl (int): Seconds without a request after which the database is locked again. 0 disables
+        the idle lock.
+    """
+
+    def __init__(self, pykeypass_db, ttl=DEFAULT_TTL):
+        self.pykeypass_db = pykeypass_db
+        self.ttl = ttl
+        self.kp = None
+        self.index = None
+        self.file_state = None
+        self.last_used = time.monotonic()
+        self.running = True
+        self.lock = threading.Lock()
+
+    def _file_state(self):
+        """Modification time and size of the app database and of its journal (None when missing)."""
+        stat = os.stat(self.pykeypass_db)
+        try:
+            journal_stat = os.stat(journal_path(self.pykeypass_db))
+            journal_state = journal_stat.st_mtime_ns, journal_stat.st_size
+        except FileNotFoundError:
+            journal_state = None
+        return stat.st_mtime_ns, stat.st_size, journal_state
+
+    def _load(self, password=None, transformed_key=None):
+        """Unlock the app database and replay its journal (see 'pykeypass.journal')."""
+        from pykeepass import PyKeePass
+
+        from .client import replay_journal
+
+        file_state = self._file_state()
+        kp = PyKeePass(self.pykeypass_db, password=password, transformed_key=transformed_key)
+        index = EntryIndex(kp)
+        replay_journal(kp, index, self.pykeypass_db)
+        self.kp, self.index, self.file_state = kp, index, file_state
+
+    def unlock(self, password):
+        self._load(password=password)
+
+    def lock_database(self):
+        self.kp = None
+        self.index = None
+        self.file_state = None
+
+    def _refresh(self):
+        """Reload the app database when another command saved it (or its journal) since it was unlocked
+
+        The cached transformed key is reused, so a reload costs a file parse, not a KDF run. If the
+        credentials no longer match (e.g. after 'pykeypass setup') the agent locks itself.
+        """
+        from pykeepass import exceptions as pykeepass_exceptions
+
+        if self._file_state() != self.file_state:
+            try:
+                self._load(transformed_key=self.kp.transformed_key)
+            except pykeepass_exceptions.CredentialsError:
+                self.lock_database()
+
+    def handle(self, command, kwargs):
+        """Run one agent command
+
+        Returns:
+            tuple: (status, result) where status is 'ok', 'locked' or 'error'.
+        """
+        self.last_used = time.monotonic()
+        if command == "status":
+            return "ok", {"locked": self.kp is None, "ttl": self.ttl, "pid": os.getpid()}
+        if command == "unlock":
+            self.unlock(kwargs["password"])
+            return "ok", None
+        if command == "lock":
+            self.lock_database()
+            return "ok", None
+        if command == "stop":
+            self.running = False
+            return "ok", None
+        if self.kp is None:
+            return "locked", None
+        try:
+            self._refresh()
+        except FileNotFoundError:
+            self.lock_database()
+        if self.kp is None:
+            return "locked", None
+        if command == "list":
+            return "ok", self.index.names()
+        if command == "entry":
+            return "ok", _serialize_entry(self.index.entry(kwargs["name"]))
+        if command == "entries":
+            return "ok", [(name, _serialize_entry(entry)) for name, entry in self.index.databases()]
+        return "error", f"Unknown agent command: {command}"
+
+    def _idle_lock(self):
+        while self.running:
+            time.sleep(1)
+            with self.lock:
+                if self.ttl and self.kp is not None and time.monotonic() - self.last_used > self.ttl:
+                    self.lock_database()
+
+    def _serve_connection(self, connection, authkey, address, family):
+        """Authenticate one client and answer its command (on a thread of its own)
+
+        A client that stops talking holds this thread only; once authenticated, it has
+        CONNECTION_TIMEOUT seconds to send its command.
+        """
+        from multiprocessing.connection import AuthenticationError, Client, answer_challenge, deliver_challenge
+
+        from pykeepass import exceptions as pykeepass_exceptions
+
+        with connection:
+            try:
+                deliver_challenge(connection, authkey)
+                answer_challenge(connection, authkey)
+                if not connection.poll(CONNECTION_TIMEOUT):
+                    return
+                command, kwargs = connection.recv()
+                with self.lock:
+                    try:
+                        response = self.handle(command, kwargs)
+                    except pykeepass_exceptions.CredentialsError:
+                        response = ("error", "pykeypass login information invalid.")
+                    except FileNotFoundError:
+                        response = ("error", "pykeepass app database not found.")
+                connection.send(response)
+            except (OSError, EOFError, AuthenticationError):
+                return
+        if not self.running:
+            try:
+                Client(address, family=family).close()  # wakes up 'serve', blocked in 'accept'
+            except OSError:
+                pass
+
+    def serve(self, pykeypass_folder):
+        """Accept agent commands until a 'stop' command is received
+
+        Connections are accepted here and served on threads of their own (see '_serve_connection'),
+        so a client that connects and never sends anything cannot block the other commands.
+
+        Args:
+            pykeypass_folder (Path): pykeypass folder used to derive the agent address and key.
+        """
+        from multiprocessing.connection import Listener
+
+        address, family = agent_address(pykeypass_folder)
+        if family == "AF_UNIX" and os.path.exists(address):
+            os.unlink(address)
+        authkey = _write_authkey(pykeypass_folder)
+        old_umask = os.umask(0o177)
+        try:
+            # no 'authkey': Listener.accept would run the challenge on this thread
+            listener = Listener(address, family=family)
+        finally:
+            os.umask(old_umask)
+        threading.Thread(target=self._idle_lock, daemon=True).start()
+        try:
+            with listener:
+                while self.running:
+                    try:
+                        connection = listener.accept()
+                    except OSError:
+                        continue
+                    if not self.running:
+                        connection.close()
+                        break
+                    threading.Thread(
+                        target=self._serve_connection, args=(connection, authkey, address, family), daemon=True
+                    ).start()
+        finally:
+            self.running = False
+            self.lock_database()
+            _authkey_path(pykeypass_folder).unlink(missing_ok=True)
+            if family == "AF_UNIX" and os.path.exists(address):
+                os.unlink(address)
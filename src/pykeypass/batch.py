@@ -0,0 +1,164 @@
+"""Open several Keepass databases in one Keepass process ('pykeypass all --batch')
+
+Clients that open several databases from one command line ('batch_open', e.g. KeePassXC) get
+them all at once, split only where the client needs it (see 'Launcher.batches').
+
+Keepass 2.x takes a single database per command line, but runs as a single instance by default: a
+second 'keepass.exe <database> -pw:...' hands its command line to the running Keepass over
+Keepass' own IPC and exits. Instead of N full Keepass processes, a batch launch starts one Keepass
+(or reuses one that pykeypass started earlier), waits until it can take over databases, and then
+hands it every other database. The helper processes exit right after the hand-over, so memory use
+is that of a single Keepass.
+
+A helper that is still running after the startup window did not find a Keepass to hand over to
+(e.g. single instance mode is turned off); it is kept as a separate Keepass process.
+"""
+import sys
+import time
+
+from .supervisor import DEFAULT_WINDOW
+
+LAUNCHED = "launched"
+HANDED_OVER = "handed over"
+SEPARATE = "separate process"
+FAILED = "failed"
+
+
+class BatchResult:
+    """Outcome of one database of a batch launch
+
+    Args:
+        name (str): Entry name in the app database.
+        outcome (str): LAUNCHED, HANDED_OVER, SEPARATE or FAILED.
+        pid (int, optional): Keepass process holding the database, when known.
+        error (str, optional): Why the database failed to open.
+    """
+
+    def __init__(self, name, outcome, pid=None, error=None):
+        self.name = name
+        self.outcome = outcome
+        self.pid = pid
+        self.error = error
+
+
+def _wait_for_input_idle(pid, timeout):
+    import ctypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x00100400, False, pid)  # SYNCHRONIZE | PROCESS_QUERY_INFORMATION
+    if not handle:
+        return
+    try:
+        ctypes.windll.user32.WaitForInputIdle(handle, int(timeout * 1000))
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def wait_until_ready(process, timeout):
+    """Wait until a new Keepass process can take over databases from other Keepass processes
+
+    On Windows this returns as soon as Keepass' main window waits for input; elsewhere there is no
+    such signal and the whole 'timeout' is waited (unless the process exits).
+
+    Returns:
+        bool: True if the process is still running.
+    """
+    deadline = time.monotonic() + timeout
+    if sys.platform == "win32":
+        _wait_for_input_idle(process.pid, timeout)
+    else:
+        while time.monotonic() < deadline and process.poll() is None:
+            time.sleep(0.05)
+    return process.poll() is None
+
+
+def _launch_grouped(launcher, databases, registry):
+    results = []
+    for group in launcher.batches(databases):
+        try:
+            process = launcher.start([entry for name, entry in group])
+        except OSError as e:
+            results.extend(BatchResult(name, FAILED, error=str(e)) for name, entry in group)
+            continue
+        pid = getattr(process, "pid", None)
+        for name, entry in group:
+            if pid is not None:
+                registry.add(name, pid)
+            results.append(BatchResult(name, LAUNCHED, pid=pid))
+    return results
+
+
+def launch_batch(launcher, databases, registry, window=DEFAULT_WINDOW):
+    """Open databases in as few Keepass processes as possible
+
+    Clients that can neither open several databases at once nor hand them over to a running
+    instance get one process per database.
+
+    Args:
+        launcher (Launcher): Launcher backend (see 'pykeypass.launchers').
+        databases (list): (name, entry) tuples.
+        registry (ProcessRegistry): Registry of the running Keepass processes. A Keepass process
+        pykeypass started earlier takes the databases over; every opened database is recorded.
+        window (float, optional): Seconds to wait for the first Keepass to be ready, and for the
+        other processes to hand over. Defaults to DEFAULT_WINDOW.
+
+    Returns:
+        list: BatchResult per database.
+    """
+    if launcher.batch_open:
+        return _launch_grouped(launcher, databases, registry)
+
+    def launch(entry):
+        return launcher.start([entry])
+
+    results = []
+    pending = list(databases)
+    if not launcher.single_instance:
+        for name, entry in pending:
+            try:
+                process = launch(entry)
+            except OSError as e:
+                results.append(BatchResult(name, FAILED, error=str(e)))
+                continue
+            registry.add(name, process.pid)
+            results.append(BatchResult(name, SEPARATE, pid=process.pid))
+        return results
+    primary_pid = registry.any_running()
+    # a Keepass not started by pykeypass took over the first database, the others follow it there
+    foreign_primary = False
+    while primary_pid is None and not foreign_primary and pending:
+        name, entry = pending.pop(0)
+        try:
+            process = launch(entry)
+        except OSError as e:
+            results.append(BatchResult(name, FAILED, error=str(e)))
+            continue
+        if wait_until_ready(process, window):
+            primary_pid = process.pid
+            registry.add(name, primary_pid)
+            results.append(BatchResult(name, LAUNCHED, pid=primary_pid))
+        elif process.returncode == 0:
+            foreign_primary = True
+            results.append(BatchResult(name, HANDED_OVER))
+        else:
+            results.append(BatchResult(name, FAILED, error=f"exited with status {process.returncode}"))
+    helpers = []
+    for name, entry in pending:
+        try:
+            helpers.append((name, launch(entry)))
+        except OSError as e:
+            results.append(BatchResult(name, FAILED, error=str(e)))
+    deadline = time.monotonic() + window
+    for name, process in helpers:
+        while time.monotonic() < deadline and process.poll() is None:
+            time.sleep(0.05)
+        if process.poll() is None:
+            registry.add(name, process.pid)
+            results.append(BatchResult(name, SEPARATE, pid=process.pid))
+        elif process.returncode == 0:
+            if primary_pid is not None:
+                registry.add(name, primary_pid)
+            results.append(BatchResult(name, HANDED_OVER, pid=primary_pid))
+        else:
+            results.append(BatchResult(name, FAILED, error=f"exited with status {process.returncode}"))
+    return results
@@ -0,0 +1,227 @@
+"""Local read-through cache of the Keepass databases ('--cache' on 'pykeypass open' and 'all')
+
+Databases (and key files) on network shares are slow to open, especially when many users log in
+at once. With '--cache' every database and key file about to be opened is first copied to
+'.pykeypass/cache' (all of them concurrently) and Keepass opens the local copy instead.
+
+- A cached file is reused while the size and modification time of its source are unchanged and
+  the local copy still has the SHA-256 recorded when it was copied.
+- When the source changed, it is copied again (streamed and hashed on the way); a copy with the
+  same content as the cached one is discarded and the cached file kept.
+- Cached files are read-only: changes have to be made to the database at its original location.
+- The cache is bounded by 'PYKEYPASS_CACHE_LIMIT_MB' (megabytes, default DEFAULT_CACHE_LIMIT_MB).
+  Once it is larger, the least recently used files are evicted, never the ones of the current run.
+
+'.pykeypass/cache/index.json' maps each source path to its local copy, size, modification time,
+SHA-256 and last use.
+"""
+import hashlib
+import json
+import os
+import stat
+import time
+from pathlib import Path
+
+CACHE_LIMIT_ENV = "PYKEYPASS_CACHE_LIMIT_MB"
+DEFAULT_CACHE_LIMIT_MB = 256
+CHUNK_SIZE = 1024 * 1024
+
+COPIED = "copied"
+UP_TO_DATE = "up to date"
+FAILED = "failed"
+
+
+def cache_limit():
+    """Configured cache size limit in bytes."""
+    try:
+        megabytes = max(int(os.environ.get(CACHE_LIMIT_ENV, DEFAULT_CACHE_LIMIT_MB)), 0)
+    except ValueError:
+        megabytes = DEFAULT_CACHE_LIMIT_MB
+    return megabytes * 1024 * 1024
+
+
+def _fingerprint(path):
+    file_stat = os.stat(path)
+    return {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+
+
+def _digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove(path):
+    """Delete a (read-only) cached file; False if it is in use (Windows) or cannot be deleted."""
+    try:
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+class CacheResult:
+    """Outcome of caching one file
+
+    Args:
+        source (str): Original path of the file.
+        status (str): COPIED, UP_TO_DATE or FAILED.
+        local (Path, optional): Cached copy, None when caching failed.
+        size (int, optional): File size in bytes.
+        seconds (float, optional): Time spent checking and copying the file.
+        error (str, optional): Why the file could not be cached.
+    """
+
+    def __init__(self, source, status, local=None, size=0, seconds=0.0, error=None):
+        self.source = source
+        self.status = status
+        self.local = local
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+
+
+class DatabaseCache:
+    """Cache folder of a pykeypass folder
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the 'cache' folder.
+        limit (int, optional): Size limit in bytes. Defaults to 'cache_limit()'.
+    """
+
+    def __init__(self, pykeypass_folder, limit=None):
+        self.folder = pykeypass_folder / "cache"
+        self.index_path = self.folder / "index.json"
+        self.limit = cache_limit() if limit is None else limit
+        try:
+            self.files = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            self.files = {}
+        if not isinstance(self.files, dict):
+            self.files = {}
+
+    def local_path(self, source):
+        """Location of the cached copy of 'source' (unique per source path, keeps the file name)."""
+        source_id = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:16]
+        return self.folder / f"{source_id}-{Path(source).name}"
+
+    def _local_intact(self, record, local):
+        """True if the cached copy still holds the content recorded in the index."""
+        if record is None:
+            return False
+        try:
+            if _fingerprint(local) == record.get("local_fingerprint"):
+                return True
+            return _digest(local) == record.get("sha256")
+        except OSError:
+            return False
+
+    def fetch(self, source):
+        """Bring the cached copy of one file up to date (does not touch the index)
+
+        Returns:
+            tuple: (CacheResult, index record or None).
+        """
+        start = time.perf_counter()
+        local = self.local_path(source)
+        record = self.files.get(source)
+        try:
+            source_fingerprint = _fingerprint(source)
+            local_intact = self._local_intact(record, local)
+            if local_intact and record.get("fingerprint") == source_fingerprint:
+                status = UP_TO_DATE
+                sha256 = record["sha256"]
+            else:
+                local_tmp = local.with_name(f".{local.name}.{os.getpid()}.tmp")
+                digest = hashlib.sha256()
+                try:
+                    with open(source, "rb") as source_file, open(local_tmp, "wb") as local_file:
+                        for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b""):
+                            digest.update(chunk)
+                            local_file.write(chunk)
+                    sha256 = digest.hexdigest()
+                    if local_intact and record.get("sha256") == sha256:
+                        status = UP_TO_DATE  # touched, but the same content
+                    else:
+                        status = COPIED
+                        os.chmod(local_tmp, stat.S_IREAD)
+                        if local.exists():
+                            os.chmod(local, stat.S_IREAD | stat.S_IWRITE)
+                        os.replace(local_tmp, local)
+                finally:
+                    _remove(local_tmp)
+        except OSError as e:
+            return CacheResult(source, FAILED, error=str(e), seconds=time.perf_counter() - start), None
+        record = {
+            "local": local.name,
+            "fingerprint": source_fingerprint,
+            "local_fingerprint": _fingerprint(local),
+            "sha256": sha256,
+            "used": time.time(),
+        }
+        result = CacheResult(source, status, local, source_fingerprint["size"], time.perf_counter() - start)
+        return result, record
+
+    def prefetch(self, sources, workers=8):
+        """Cache several files concurrently, then evict least recently used files over the limit
+
+        Args:
+            sources (list): Paths of the files to cache (duplicates are fetched once).
+            workers (int, optional): Files copied at the same time. Defaults to 8.
+
+        Returns:
+            dict: CacheResult per source path.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        sources = list(dict.fromkeys(str(source) for source in sources))
+        if not sources:
+            return {}
+        self.folder.mkdir(parents=True, exist_ok=True)
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(sources)), 1)) as executor:
+            for result, record in executor.map(self.fetch, sources):
+                results[result.source] = result
+                if record is not None:
+                    self.files[result.source] = record
+        self.evict(keep=set(results))
+        self._save()
+        return results
+
+    def size(self):
+        """Total size of the cached files in bytes."""
+        return sum(record["fingerprint"]["size"] for record in self.files.values())
+
+    def evict(self, keep=()):
+        """Delete least recently used files until the cache fits its limit
+
+        Args:
+            keep (set, optional): Source paths that must stay cached (the files about to be opened).
+
+        Returns:
+            list: Source paths evicted.
+        """
+        evicted = []
+        for source, record in list(self.files.items()):
+            if not (self.folder / record["local"]).exists():
+                del self.files[source]
+        total = self.size()
+        for source, record in sorted(self.files.items(), key=lambda item: item[1].get("used", 0)):
+            if total <= self.limit:
+                break
+            if source in keep or not _remove(self.folder / record["local"]):
+                continue
+            del self.files[source]
+            total -= record["fingerprint"]["size"]
+            evicted.append(source)
+        return evicted
+
+    def _save(self):
+        index_tmp = self.index_path.with_suffix(".tmp")
+        index_tmp.write_text(json.dumps(self.files, indent=2))
+        os.replace(index_tmp, self.index_path)
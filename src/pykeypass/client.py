@@ -0,0 +1,804 @@
+"""Python client of the pykeypass app database
+
+'PyKeypassClient' unlocks the app database once and serves any number of lookups, launches and
+changes from that single session, so a script touching dozens of entries pays for one key
+derivation. Changes are staged in memory and written once (atomically, see 'save_app_database')
+when the session ends, or earlier with 'save()'. The Click commands are thin wrappers around it.
+
+    from pykeypass.client import PyKeypassClient
+
+    with PyKeypassClient(password="...") as client:
+        for name in client.list():
+            url, key_file = client.path(name)
+        client.upsert("work", "S:/keepass/work.kdbx", "secret")
+        client.delete("old")
+        client.open_many(["work", "personal"])
+
+Without a password, read-only calls ask a running agent first (see 'pykeypass.agent'), then the
+key cache, and only then prompt for the password. Until something is changed, they stream the app
+database (see 'pykeypass.reader') instead of loading all of it. With the change journal turned on
+('PYKEYPASS_JOURNAL', see 'pykeypass.journal'), saves append the changed entries to the journal
+instead of writing the whole app database.
+"""
+import getpass
+from pathlib import Path
+
+from .agent import AgentUnavailable, agent_entries, agent_entry, agent_list
+from .completion import name_cache_enabled, store_names
+from .index import TAGS_PROPERTY, EntryIndex, split_tags
+from .journal import (
+    ChangeJournal,
+    JournalView,
+    compact_threshold,
+    entry_row,
+    journal_enabled,
+    journal_path,
+)
+from .keycache import cache_ttl, clear_key, load_key, reseed_header, store_key
+from .profiling import span
+from .reader import AppDatabaseReader, UnsupportedFormat
+from .scheduler import PRIORITY_PROPERTY, entry_priority
+
+
+def app_folder(test=False):
+    """The '.pykeypass' folder of 'path_selection', without printing it (e.g. for shell completion)."""
+    if test is False:
+        return Path.home() / ".pykeypass"
+    return Path(__file__).resolve().parent.parent.parent / "test" / ".pykeypass"
+
+
+def path_selection(test=False):
+    """Setup path variables for pykeypass
+
+    Normal Operation: pykeypass creates a '.pykeypass' folder in the user's home directory to
+    house the Keepass.exe and the app's Keepass database.
+    Testing Operation: Similar to nomral option, but the '.pykeypass' folder is created in the
+    'test' directory at the root of the application folder.
+
+    Args:
+        test (bool, optional): The test directory is set if 'test' is passed in as True. Defaults
+        to False.
+
+    Returns:
+        [multiple variables]: Returns all three path variables. Populates three comma separated
+        variables from the function.
+    """
+    with span("path_selection"):
+        pykeypass_folder = app_folder(test)
+        print(pykeypass_folder)
+        pykeypass_app = pykeypass_folder / "keepass.exe"
+        pykeypass_db = pykeypass_folder / "pykeepass.kdbx"
+    return pykeypass_folder, pykeypass_app, pykeypass_db
+
+
+def create_app_database(pykeypass_db, password, kdf=None):
+    """Create a new, empty pykeypass app database
+
+    Same as pykeepass' 'create_database', but the new database gets its own KDF salt and master
+    seed instead of the ones of the bundled template (see 'reseed_header').
+
+    Args:
+        pykeypass_db (Path): Location of the new app database.
+        password (str): pykeypass password.
+        kdf (KdfParameters, optional): Argon2 parameters (see 'pykeypass.kdf'). Defaults to the
+        ones of the pykeepass template.
+
+    Returns:
+        PyKeePass: The new database.
+    """
+    from pykeepass import PyKeePass
+    from pykeepass.pykeepass import BLANK_DATABASE_LOCATION, BLANK_DATABASE_PASSWORD
+
+    from .kdf import apply_kdf
+
+    kp = PyKeePass(BLANK_DATABASE_LOCATION, password=BLANK_DATABASE_PASSWORD)
+    if kdf is None:
+        reseed_header(kp)
+    else:
+        apply_kdf(kp, kdf)
+    kp.filename = pykeypass_db
+    kp.password = password
+    save_app_database(kp)
+    return kp
+
+
+def save_app_database(kp, transformed_key=None):
+    """Write the pykeypass app database atomically
+
+    The database is written to a temporary file next to it, flushed to disk and then moved over the
+    original with 'os.replace' (atomic on Windows and POSIX), so a crash or a full disk never leaves
+    a half-written app database behind.
+
+    Args:
+        kp (PyKeePass): Database to write to 'kp.filename'.
+        transformed_key (bytes, optional): Transformed key of the database. When given, the key
+        derivation is skipped; it must match the KDF parameters in the header. Defaults to None.
+    """
+    import os
+    import tempfile
+
+    pykeypass_db = Path(kp.filename)
+    with span("save"):
+        fd, db_tmp = tempfile.mkstemp(dir=pykeypass_db.parent, prefix=f".{pykeypass_db.stem}-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w+b") as db_file:
+                kp.save(db_file, transformed_key=transformed_key)
+                db_file.flush()
+                os.fsync(db_file.fileno())
+            os.replace(db_tmp, pykeypass_db)
+        except BaseException:
+            Path(db_tmp).unlink(missing_ok=True)
+            raise
+
+
+def unlock_app_database(
+    pykeypass_folder, pykeypass_db, prompt="pykeypass password: ", password=None, transformed_key=None, key_cache=True
+):
+    """Open the pykeypass app database, reusing a cached transformed key when possible
+
+    When the key cache is enabled ('PYKEYPASS_KEY_CACHE_TTL') and holds a key for the current
+    database header, the payload is decrypted without prompting and without running the KDF.
+    Otherwise the password is prompted for (unless given) and the resulting key is cached.
+
+    The key derivation and the payload parsing are done in two steps (the second one reusing the
+    transformed key of the first), so '--profile' can report them as separate 'unlock' and 'parse'
+    phases. Only the small outer header is read twice.
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the key cache.
+        pykeypass_db (Path): pykeypass app database.
+        prompt (str, optional): Password prompt. Defaults to "pykeypass password: ".
+        password (str, optional): pykeypass password. Prompted for when None.
+        transformed_key (bytes, optional): Transformed key already checked against the header (e.g. by
+        'read_app_database'). When given, neither the key cache nor the password is used.
+        key_cache (bool, optional): Read the transformed key from the key cache. Sessions that change
+        the app database pass False, so changes always need the password. Defaults to True.
+
+    Returns:
+        PyKeePass: The unlocked app database.
+    """
+    from pykeepass import PyKeePass
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    if transformed_key is not None:
+        with span("parse"):
+            return PyKeePass(pykeypass_db, transformed_key=transformed_key)
+    transformed_key = load_key(pykeypass_folder, pykeypass_db) if password is None and key_cache else None
+    if transformed_key is not None:
+        try:
+            with span("parse"):
+                return PyKeePass(pykeypass_db, transformed_key=transformed_key)
+        except pykeepass_exceptions.CredentialsError:
+            clear_key(pykeypass_folder)
+    if password is None:
+        password = getpass.getpass(prompt=prompt)
+    with span("unlock"):
+        # decrypt=False still runs the KDF, but stops before checking the key and reading the payload
+        transformed_key = PyKeePass(pykeypass_db, password=password, decrypt=False).transformed_key
+    with span("parse"):
+        kp = PyKeePass(pykeypass_db, transformed_key=transformed_key)
+    store_key(pykeypass_folder, pykeypass_db, kp.transformed_key)
+    return kp
+
+
+def read_app_database(pykeypass_folder, pykeypass_db, prompt="pykeypass password: ", password=None, key_cache=True):
+    """Open the pykeypass app database for streamed read-only lookups (see 'pykeypass.reader')
+
+    Same key handling as 'unlock_app_database' (key cache unless 'key_cache' is False, then
+    password), without parsing the payload up front: entries are read from the stream when they are
+    looked up.
+
+    Raises:
+        UnsupportedFormat: The app database cannot be streamed (raised before any key derivation).
+
+    Returns:
+        AppDatabaseReader: Reader checked against the key.
+    """
+    from pykeepass import PyKeePass
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    with span("parse"):
+        reader = AppDatabaseReader(pykeypass_db)
+    transformed_key = load_key(pykeypass_folder, pykeypass_db) if password is None and key_cache else None
+    if transformed_key is not None:
+        try:
+            return reader.unlock(transformed_key)
+        except pykeepass_exceptions.CredentialsError:
+            clear_key(pykeypass_folder)
+    if password is None:
+        password = getpass.getpass(prompt=prompt)
+    with span("unlock"):
+        transformed_key = PyKeePass(pykeypass_db, password=password, decrypt=False).transformed_key
+    reader.unlock(transformed_key)
+    store_key(pykeypass_folder, pykeypass_db, transformed_key)
+    return reader
+
+
+def database_entries(kp):
+    """Resolve every configured Keepass database entry from an unlocked app database
+
+    Each database managed by pykeypass lives in its own group, holding a single entry with the
+    same name (see 'keepass_manage'). The entries come from one pass over the already-parsed tree
+    (see 'EntryIndex'), so no further searches of the XML document are needed.
+
+    Args:
+        kp (PyKeePass): Unlocked pykeypass app database.
+
+    Returns:
+        list: (name, entry) tuples in database order. Groups without an entry (e.g. left behind by
+        an interrupted 'manage') are skipped.
+    """
+    return EntryIndex(kp).databases()
+
+
+def remove_database(kp, index, name):
+    """Delete the entry and group of a Keepass database from an unlocked app database (not saved)
+
+    Returns:
+        bool: False if 'name' was not configured.
+    """
+    entry = index.entry(name)
+    if entry is None and index.group(name) is None:
+        return False
+    if entry is not None:
+        kp.delete_entry(entry)
+    # also drops groups left empty by earlier versions of 'manage'
+    groups = kp.find_groups(name=name, group=kp.root_group, recursive=False)
+    for group in groups:
+        kp.delete_group(group)
+    index.remove(name)
+    return entry is not None or bool(groups)
+
+
+def apply_changes(kp, index, changes):
+    """Apply journal changes to an unlocked app database (nothing is saved)
+
+    Existing entries are updated in place, so they keep their place in database order.
+
+    Args:
+        kp (PyKeePass): Unlocked pykeypass app database.
+        index (EntryIndex): Index of 'kp'; kept up to date.
+        changes (dict): name: row (see 'pykeypass.journal.entry_row'), None for a deleted entry.
+    """
+    from .manifest import apply_manifest
+
+    for name, row in changes.items():
+        if row is None:
+            remove_database(kp, index, name)
+            continue
+        entry = index.entry(name)
+        if entry is None:
+            apply_manifest(kp, index, [row])
+            continue
+        entry.url = row["url"]
+        entry.password = row["password"]
+        properties = {"key": row["key"], TAGS_PROPERTY: ",".join(row["tags"]), PRIORITY_PROPERTY: row["priority"]}
+        for key, value in properties.items():
+            if value:
+                entry.set_custom_property(key, str(value))
+            elif entry.get_custom_property(key) is not None:
+                entry.delete_custom_property(key)
+        index.retag(name, row["tags"])
+
+
+def replay_journal(kp, index, pykeypass_db):
+    """Apply the journal of the app database (see 'pykeypass.journal') to the unlocked database
+
+    Returns:
+        ChangeJournal: The journal that was read ('size' 0 when there is none).
+    """
+    journal = ChangeJournal(journal_path(pykeypass_db), kp.transformed_key)
+    with span("journal"):
+        apply_changes(kp, index, journal.changes())
+    return journal
+
+
+def launch_entry(launcher, entry):
+    """Starts Keepass for a single database entry
+
+    Args:
+        launcher (Launcher): Launcher backend (see 'select_launcher').
+        entry (Entry): pykeypass app database entry holding the url, password and (optional) 'key'
+        custom property of the Keepass database to open.
+
+    Returns:
+        subprocess.Popen: The launched Keepass process (None for the stub launcher).
+    """
+    with span("launch", database=getattr(entry, "title", None)):
+        return launcher.start([entry])
+
+
+class AlreadyOpen(Exception):
+    """The database is already open in a Keepass process started by pykeypass
+
+    Args:
+        name (str): Entry name.
+        record (dict): Registry record of the process ('pid', 'start_time', 'started').
+    """
+
+    def __init__(self, name, record):
+        super().__init__(f"{name} is already open (pid {record['pid']})")
+        self.name = name
+        self.record = record
+
+
+class OpenResult:
+    """Outcome of opening one database with 'PyKeypassClient.open_many'
+
+    Args:
+        name (str): Entry name.
+        process (subprocess.Popen, optional): Started Keepass process (None for the stub launcher).
+        error (Exception, optional): Why the database was not opened (AlreadyOpen, KeyError, OSError).
+    """
+
+    def __init__(self, name, process=None, error=None):
+        self.name = name
+        self.process = process
+        self.error = error
+
+    @property
+    def ok(self):
+        """True if Keepass was started."""
+        return self.error is None
+
+
+class PyKeypassClient:
+    """One unlocked session of the pykeypass app database
+
+    Args:
+        password (str, optional): pykeypass password. When None, the agent and the key cache are
+        tried first and the password is prompted for only if the database must be unlocked.
+        pykeypass_folder (Path, optional): pykeypass folder. Defaults to the one of 'app_folder'.
+        launcher (Launcher, optional): Launcher backend for 'open' and 'open_many'. Defaults to
+        'PYKEYPASS_LAUNCHER' (see 'pykeypass.launchers').
+        use_agent (bool, optional): Ask a running agent for entries while the database is not
+        unlocked. Defaults to True.
+        prompt (str, optional): Password prompt. Defaults to "pykeypass password: ".
+        test (bool, optional): Use the test folder (see 'path_selection'). Defaults to False.
+        streaming (bool, optional): Answer read-only calls from a streaming reader until the
+        database is unlocked for a change (see 'pykeypass.reader'). Defaults to True.
+        journal (bool, optional): Save changes to the change journal instead of writing the whole
+        app database (see 'pykeypass.journal'). Defaults to 'PYKEYPASS_JOURNAL'.
+        key_cache (bool, optional): Read the transformed key from the key cache (see
+        'pykeypass.keycache'). Changes are never made with a cached key: before the first change, a
+        session that may have used it is reopened with the password. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        password=None,
+        pykeypass_folder=None,
+        launcher=None,
+        use_agent=True,
+        prompt="pykeypass password: ",
+        test=False,
+        streaming=True,
+        journal=None,
+        key_cache=True,
+    ):
+        if pykeypass_folder is None:
+            with span("path_selection"):
+                pykeypass_folder = app_folder(test)
+        self.pykeypass_folder = Path(pykeypass_folder)
+        self.pykeypass_app = self.pykeypass_folder / "keepass.exe"
+        self.pykeypass_db = self.pykeypass_folder / "pykeepass.kdbx"
+        self.password = password
+        self.use_agent = use_agent and password is None
+        self.prompt = prompt
+        self.streaming = streaming
+        self.journal = journal_enabled() if journal is None else journal
+        self.key_cache = key_cache
+        self._launcher = launcher
+        self._reader = None
+        self._journal = None
+        self._overlay = {}  # journal and session changes on top of the streaming reader
+        self._staged = {}  # changes not appended to the journal yet
+        self._kp = None
+        self._index = None
+        self._registry = None
+        self.dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.save()
+        self.close()
+
+    def unlock(self):
+        """Unlock the app database now (a no-op once it is unlocked)
+
+        The key of a streaming reader opened earlier in the session is reused, so the password is
+        never asked for twice. The journal is replayed on the unlocked database.
+        """
+        if self._kp is None:
+            transformed_key = None if self._reader is None else self._reader.transformed_key
+            self._kp = unlock_app_database(
+                self.pykeypass_folder,
+                self.pykeypass_db,
+                self.prompt,
+                self.password,
+                transformed_key,
+                key_cache=self.key_cache,
+            )
+            self._index = EntryIndex(self._kp)
+            if self._reader is None:
+                self._journal = replay_journal(self._kp, self._index, self.pykeypass_db)
+            else:
+                apply_changes(self._kp, self._index, self._overlay)
+            self._overlay = {}
+            self._reader = None
+
+    @property
+    def unlocked(self):
+        """True while the app database is unlocked (or open for streamed reads) in this session."""
+        return self._kp is not None or self._reader is not None
+
+    @property
+    def kp(self):
+        """The unlocked app database (unlocked on first use)."""
+        self.unlock()
+        return self._kp
+
+    @property
+    def index(self):
+        """EntryIndex of the unlocked app database."""
+        self.unlock()
+        return self._index
+
+    @property
+    def launcher(self):
+        """Launcher backend used by 'open' and 'open_many'."""
+        if self._launcher is None:
+            import os
+
+            from .launchers import LAUNCHER_ENV, launcher_for
+
+            self._launcher = launcher_for(os.environ.get(LAUNCHER_ENV, "auto"), self.pykeypass_app)
+        return self._launcher
+
+    @launcher.setter
+    def launcher(self, launcher):
+        self._launcher = launcher
+
+    @property
+    def registry(self):
+        """ProcessRegistry of the Keepass processes started from this pykeypass folder."""
+        if self._registry is None:
+            from .registry import ProcessRegistry
+
+            self._registry = ProcessRegistry(self.pykeypass_folder)
+        return self._registry
+
+    def _from_agent(self, call, *args):
+        """Ask the agent while the database is not unlocked; None when it cannot answer."""
+        if self._kp is not None or not self.use_agent:
+            return None
+        try:
+            return (call(self.pykeypass_folder, *args),)
+        except AgentUnavailable:
+            self.use_agent = False
+            return None
+
+    def _lookup(self):
+        """Where read-only calls find entries: the streaming reader until the database is unlocked
+        (falling back to unlocking it for formats the reader does not handle), else the index."""
+        if self._kp is None and self.streaming:
+            if self._reader is None:
+                try:
+                    self._reader = read_app_database(
+                        self.pykeypass_folder, self.pykeypass_db, self.prompt, self.password, self.key_cache
+                    )
+                except UnsupportedFormat:
+                    self.streaming = False
+                    return self.index
+                self._journal = ChangeJournal(journal_path(self.pykeypass_db), self._reader.transformed_key)
+                with span("journal"):
+                    self._overlay = self._journal.changes()
+            return JournalView(self._reader, self._overlay) if self._overlay else self._reader
+        return self.index
+
+    def list(self):
+        """Names of the configured Keepass databases."""
+        answer = self._from_agent(agent_list)
+        names = answer[0] if answer is not None else self._lookup().names()
+        store_names(self.pykeypass_folder, names)
+        return names
+
+    def entry(self, name):
+        """Entry of the Keepass database 'name', None if it is not configured."""
+        answer = self._from_agent(agent_entry, name)
+        return answer[0] if answer is not None else self._lookup().entry(name)
+
+    def databases(self, names=None):
+        """(name, entry) tuples of the requested (default: all) databases; unknown names get None."""
+        if names:
+            return [(name, self.entry(name)) for name in names]
+        answer = self._from_agent(agent_entries)
+        return answer[0] if answer is not None else self._lookup().databases()
+
+    def __contains__(self, name):
+        return self.entry(name) is not None
+
+    def path(self, name):
+        """Location of a Keepass database
+
+        Raises:
+            KeyError: 'name' is not configured.
+
+        Returns:
+            tuple: (url, key file or None).
+        """
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry.url, entry.get_custom_property("key") or None
+
+    def open(self, name, force=False):
+        """Launch Keepass for one database and record the process in the registry
+
+        Args:
+            name (str): Entry name.
+            force (bool, optional): Launch even if pykeypass already opened the database in a running
+            Keepass. Defaults to False.
+
+        Raises:
+            KeyError: 'name' is not configured.
+            AlreadyOpen: The database is already open (unless 'force').
+            OSError: Keepass could not be started.
+
+        Returns:
+            subprocess.Popen: The Keepass process (None for the stub launcher).
+        """
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return self.launch(name, entry, force)
+
+    def launch(self, name, entry, force=False):
+        """Launch Keepass for an entry (e.g. a copy pointing at a cached file, see 'pykeypass.cache')
+
+        Same as 'open', for an entry that does not have to come from the app database.
+        """
+        record = None if force else self.registry.running(name)
+        if record is not None:
+            raise AlreadyOpen(name, record)
+        process = launch_entry(self.launcher, entry)
+        if process is not None:
+            self.registry.add(name, process.pid)
+        return process
+
+    def open_many(self, names=None, force=False, workers=4):
+        """Launch Keepass for several databases from a bounded thread pool
+
+        Args:
+            names (list, optional): Entry names. Defaults to every configured database.
+            force (bool, optional): See 'open'. Defaults to False.
+            workers (int, optional): Databases launched at the same time. Defaults to 4.
+
+        Returns:
+            list: OpenResult per database, in the order of 'names' (database order by default).
+        """
+        return self.launch_many(self.databases(names), force, workers)
+
+    def launch_result(self, name, entry, force=False):
+        """Same as 'launch', with the outcome (or error) returned as an OpenResult instead of raised."""
+        if entry is None:
+            return OpenResult(name, error=KeyError(name))
+        try:
+            return OpenResult(name, process=self.launch(name, entry, force))
+        except (AlreadyOpen, OSError, ValueError) as e:
+            return OpenResult(name, error=e)
+
+    def launch_many(self, databases, force=False, workers=4):
+        """Same as 'open_many', for (name, entry) tuples (entry None for an unknown name)."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not databases:
+            return []
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            return list(executor.map(lambda database: self.launch_result(*database, force), databases))
+
+    def _for_change(self):
+        """Changes are never made with a key from the key cache: a session that may have read it is
+        reopened (on next use) with the password before its first change."""
+        if self.key_cache:
+            self.key_cache = False
+            if self.password is None and cache_ttl() and self.unlocked:
+                self.close()
+
+    def _stage(self, name, row):
+        """Journal mode: record a change for the next append, and apply it to the session."""
+        if self._kp is not None:
+            apply_changes(self._kp, self._index, {name: row})
+        else:
+            self._overlay[name] = row
+        self._staged[name] = row
+        self.dirty = True
+
+    def _journal_entry(self, name):
+        entry = self._lookup().entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry_row(name, entry)
+
+    def upsert(self, name, url, password, key=None, tags=None, priority=None):
+        """Add a Keepass database, or replace the one with the same name (saved by 'save')
+
+        Args:
+            name (str): Entry name.
+            url (str): Location of the Keepass database.
+            password (str): Password of the Keepass database.
+            key (str, optional): Key file of the Keepass database. Defaults to None.
+            tags (list, optional): Tags (launch profiles) of the database. Defaults to None.
+            priority (int, optional): Launch priority of the database, higher starts first. Defaults to
+            None (0).
+
+        Returns:
+            str: 'added' or 'replaced'.
+        """
+        from .manifest import apply_manifest
+
+        self._for_change()
+        row = {
+            "name": name,
+            "url": url,
+            "password": password,
+            "key": key,
+            "tags": list(tags or []),
+            "priority": priority,
+        }
+        if self.journal:
+            replaced = self._lookup().entry(name) is not None
+            self._stage(name, row)
+            return "replaced" if replaced else "added"
+        replaced = remove_database(self.kp, self.index, name)
+        apply_manifest(self.kp, self.index, [row])
+        self.dirty = True
+        return "replaced" if replaced else "added"
+
+    def delete(self, name):
+        """Remove a Keepass database (saved by 'save')
+
+        Returns:
+            bool: False if 'name' was not configured.
+        """
+        self._for_change()
+        if self.journal:
+            if self._lookup().entry(name) is None:
+                return False
+            self._stage(name, None)
+            return True
+        if not remove_database(self.kp, self.index, name):
+            return False
+        self.dirty = True
+        return True
+
+    def tags(self, name):
+        """Tags of the Keepass database 'name'
+
+        Raises:
+            KeyError: 'name' is not configured.
+        """
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return split_tags(entry.get_custom_property(TAGS_PROPERTY))
+
+    def tagged(self, tag):
+        """Names of the Keepass databases tagged 'tag' (members of the launch profile 'tag')."""
+        answer = self._from_agent(agent_entries)
+        if answer is None:
+            return self._lookup().tagged(tag)
+        return [name for name, entry in answer[0] if tag in split_tags(entry.get_custom_property(TAGS_PROPERTY))]
+
+    def set_tags(self, name, tags):
+        """Replace the tags of a Keepass database (saved by 'save')
+
+        Args:
+            name (str): Entry name.
+            tags (list): New tags; an empty list removes them all.
+
+        Raises:
+            KeyError: 'name' is not configured.
+        """
+        self._for_change()
+        tags = split_tags(",".join(tags))
+        if self.journal:
+            self._stage(name, {**self._journal_entry(name), "tags": tags})
+            return
+        entry = self.index.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        if tags:
+            entry.set_custom_property(TAGS_PROPERTY, ",".join(tags))
+        elif entry.get_custom_property(TAGS_PROPERTY) is not None:
+            entry.delete_custom_property(TAGS_PROPERTY)
+        self.index.retag(name, tags)
+        self.dirty = True
+
+    def priority(self, name):
+        """Launch priority of the Keepass database 'name' (0 when unset)
+
+        Raises:
+            KeyError: 'name' is not configured.
+        """
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry_priority(entry)
+
+    def set_priority(self, name, priority):
+        """Set the launch priority of a Keepass database (saved by 'save')
+
+        Args:
+            name (str): Entry name.
+            priority (int): New priority, higher starts first; 0 removes it.
+
+        Raises:
+            KeyError: 'name' is not configured.
+        """
+        self._for_change()
+        if self.journal:
+            self._stage(name, {**self._journal_entry(name), "priority": priority or None})
+            return
+        entry = self.index.entry(name)
+        if entry is None:
+            raise KeyError(name)
+        if priority:
+            entry.set_custom_property(PRIORITY_PROPERTY, str(priority))
+        elif entry.get_custom_property(PRIORITY_PROPERTY) is not None:
+            entry.delete_custom_property(PRIORITY_PROPERTY)
+        self.dirty = True
+
+    def save(self):
+        """Write the staged changes, if any
+
+        In journal mode they are appended to the journal as one record, and the journal is
+        compacted once it passes 'compact_threshold'. Otherwise the app database is written in a
+        single atomic save (which also folds in the journal).
+        """
+        if not self.dirty:
+            return
+        if not self.journal:
+            self.compact()
+            return
+        with span("journal"):
+            size = self._journal.append(self._staged)
+        self._staged = {}
+        self.dirty = False
+        if size >= compact_threshold():
+            self.compact()
+        elif name_cache_enabled():
+            store_names(self.pykeypass_folder, self._lookup().names())
+
+    def compact(self):
+        """Write the app database in a single atomic save, with the journal and the staged changes
+        folded in, then remove the journal
+
+        Returns:
+            int: Number of journaled changes folded in (0 when there was no journal).
+        """
+        self._for_change()
+        self.unlock()
+        journaled = self._journal.changes_count if self._journal is not None else 0
+        if not (journaled or self.dirty):
+            return 0
+        save_app_database(self.kp, transformed_key=self.kp.transformed_key)
+        if self._journal is not None:
+            self._journal.remove()
+        self._staged = {}
+        self.dirty = False
+        store_names(self.pykeypass_folder, self.index.names())
+        return journaled
+
+    def close(self):
+        """Forget the unlocked database (staged changes that were not saved are lost)."""
+        self._kp = None
+        self._index = None
+        self._reader = None
+        self._journal = None
+        self._overlay = {}
+        self._staged = {}
+        self.dirty = False
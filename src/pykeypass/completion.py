@@ -0,0 +1,105 @@
+"""Shell completion of Keepass database names
+
+Completing 'pykeypass open <TAB>' must not unlock the app database: a key derivation on every
+keystroke would make completion unusable. Names are served from, in this order:
+
+- the name cache: when 'PYKEYPASS_NAME_CACHE' is set to 1, '.pykeypass/names.json' keeps the names
+  (and nothing else) of the configured databases. 'pykeypass list' and every save of the app
+  database (e.g. 'pykeypass manage') refresh it. The names are not secret, but the file is still
+  readable by the current user only.
+- a running, unlocked agent (see 'pykeypass.agent').
+
+Anything else completes to nothing. Reading the cache is a single small JSON file, so completing
+thousands of names stays far below the time it takes to start Python.
+"""
+import json
+import os
+import time
+
+NAME_CACHE_ENV = "PYKEYPASS_NAME_CACHE"
+
+
+def name_cache_enabled():
+    """True if the name cache is turned on ('PYKEYPASS_NAME_CACHE=1')."""
+    return os.environ.get(NAME_CACHE_ENV, "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _names_path(pykeypass_folder):
+    return pykeypass_folder / "names.json"
+
+
+def clear_names(pykeypass_folder):
+    """Remove the name cache."""
+    _names_path(pykeypass_folder).unlink(missing_ok=True)
+
+
+def store_names(pykeypass_folder, names):
+    """Replace the name cache with 'names' (removes it when the cache is disabled)
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the cache.
+        names (list): Names of the configured Keepass databases.
+    """
+    if not name_cache_enabled():
+        clear_names(pykeypass_folder)
+        return
+    names_path = _names_path(pykeypass_folder)
+    names_tmp = names_path.with_suffix(".tmp")
+    try:
+        fd = os.open(names_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as names_file:
+            json.dump({"updated": time.time(), "names": sorted(names)}, names_file)
+        os.replace(names_tmp, names_path)
+    except OSError:
+        pass  # completion falls back to the agent, the command itself must not fail
+
+
+def load_names(pykeypass_folder):
+    """Names in the name cache, None when it is disabled, missing or unreadable."""
+    if not name_cache_enabled():
+        return None
+    try:
+        names = json.loads(_names_path(pykeypass_folder).read_text())["names"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return names if isinstance(names, list) else None
+
+
+def _agent_names(pykeypass_folder):
+    """Names served by a running agent, None when there is none (no connection is tried without one)."""
+    from .agent import AgentUnavailable, agent_address, agent_list
+
+    address, family = agent_address(pykeypass_folder)
+    if family == "AF_UNIX" and not os.path.exists(address):
+        return None
+    if not (pykeypass_folder / "agent.key").exists():
+        return None
+    try:
+        names = agent_list(pykeypass_folder)
+    except AgentUnavailable:
+        return None
+    store_names(pykeypass_folder, names)
+    return names
+
+
+def database_names(pykeypass_folder):
+    """Names to complete: the name cache, else a running agent, else none."""
+    names = load_names(pykeypass_folder)
+    if names is None:
+        names = _agent_names(pykeypass_folder)
+    return names or []
+
+
+def complete_database(ctx, param, incomplete):
+    """Click 'shell_complete' callback of the database arguments
+
+    Never unlocks the app database and never prints: the command line is only partly parsed, and
+    anything written to stdout would end up in the shell's completion list.
+
+    Returns:
+        list: Configured names starting with 'incomplete', sorted.
+    """
+    from .client import app_folder
+
+    pykeypass_folder = app_folder(bool(ctx.params.get("test")))
+    return sorted(name for name in database_names(pykeypass_folder) if name.startswith(incomplete))
@@ -0,0 +1,157 @@
+"""In-memory index of the pykeypass app database
+
+pykeepass looks entries up with an XPath query over the whole document ('find_entries',
+'find_groups'), so every lookup costs O(database size). The index walks the parsed tree once, right
+after the database is unlocked, and maps entry titles and group names to their XML elements. Every
+later lookup is a dictionary access.
+
+Each Keepass database managed by pykeypass is a group holding a single entry with the same name
+(see 'keepass_manage'); both names resolve to that entry.
+
+Entries can carry tags (launch profiles such as 'work'), kept as a comma separated 'tags' custom
+property. The index also maps every tag to the databases that carry it, so 'pykeypass open
+--profile work' and 'pykeypass list --tag work' never search the tree.
+"""
+from .profiling import span
+
+RECYCLE_BIN = "Recycle Bin"
+TAGS_PROPERTY = "tags"
+
+
+def split_tags(value):
+    """Tags of a 'tags' property value (comma or semicolon separated), without blanks or duplicates."""
+    if not value:
+        return []
+    tags = (tag.strip() for tag in value.replace(";", ",").split(","))
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+
+def _entry_string(entry_element, key):
+    for string in entry_element.iterfind("String"):
+        if string.findtext("Key") == key:
+            return string.findtext("Value")
+    return None
+
+
+class EntryIndex:
+    """Title and group name index of an unlocked app database
+
+    Args:
+        kp (PyKeePass): Unlocked pykeypass app database.
+    """
+
+    def __init__(self, kp):
+        self.kp = kp
+        with span("lookup"):
+            self.rebuild()
+
+    def rebuild(self):
+        """Re-read every group and entry of the database
+
+        Two XPath passes over the tree (group names, entry titles) replace the per-lookup scans.
+        History entries are skipped because their parent is an 'History' element, not a group.
+        """
+        self._titles = {}
+        self._groups = {}
+        self._databases = {}
+        self._tags = {}
+        root_group = self.kp.tree.find("Root/Group")
+        if root_group is None:
+            return
+        recycle_bins = set(root_group.xpath(f"Group[Name='{RECYCLE_BIN}']"))
+        group_names = {}
+        for name_element in root_group.xpath(".//Group/Name"):
+            group_element = name_element.getparent()
+            if recycle_bins and (
+                group_element in recycle_bins
+                or any(ancestor in recycle_bins for ancestor in group_element.iterancestors("Group"))
+            ):
+                continue
+            group_names[group_element] = name_element.text
+            self._groups.setdefault(name_element.text, group_element)
+        for value_element in root_group.xpath(".//Group/Entry/String[Key='Title']/Value"):
+            entry_element = value_element.getparent().getparent()
+            group_name = group_names.get(entry_element.getparent())
+            if group_name is None:
+                continue
+            self._titles.setdefault(value_element.text, entry_element)
+            self._databases.setdefault(group_name, entry_element)
+        for name, entry_element in self._databases.items():
+            self._tag(name, _entry_string(entry_element, TAGS_PROPERTY))
+
+    def _tag(self, name, value):
+        for tag in split_tags(value):
+            self._tags.setdefault(tag, []).append(name)
+
+    def _untag(self, name):
+        for tag, names in list(self._tags.items()):
+            if name in names:
+                names.remove(name)
+                if not names:
+                    del self._tags[tag]
+
+    def _add_group(self, name, group_element):
+        self._groups.setdefault(name, group_element)
+        entry_elements = group_element.findall("Entry")
+        for entry_element in entry_elements:
+            self._titles.setdefault(_entry_string(entry_element, "Title"), entry_element)
+        if entry_elements and name not in self._databases:
+            self._databases[name] = entry_elements[0]
+            self._tag(name, _entry_string(entry_elements[0], TAGS_PROPERTY))
+
+    def entry(self, name):
+        """Entry with the title 'name' (or first entry of the group 'name'), None if missing."""
+        from pykeepass.entry import Entry
+
+        element = self._titles.get(name)
+        if element is None:
+            element = self._databases.get(name)
+        return None if element is None else Entry(element=element, kp=self.kp)
+
+    def group(self, name):
+        """Group named 'name', None if missing."""
+        from pykeepass.group import Group
+
+        element = self._groups.get(name)
+        return None if element is None else Group(element=element, kp=self.kp)
+
+    def names(self):
+        """Names of the configured Keepass databases, in database order."""
+        return list(self._databases)
+
+    def databases(self):
+        """(name, entry) tuples of the configured Keepass databases, in database order."""
+        from pykeepass.entry import Entry
+
+        return [(name, Entry(element=element, kp=self.kp)) for name, element in self._databases.items()]
+
+    def __contains__(self, name):
+        return name in self._titles or name in self._databases
+
+    def __len__(self):
+        return len(self._databases)
+
+    def add(self, group):
+        """Index a group (and its entries) added by 'manage'."""
+        self._add_group(group.name, group._element)
+
+    def remove(self, name):
+        """Drop 'name' after 'manage' deleted its entry and group."""
+        self._titles.pop(name, None)
+        self._groups.pop(name, None)
+        self._databases.pop(name, None)
+        self._untag(name)
+
+    def retag(self, name, tags):
+        """Replace the indexed tags of 'name' after its 'tags' property changed."""
+        self._untag(name)
+        if name in self._databases:
+            self._tag(name, ",".join(tags))
+
+    def tagged(self, tag):
+        """Names of the databases tagged 'tag' (in the order they were indexed)."""
+        return list(self._tags.get(tag, ()))
+
+    def tags(self):
+        """Every tag with the names of its databases, sorted by tag."""
+        return {tag: list(self._tags[tag]) for tag in sorted(self._tags)}
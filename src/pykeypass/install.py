@@ -0,0 +1,177 @@
+"""Install the bundled KeePass 2.x executable into the pykeypass folder ('pykeypass setup')
+
+The executable ships inside the package and is found through 'importlib.resources', so setup works
+from any directory (and from a zipped install). Installs are content-addressed: the SHA-256 of the
+installed executable is kept in '.pykeypass/install.json', and setup only replaces the executable
+when its content differs from the bundled one (e.g. after upgrading pykeypass).
+
+Re-running setup is cheap: each hash is stored with the size and modification time of the file it
+was computed from, and a file is only hashed again once those change.
+
+A new executable is installed as a hard link to the bundled file when both are on the same file
+system (no copy at all), else as a reflink (copy-on-write clone, Linux only), else as a streamed
+copy. It is always written to a temporary file first and then moved over the old executable, so
+an interrupted install never leaves half an executable behind.
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+MANIFEST_NAME = "install.json"
+CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+INSTALLED = "installed"
+UPGRADED = "upgraded"
+UP_TO_DATE = "up to date"
+
+
+def bundled_keepass():
+    """The KeePass 2.x executable shipped with pykeypass (an importlib.resources Traversable)."""
+    from importlib import resources
+
+    return resources.files(__package__) / "thirdparty" / "keepass_portable" / "KeePass.exe"
+
+
+def package_version():
+    """Installed pykeypass version, None when running from a source tree."""
+    from importlib import metadata
+
+    try:
+        return metadata.version(__package__)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in CHUNK_SIZE blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _known_digest(record, path, fingerprint):
+    """Digest from a manifest record, if it was computed from the file as it is now."""
+    if record and record.get("path") == str(path) and record.get("fingerprint") == fingerprint:
+        return record.get("sha256")
+    return None
+
+
+def load_install_manifest(pykeypass_folder):
+    """Install manifest of a pykeypass folder ({} when there is none or it is unreadable)."""
+    try:
+        manifest = json.loads((pykeypass_folder / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _save_install_manifest(pykeypass_folder, manifest):
+    manifest_path = pykeypass_folder / MANIFEST_NAME
+    manifest_tmp = manifest_path.with_suffix(".tmp")
+    manifest_tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(manifest_tmp, manifest_path)
+
+
+def _reflink(source, target):
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks are only supported on Linux")
+    import fcntl
+
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+
+
+def _copy(source, target):
+    import shutil
+
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+        target_file.flush()
+        os.fsync(target_file.fileno())
+
+
+def place_file(source, target):
+    """Put a copy of 'source' at 'target', as cheaply as the file system allows
+
+    Args:
+        source (Path): File to install.
+        target (Path): Destination; replaced atomically if it exists.
+
+    Returns:
+        str: How the file was installed: 'hardlink', 'reflink' or 'copy'.
+    """
+    target_tmp = target.with_name(f".{target.name}.tmp")
+    methods = (("hardlink", os.link), ("reflink", _reflink), ("copy", _copy))
+    for method, install in methods:
+        target_tmp.unlink(missing_ok=True)
+        try:
+            install(source, target_tmp)
+        except OSError:
+            if method == "copy":
+                target_tmp.unlink(missing_ok=True)
+                raise
+            continue
+        break
+    os.replace(target_tmp, target)
+    return method
+
+
+def install_keepass(pykeypass_folder, pykeypass_app):
+    """Install (or upgrade) the bundled KeePass executable unless the installed one is identical
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the install manifest (created if needed).
+        pykeypass_app (Path): Where the executable is installed.
+
+    Raises:
+        FileNotFoundError: The bundled executable is missing from the package.
+
+    Returns:
+        tuple: (outcome, method): INSTALLED, UPGRADED or UP_TO_DATE and 'hardlink', 'reflink' or
+        'copy' (the method of the earlier install when up to date, None if unknown).
+    """
+    from importlib import resources
+
+    pykeypass_folder.mkdir(parents=True, exist_ok=True)
+    manifest = load_install_manifest(pykeypass_folder)
+    with resources.as_file(bundled_keepass()) as source:
+        source_fingerprint = _fingerprint(source)
+        source_digest = _known_digest(manifest.get("bundled"), source, source_fingerprint) or file_digest(source)
+        installed = manifest.get("installed")
+        try:
+            app_fingerprint = _fingerprint(pykeypass_app)
+        except FileNotFoundError:
+            app_digest = None
+        else:
+            app_digest = _known_digest(installed, pykeypass_app, app_fingerprint) or file_digest(pykeypass_app)
+        if app_digest == source_digest:
+            outcome = UP_TO_DATE
+            method = (installed or {}).get("method")
+        else:
+            outcome = INSTALLED if app_digest is None else UPGRADED
+            method = place_file(source, pykeypass_app)
+            app_fingerprint = _fingerprint(pykeypass_app)
+        updated = {
+            "version": package_version(),
+            "bundled": {"path": str(source), "fingerprint": source_fingerprint, "sha256": source_digest},
+            "installed": {
+                "path": str(pykeypass_app),
+                "fingerprint": app_fingerprint,
+                "sha256": source_digest,
+                "method": method,
+                "installed": (installed or {}).get("installed") if outcome == UP_TO_DATE else time.time(),
+            },
+        }
+    if updated != manifest:
+        _save_install_manifest(pykeypass_folder, updated)
+    return outcome, method
@@ -0,0 +1,331 @@
+"""Append-only change journal of the pykeypass app database
+
+Saving the app database re-serializes, recompresses and re-encrypts all of it, even when a single
+entry changed. When 'PYKEYPASS_JOURNAL' is set to 1, saves append the changed entries to
+'pykeepass.journal' (next to 'pykeepass.kdbx') instead, so a save costs O(change):
+
+- every save appends one record: the staged changes (name: full entry row, or None for a
+  deletion), encrypted and authenticated with ChaCha20-Poly1305 under a key derived from the
+  transformed key of the app database;
+- the journal is replayed on load: streamed lookups see it through 'JournalView', an unlocked
+  database gets its changes applied in memory (see 'pykeypass.client.apply_changes');
+- 'pykeypass compact' folds the journal into the app database (one atomic save) and removes it,
+  and so does the first save after the journal passes 'PYKEYPASS_JOURNAL_COMPACT_KB' kilobytes
+  (default DEFAULT_COMPACT_KB).
+
+Records hold the whole state of an entry, so replaying one twice is harmless: a crash between the
+save of a compaction and the removal of the journal only replays changes that are already saved.
+Like a write-ahead log, the journal ends at its first record that is incomplete or fails its
+authentication (e.g. torn by a crash); the next append overwrites it. A journal written with another
+key (e.g. for a database that was since re-created) is ignored and replaced by the next append.
+Journals can be read without the journal turned on, so turning it off loses nothing: the next save
+writes the app database and removes the journal.
+
+Appending to and removing the journal take an exclusive lock on it ('fcntl.flock', or
+'msvcrt.locking' on Windows), so concurrent saves of several processes never overwrite each other's
+records. Reads take no lock: a record that is still being written ends the journal like a torn one.
+"""
+import hashlib
+import hmac
+import json
+import os
+import struct
+from contextlib import contextmanager
+
+from .index import TAGS_PROPERTY, split_tags
+from .scheduler import PRIORITY_PROPERTY, entry_priority
+
+JOURNAL_ENV = "PYKEYPASS_JOURNAL"
+COMPACT_ENV = "PYKEYPASS_JOURNAL_COMPACT_KB"
+DEFAULT_COMPACT_KB = 1024
+
+MAGIC = b"PKPJ\x01"
+SALT_SIZE = 16
+CHECK_SIZE = 32
+HEADER_SIZE = len(MAGIC) + SALT_SIZE + CHECK_SIZE
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# Windows locks are mandatory: lock a byte far past the end of any journal, so reads are not blocked
+LOCK_OFFSET = 2**31 - 2
+
+
+def journal_enabled():
+    """True if saves go to the journal ('PYKEYPASS_JOURNAL=1')."""
+    return os.environ.get(JOURNAL_ENV, "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def compact_threshold():
+    """Journal size in bytes from which a save compacts it ('PYKEYPASS_JOURNAL_COMPACT_KB')."""
+    try:
+        return max(int(os.environ.get(COMPACT_ENV, DEFAULT_COMPACT_KB)), 0) * 1024
+    except ValueError:
+        return DEFAULT_COMPACT_KB * 1024
+
+
+def journal_path(pykeypass_db):
+    """Journal of an app database ('pykeepass.kdbx' -> 'pykeepass.journal')."""
+    return pykeypass_db.with_suffix(".journal")
+
+
+def clear_journal(pykeypass_db):
+    """Remove the journal of an app database (e.g. when 'pykeypass setup' re-creates it)."""
+    journal_path(pykeypass_db).unlink(missing_ok=True)
+
+
+def entry_row(name, entry):
+    """Journal row (the fields written by 'pykeypass manage') of an app database entry."""
+    return {
+        "name": name,
+        "url": entry.url,
+        "password": entry.password,
+        "key": entry.get_custom_property("key") or None,
+        "tags": split_tags(entry.get_custom_property(TAGS_PROPERTY)),
+        "priority": entry_priority(entry) or None,
+    }
+
+
+def row_entry(row):
+    """Read-only entry of a journal row (same attributes as the entries of the other lookups)."""
+    from .agent import AgentEntry
+
+    custom_properties = {"key": row["key"], TAGS_PROPERTY: ",".join(row["tags"]), PRIORITY_PROPERTY: row["priority"]}
+    custom_properties = {key: str(value) for key, value in custom_properties.items() if value}
+    return AgentEntry(row["name"], row["url"], row["password"], custom_properties)
+
+
+def _lock(fd):
+    if os.name == "nt":
+        import msvcrt
+
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # retries for 10 seconds, then raises OSError
+        os.lseek(fd, 0, os.SEEK_SET)
+    else:
+        import fcntl
+
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _unlock(fd):
+    if os.name == "nt":
+        import msvcrt
+
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked(path, create=True):
+    """Open 'path' for reading and writing ('r+b'), holding an exclusive lock on it until the block ends
+
+    Raises:
+        FileNotFoundError: 'path' does not exist (and not 'create').
+    """
+    flags = os.O_RDWR | getattr(os, "O_BINARY", 0) | (os.O_CREAT if create else 0)
+    while True:
+        fd = os.open(path, flags, 0o600)
+        try:
+            _lock(fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        if os.name == "nt" or os.fstat(fd).st_nlink:
+            break
+        os.close(fd)  # removed while waiting for the lock (see 'ChangeJournal.remove'): open it again
+    with os.fdopen(fd, "r+b") as locked_file:
+        try:
+            yield locked_file
+        finally:
+            locked_file.flush()
+            _unlock(fd)
+
+
+class ChangeJournal:
+    """Journal file of the app database
+
+    Args:
+        path (Path): Journal file (see 'journal_path').
+        transformed_key (bytes): Transformed key of the app database.
+    """
+
+    def __init__(self, path, transformed_key):
+        self.path = path
+        self.transformed_key = transformed_key
+        self.size = 0  # end of the last valid record, 0 when there is no (valid) journal
+        self.records = 0
+        self.changes_count = 0
+        self._salt = None
+        self._key = None
+
+    def _derive(self, salt):
+        key = hmac.new(self.transformed_key, b"pykeypass journal" + salt, hashlib.sha256).digest()
+        return key, hmac.new(key, MAGIC + salt, hashlib.sha256).digest()
+
+    def _load(self, data):
+        """Read the valid part of the journal; returns its changes in journal order."""
+        from Cryptodome.Cipher import ChaCha20_Poly1305
+
+        self.size = self.records = self.changes_count = 0
+        changes = {}
+        if len(data) < HEADER_SIZE or not data.startswith(MAGIC):
+            return changes
+        salt = data[len(MAGIC):len(MAGIC) + SALT_SIZE]
+        key, check = self._derive(salt)
+        if not hmac.compare_digest(check, data[len(MAGIC) + SALT_SIZE:HEADER_SIZE]):
+            return changes
+        self._salt, self._key = salt, key
+        offset = HEADER_SIZE
+        while offset + 4 <= len(data):
+            (length,) = struct.unpack("<I", data[offset:offset + 4])
+            end = offset + 4 + length
+            if length < NONCE_SIZE + TAG_SIZE or end > len(data):
+                break
+            record = data[offset + 4:end]
+            cipher = ChaCha20_Poly1305.new(key=key, nonce=record[:NONCE_SIZE])
+            cipher.update(salt + struct.pack("<Q", self.records))
+            try:
+                plaintext = cipher.decrypt_and_verify(record[NONCE_SIZE:-TAG_SIZE], record[-TAG_SIZE:])
+                record_changes = json.loads(plaintext)
+            except ValueError:
+                break
+            for name, row in record_changes:
+                changes[name] = row
+            self.records += 1
+            self.changes_count += len(record_changes)
+            offset = end
+        self.size = offset
+        return changes
+
+    def changes(self):
+        """Changes recorded in the journal: name: row (None for a deleted entry), in journal order."""
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        return self._load(data)
+
+    def _changed(self, journal_file):
+        """True if the locked journal is not the one seen last (appended to, removed or re-created)."""
+        if os.fstat(journal_file.fileno()).st_size != self.size:
+            return True
+        if not self.size:
+            return False
+        journal_file.seek(len(MAGIC))
+        return journal_file.read(SALT_SIZE) != self._salt
+
+    def append(self, changes):
+        """Append one record with 'changes' (name: row or None), flushed to disk
+
+        Only the new record is written, under an exclusive lock on the journal. The journal is read
+        again first if it is not the one seen last (another process appended to it or removed it).
+
+        Returns:
+            int: Size of the journal in bytes.
+        """
+        import secrets
+
+        from Cryptodome.Cipher import ChaCha20_Poly1305
+
+        with _locked(self.path) as journal_file:
+            if self._changed(journal_file):
+                journal_file.seek(0)
+                self._load(journal_file.read())
+            if not self.size:
+                self._salt = secrets.token_bytes(SALT_SIZE)
+                self._key, check = self._derive(self._salt)
+                journal_file.seek(0)
+                journal_file.write(MAGIC + self._salt + check)
+                self.size = HEADER_SIZE
+            nonce = secrets.token_bytes(NONCE_SIZE)
+            cipher = ChaCha20_Poly1305.new(key=self._key, nonce=nonce)
+            cipher.update(self._salt + struct.pack("<Q", self.records))
+            ciphertext, tag = cipher.encrypt_and_digest(json.dumps(list(changes.items())).encode("utf-8"))
+            record = nonce + ciphertext + tag
+            journal_file.seek(self.size)
+            journal_file.truncate()  # drops a torn record left behind by a crash
+            journal_file.write(struct.pack("<I", len(record)) + record)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.size += 4 + len(record)
+        self.records += 1
+        self.changes_count += len(changes)
+        return self.size
+
+    def remove(self):
+        """Remove the journal once the app database holds its changes
+
+        A journal that changed since it was last read or written (another process appended to it)
+        is kept: replaying changes that are already saved is harmless. Otherwise it is emptied under
+        the lock, so an append waiting for it starts a new journal, and then removed. Windows cannot
+        remove a file that is open: there the empty journal is removed once the lock is released,
+        and left in place (it holds no changes) while another process has it open.
+        """
+        emptied = False
+        try:
+            with _locked(self.path, create=False) as journal_file:
+                if not self._changed(journal_file):
+                    journal_file.truncate(0)
+                    emptied = True
+                    if os.name != "nt":
+                        self.path.unlink()
+        except FileNotFoundError:
+            pass
+        if emptied and os.name == "nt":
+            try:
+                if not self.path.stat().st_size:
+                    self.path.unlink()
+            except OSError:
+                pass
+        self.size = self.records = self.changes_count = 0
+
+
+class JournalView:
+    """Lookups of a streaming reader with journal changes applied on top
+
+    Changed entries keep their place in database order, new ones follow; deleted ones are gone.
+
+    Args:
+        lookup (AppDatabaseReader): Lookups of the app database as saved.
+        changes (dict): name: row (None for a deleted entry).
+    """
+
+    def __init__(self, lookup, changes):
+        self.lookup = lookup
+        self.changes = changes
+
+    def entry(self, name):
+        """Entry with the title 'name' (or first entry of the group 'name'), None if missing."""
+        if name in self.changes:
+            row = self.changes[name]
+            return None if row is None else row_entry(row)
+        return self.lookup.entry(name)
+
+    def databases(self):
+        """(name, entry) tuples of the configured Keepass databases, in database order."""
+        databases = []
+        for name, entry in self.lookup.databases():
+            if name not in self.changes:
+                databases.append((name, entry))
+            elif self.changes[name] is not None:
+                databases.append((name, row_entry(self.changes[name])))
+        saved = {name for name, entry in databases}
+        databases.extend(
+            (name, row_entry(row)) for name, row in self.changes.items() if row is not None and name not in saved
+        )
+        return databases
+
+    def names(self):
+        """Names of the configured Keepass databases, in database order."""
+        return [name for name, entry in self.databases()]
+
+    def tagged(self, tag):
+        """Names of the databases tagged 'tag'."""
+        return [
+            name
+            for name, entry in self.databases()
+            if tag in split_tags(entry.get_custom_property(TAGS_PROPERTY))
+        ]
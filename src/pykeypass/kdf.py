@@ -0,0 +1,178 @@
+"""Argon2 calibration of the pykeypass app database ('setup --target-unlock-ms' and 'rekdf')
+
+pykeepass creates databases with fixed Argon2 parameters, so unlocking the app database is slow on
+thin clients and weaker than it could be on fast workstations. Calibration times Argon2 on the
+local machine and picks the parameters that take about the target unlock time:
+
+- parallelism: one lane per CPU core, at most MAX_PARALLELISM;
+- memory: halved from DEFAULT_MEMORY (down to MIN_MEMORY) while a single iteration is over the
+  target, or doubled (up to MAX_MEMORY) while at least four iterations would fit, since memory is
+  what makes Argon2 expensive to attack;
+- iterations: as many as fit in the target.
+
+The target and the chosen parameters are kept in '.pykeypass/kdf.json', so 'pykeypass rekdf' can
+re-tune the database later (e.g. after moving to another machine) with the same target.
+"""
+import json
+import os
+import time
+
+from .keycache import reseed_header
+
+KDF_SETTINGS = "kdf.json"
+MIB = 1024 * 1024
+MIN_MEMORY = 8 * MIB
+DEFAULT_MEMORY = 64 * MIB
+MAX_MEMORY = 1024 * MIB
+MAX_PARALLELISM = 8
+
+
+class KdfParameters:
+    """Argon2 parameters of a KDBX 4 database
+
+    Args:
+        memory (int): Memory in bytes ('M').
+        iterations (int): Number of iterations ('I').
+        parallelism (int): Number of lanes ('P').
+    """
+
+    def __init__(self, memory, iterations, parallelism):
+        self.memory = memory
+        self.iterations = iterations
+        self.parallelism = parallelism
+
+    def __str__(self):
+        iterations = f"{self.iterations} iteration" + ("s" if self.iterations != 1 else "")
+        return f"memory {self.memory // MIB} MiB, {iterations}, parallelism {self.parallelism}"
+
+    def as_dict(self):
+        """'memory', 'iterations' and 'parallelism' as a dict."""
+        return {"memory": self.memory, "iterations": self.iterations, "parallelism": self.parallelism}
+
+
+def _argon2_kdf_parameters(kp):
+    """KDF parameter dictionary of an Argon2 database; ValueError for any other KDF."""
+    from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids
+
+    if kp.version < (4, 0):
+        raise ValueError("KDBX 3 databases use AES-KDF, which cannot be calibrated.")
+    kdf_parameters = kp.kdbx.header.value.dynamic_header.kdf_parameters.data.dict
+    if kdf_parameters["$UUID"].value not in (kdf_uuids["argon2"], kdf_uuids["argon2id"]):
+        raise ValueError("the app database does not use Argon2.")
+    return kdf_parameters
+
+
+def argon2_seconds(memory, iterations, parallelism, argon2_id=False):
+    """Time a single Argon2 key derivation with the given parameters, in seconds."""
+    import argon2
+
+    start = time.perf_counter()
+    argon2.low_level.hash_secret_raw(
+        secret=os.urandom(32),
+        salt=os.urandom(32),
+        hash_len=32,
+        type=argon2.low_level.Type.ID if argon2_id else argon2.low_level.Type.D,
+        time_cost=iterations,
+        memory_cost=memory // 1024,
+        parallelism=parallelism,
+    )
+    return time.perf_counter() - start
+
+
+def calibrate(target_ms, parallelism=None, measure=argon2_seconds):
+    """Argon2 parameters that take about 'target_ms' milliseconds on this machine
+
+    Args:
+        target_ms (int): Target unlock time in milliseconds.
+        parallelism (int, optional): Number of lanes. Defaults to the number of CPU cores (at most
+        MAX_PARALLELISM).
+        measure (callable, optional): Times one derivation: measure(memory, iterations, parallelism)
+        returns seconds. Defaults to 'argon2_seconds'.
+
+    Returns:
+        tuple: (KdfParameters, expected unlock time in seconds).
+    """
+    parallelism = parallelism or min(os.cpu_count() or 1, MAX_PARALLELISM)
+    target = target_ms / 1000
+    memory = DEFAULT_MEMORY
+    seconds = measure(memory, 1, parallelism)
+    while seconds > target and memory > MIN_MEMORY:
+        memory //= 2
+        seconds = measure(memory, 1, parallelism)
+    while seconds * 4 <= target and memory < MAX_MEMORY:
+        memory *= 2
+        seconds = measure(memory, 1, parallelism)
+    iterations = max(int(target / seconds), 1)
+    return KdfParameters(memory, iterations, parallelism), seconds * iterations
+
+
+def kdf_parameters(kp):
+    """Current Argon2 parameters of a database (ValueError if it does not use Argon2)."""
+    parameters = _argon2_kdf_parameters(kp)
+    return KdfParameters(parameters["M"].value, parameters["I"].value, parameters["P"].value)
+
+
+def apply_kdf(kp, parameters):
+    """Set the Argon2 parameters of a database, with a fresh salt (see 'reseed_header')
+
+    The header is rebuilt on the next save, which must not reuse the old transformed key (see
+    'transform_key').
+
+    Raises:
+        ValueError: The database does not use Argon2.
+    """
+    kdf_dict = _argon2_kdf_parameters(kp)
+    kdf_dict["M"].value = parameters.memory
+    kdf_dict["I"].value = parameters.iterations
+    kdf_dict["P"].value = parameters.parallelism
+    reseed_header(kp)
+
+
+def transform_key(kp, password):
+    """Run the key derivation of a database for 'password' with its current header
+
+    Databases opened from a transformed key (see 'unlock_app_database') do not know their password,
+    so saving them after 'apply_kdf' needs the new transformed key computed here.
+
+    Returns:
+        bytes: The transformed key.
+    """
+    import argon2
+    from pykeepass.kdbx_parsing.common import compute_key_composite
+    from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids
+
+    kdf_dict = _argon2_kdf_parameters(kp)
+    argon2_id = kdf_dict["$UUID"].value == kdf_uuids["argon2id"]
+    return argon2.low_level.hash_secret_raw(
+        secret=compute_key_composite(password=password, keyfile=None),
+        salt=kdf_dict["S"].value,
+        hash_len=32,
+        type=argon2.low_level.Type.ID if argon2_id else argon2.low_level.Type.D,
+        time_cost=kdf_dict["I"].value,
+        memory_cost=kdf_dict["M"].value // 1024,
+        parallelism=kdf_dict["P"].value,
+        version=kdf_dict["V"].value,
+    )
+
+
+def load_kdf_settings(pykeypass_folder):
+    """Calibration stored by the last 'setup --target-unlock-ms' or 'rekdf' ({} if none)."""
+    try:
+        settings = json.loads((pykeypass_folder / KDF_SETTINGS).read_text())
+    except (OSError, ValueError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def save_kdf_settings(pykeypass_folder, target_ms, parameters, unlock_seconds):
+    """Remember a calibration: target, chosen parameters and measured unlock time."""
+    settings = {
+        "target_ms": target_ms,
+        **parameters.as_dict(),
+        "unlock_ms": round(unlock_seconds * 1000),
+        "calibrated": time.time(),
+    }
+    settings_path = pykeypass_folder / KDF_SETTINGS
+    settings_tmp = settings_path.with_suffix(".tmp")
+    settings_tmp.write_text(json.dumps(settings, indent=2))
+    os.replace(settings_tmp, settings_path)
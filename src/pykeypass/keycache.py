@@ -0,0 +1,114 @@
+"""Opt-in cache of the pykeypass app database transformed key
+
+Unlocking the app database is dominated by the key derivation function (Argon2/AES-KDF). The
+transformed key it produces can be passed back to pykeepass to decrypt the payload directly. When
+'PYKEYPASS_KEY_CACHE_TTL' is set to a number of seconds, the transformed key is kept in
+'.pykeypass/key.cache' (readable by the current user only) until it expires.
+
+The cache is bound to the raw header of the app database, which holds the KDF salt and parameters.
+Any change to the header (e.g. 'pykeypass setup' re-creating the database) invalidates it.
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+
+KEY_CACHE_TTL_ENV = "PYKEYPASS_KEY_CACHE_TTL"
+
+
+def cache_ttl():
+    """Configured key cache lifetime in seconds (0 when the cache is disabled)."""
+    try:
+        return max(int(os.environ.get(KEY_CACHE_TTL_ENV, "0")), 0)
+    except ValueError:
+        return 0
+
+
+def _cache_path(pykeypass_folder):
+    return pykeypass_folder / "key.cache"
+
+
+def header_digest(pykeypass_db):
+    """SHA-256 of the raw outer header (KDF salt and parameters included) of a database."""
+    from pykeepass.kdbx_parsing.kdbx import KDBX
+
+    with open(pykeypass_db, "rb") as db_file:
+        header = KDBX.header.parse_stream(db_file)
+    return hashlib.sha256(header.data).hexdigest()
+
+
+def clear_key(pykeypass_folder):
+    """Remove the cached transformed key."""
+    _cache_path(pykeypass_folder).unlink(missing_ok=True)
+
+
+def load_key(pykeypass_folder, pykeypass_db):
+    """Cached transformed key for the app database
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the cache.
+        pykeypass_db (Path): pykeypass app database the key must belong to.
+
+    Returns:
+        bytes: The transformed key, or None when the cache is disabled, missing, expired or was
+        created for a different database header. Stale cache files are removed.
+    """
+    cache_path = _cache_path(pykeypass_folder)
+    if cache_ttl() == 0:
+        clear_key(pykeypass_folder)
+        return None
+    try:
+        cached = json.loads(cache_path.read_text())
+        if cached["expires"] > time.time() and cached["header"] == header_digest(pykeypass_db):
+            return base64.b64decode(cached["key"])
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError):
+        pass
+    clear_key(pykeypass_folder)
+    return None
+
+
+def store_key(pykeypass_folder, pykeypass_db, transformed_key):
+    """Cache a transformed key for 'PYKEYPASS_KEY_CACHE_TTL' seconds (no-op when disabled)
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the cache.
+        pykeypass_db (Path): pykeypass app database the key belongs to.
+        transformed_key (bytes): Transformed key of the unlocked database ('PyKeePass.transformed_key').
+    """
+    ttl = cache_ttl()
+    if ttl == 0:
+        return
+    cache_path = _cache_path(pykeypass_folder)
+    cache_tmp = cache_path.with_suffix(".tmp")
+    cached = {
+        "header": header_digest(pykeypass_db),
+        "expires": time.time() + ttl,
+        "key": base64.b64encode(transformed_key).decode("ascii"),
+    }
+    fd = os.open(cache_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as cache_file:
+        json.dump(cached, cache_file)
+    os.replace(cache_tmp, cache_path)
+
+
+def reseed_header(kp):
+    """Give a database a fresh KDF salt and master seed before it is saved
+
+    pykeepass builds new databases from a bundled template, so every database created with
+    'create_database' shares the template's salt. A fresh salt makes the transformed key (and any
+    cached copy of it) unique to this database.
+
+    Args:
+        kp (PyKeePass): Database to reseed. Its header is rebuilt on the next 'save'.
+    """
+    dynamic_header = kp.kdbx.header.value.dynamic_header
+    if kp.version >= (4, 0):
+        kdf_parameters = dynamic_header.kdf_parameters.data.dict
+        kdf_parameters["S"].value = os.urandom(len(kdf_parameters["S"].value))
+    else:
+        dynamic_header.transform_seed.data = os.urandom(len(dynamic_header.transform_seed.data))
+    dynamic_header.master_seed.data = os.urandom(len(dynamic_header.master_seed.data))
+    kp.kdbx.header.pop("data", None)
@@ -0,0 +1,173 @@
+"""Keepass launcher backends
+
+Every backend builds the argv list (no shell string parsing) that opens one or more databases in
+its Keepass client and declares what the client can do:
+
+- batch_open: several databases can be opened by a single command line
+- password_stdin: passwords are written to the client's stdin instead of its command line (they
+  do not show up in the process list)
+- single_instance: a second process hands its database over to a running client and exits
+- spawns: a Keepass process is started (one that '--wait' can follow)
+
+Backends:
+
+- keepass: KeePass 2.x (the 'keepass.exe' installed by 'pykeypass setup')
+- keepassxc: KeePassXC ('keepassxc' on the PATH)
+- stub: starts nothing and remembers what it was asked to open (benchmarks and tests)
+- auto: KeePass 2.x if it is installed, KeePassXC otherwise
+
+The backend is picked with 'pykeypass --launcher <name>' or 'PYKEYPASS_LAUNCHER'.
+"""
+import os
+
+LAUNCHER_ENV = "PYKEYPASS_LAUNCHER"
+
+
+class Launcher:
+    """Base class of the launcher backends
+
+    Args:
+        executable (Path or str, optional): Keepass client to start.
+    """
+
+    name = None
+    batch_open = False
+    password_stdin = False
+    single_instance = False
+    spawns = True
+
+    def __init__(self, executable=None):
+        self.executable = executable
+
+    def arguments(self, entries):
+        """argv list opening 'entries' (a single entry unless 'batch_open')."""
+        raise NotImplementedError
+
+    def stdin(self, entries):
+        """Data for the client's stdin, None when nothing is passed that way."""
+        return None
+
+    def batches(self, databases):
+        """Split (name, entry) tuples into the groups that can be opened by one command line."""
+        return [[database] for database in databases]
+
+    def start(self, entries):
+        """Start the client for 'entries'
+
+        Its output is discarded: nobody reads it once pykeypass has exited, and an unread pipe
+        would eventually block the process.
+
+        Returns:
+            subprocess.Popen: The started process.
+        """
+        import subprocess
+
+        argv = self.arguments(entries)
+        data = self.stdin(entries)
+        process = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL if data is None else subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        if data is not None:
+            try:
+                process.stdin.write(data)
+                process.stdin.close()
+            except OSError:
+                pass  # exited early, the caller sees it in the exit status
+        return process
+
+
+class KeePassLauncher(Launcher):
+    """KeePass 2.x: one database per command line, handed over to a running KeePass."""
+
+    name = "keepass"
+    single_instance = True
+
+    def arguments(self, entries):
+        (entry,) = entries
+        key_file = entry.get_custom_property("key")
+        argv = [str(self.executable), entry.url, f"-pw:{entry.password}"]
+        if key_file is not None:
+            argv.append(f"-keyfile:{key_file}")
+        return argv
+
+
+class KeePassXCLauncher(Launcher):
+    """KeePassXC: any number of databases sharing a key file, passwords on stdin (one per line)."""
+
+    name = "keepassxc"
+    batch_open = True
+    password_stdin = True
+
+    def arguments(self, entries):
+        argv = [str(self.executable), "--pw-stdin"]
+        key_file = entries[0].get_custom_property("key")
+        if key_file is not None:
+            argv += ["--keyfile", key_file]
+        return argv + [entry.url for entry in entries]
+
+    def stdin(self, entries):
+        return "".join(f"{entry.password}\n" for entry in entries).encode("utf-8")
+
+    def batches(self, databases):
+        # KeePassXC takes a single '--keyfile' for all the databases of a command line
+        groups = {}
+        for name, entry in databases:
+            groups.setdefault(entry.get_custom_property("key"), []).append((name, entry))
+        return list(groups.values())
+
+
+class StubLauncher(Launcher):
+    """Starts nothing; every call to 'start' is recorded in 'launched' (argv lists)."""
+
+    name = "stub"
+    batch_open = True
+    spawns = False
+
+    def __init__(self, executable="keepass-stub"):
+        super().__init__(executable)
+        self.launched = []
+
+    def arguments(self, entries):
+        return [str(self.executable), *(entry.url for entry in entries)]
+
+    def batches(self, databases):
+        return [list(databases)] if databases else []
+
+    def start(self, entries):
+        self.launched.append(self.arguments(entries))
+        return None
+
+
+LAUNCHERS = {launcher.name: launcher for launcher in (KeePassLauncher, KeePassXCLauncher, StubLauncher)}
+
+
+def launcher_for(name, pykeypass_app):
+    """Launcher backend called 'name'
+
+    Args:
+        name (str): 'auto', 'keepass', 'keepassxc' or 'stub'.
+        pykeypass_app (Path): KeePass 2.x executable installed by 'pykeypass setup'.
+
+    Raises:
+        ValueError: Unknown backend name.
+
+    Returns:
+        Launcher: The backend.
+    """
+    import shutil
+
+    if name == "auto":
+        if os.path.exists(pykeypass_app) or shutil.which("keepassxc") is None:
+            name = "keepass"
+        else:
+            name = "keepassxc"
+    if name not in LAUNCHERS:
+        raise ValueError(f"Unknown launcher '{name}' (use auto, {', '.join(LAUNCHERS)}).")
+    if name == "keepass":
+        return KeePassLauncher(pykeypass_app)
+    if name == "keepassxc":
+        return KeePassXCLauncher(shutil.which("keepassxc") or "keepassxc")
+    return StubLauncher()
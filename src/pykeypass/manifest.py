@@ -0,0 +1,192 @@
+"""Bulk provisioning manifests for 'pykeypass manage --from-file'
+
+A manifest lists Keepass databases to register in the pykeypass app database, one row per database:
+
+- name: entry name (used with 'pykeypass open <name>')
+- url: path of the Keepass database
+- password: reference to the Keepass database password (see 'resolve_password')
+- key: key file path (optional)
+- tags: launch profiles of the database, comma separated (optional, see 'pykeypass.index')
+- priority: launch priority, an integer; higher starts first (optional, see 'pykeypass.scheduler')
+
+CSV files need a header row with those column names. JSON and YAML files hold a list of objects,
+or an object with the list under 'databases'. YAML needs PyYAML ('pip install pykeypass[yaml]').
+"""
+import csv
+import getpass
+import json
+import os
+from pathlib import Path
+
+from .index import TAGS_PROPERTY, split_tags
+from .scheduler import PRIORITY_PROPERTY
+
+FIELDS = ("name", "url", "password", "key", "tags", "priority")
+
+
+class ManifestError(Exception):
+    """The manifest could not be read or holds invalid rows."""
+
+
+def load_manifest(manifest_path):
+    """Read the rows of a CSV, JSON or YAML manifest
+
+    Args:
+        manifest_path (Path): Manifest file. The format is picked from the extension.
+
+    Raises:
+        ManifestError: Unknown format, unreadable file or unexpected structure.
+
+    Returns:
+        list: One dict per row.
+    """
+    manifest_path = Path(manifest_path)
+    suffix = manifest_path.suffix.lower()
+    try:
+        if suffix == ".csv":
+            with open(manifest_path, newline="", encoding="utf-8-sig") as manifest_file:
+                return list(csv.DictReader(manifest_file))
+        text = manifest_path.read_text(encoding="utf-8")
+        if suffix == ".json":
+            data = json.loads(text)
+        elif suffix in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ManifestError("YAML manifests need PyYAML ('pip install pykeypass[yaml]').") from e
+            data = yaml.safe_load(text)
+        else:
+            raise ManifestError(f"Unsupported manifest format '{suffix}' (use .csv, .json, .yaml or .yml).")
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        raise ManifestError(f"Could not read {manifest_path}: {e}") from e
+    if isinstance(data, dict):
+        data = data.get("databases")
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ManifestError("Manifest must be a list of databases (or hold one under 'databases').")
+    return data
+
+
+def resolve_password(reference, name):
+    """Turn a manifest password reference into the password
+
+    - 'env:NAME': value of the environment variable NAME
+    - 'file:PATH': first line of the file at PATH
+    - 'prompt': asked for interactively
+    - anything else: the password itself
+
+    Raises:
+        ManifestError: The variable or file does not exist.
+    """
+    if reference.startswith("env:"):
+        variable = reference[len("env:"):]
+        if variable not in os.environ:
+            raise ManifestError(f"environment variable '{variable}' is not set")
+        return os.environ[variable]
+    if reference.startswith("file:"):
+        try:
+            lines = Path(reference[len("file:"):]).read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            raise ManifestError(f"password file could not be read ({e})") from e
+        return lines[0] if lines else ""
+    if reference == "prompt":
+        return getpass.getpass(prompt=f"Set {name} Keepass Password: ")
+    return reference
+
+
+def validate_rows(rows):
+    """Check every manifest row and resolve its password
+
+    Args:
+        rows (list): Rows returned by 'load_manifest'.
+
+    Returns:
+        tuple: (databases, errors). 'databases' is a list of dicts with the keys of FIELDS (key
+        None when not used, tags a list, priority an int or None); 'errors' lists one message per invalid row. Rows are
+        numbered from 1.
+    """
+    databases = []
+    errors = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        values = {field: str(row.get(field) or "").strip() for field in FIELDS}
+        if isinstance(row.get("tags"), list):  # JSON and YAML manifests may list the tags
+            values["tags"] = ",".join(map(str, row["tags"]))
+        # csv.DictReader keeps the values past the last column under the key None
+        extra = row.get(None) or []
+        unknown = sorted(str(column) for column in set(row) - set(FIELDS) if column is not None)
+        name = values["name"]
+        problems = []
+        if unknown:
+            problems.append(f"unknown column(s) {', '.join(unknown)}")
+        if extra:
+            problems.append(f"{len(extra)} extra value(s)")
+        if not name:
+            problems.append("missing name")
+        elif name in seen:
+            problems.append(f"duplicate name '{name}'")
+        if not values["url"]:
+            problems.append("missing url")
+        if not values["password"]:
+            problems.append("missing password")
+        if values["priority"]:
+            try:
+                values["priority"] = int(values["priority"])
+            except ValueError:
+                problems.append(f"priority '{values['priority']}' is not an integer")
+        if not problems:
+            try:
+                values["password"] = resolve_password(values["password"], name)
+            except ManifestError as e:
+                problems.append(str(e))
+        if problems:
+            errors.append(f"row {number}{f' ({name})' if name else ''}: {'; '.join(problems)}")
+            continue
+        seen.add(name)
+        values["key"] = values["key"] or None
+        values["tags"] = split_tags(values["tags"])
+        values["priority"] = values["priority"] if values["priority"] != "" else None
+        databases.append(values)
+    return databases, errors
+
+
+def apply_manifest(kp, index, databases, replace=False):
+    """Stage manifest databases in the unlocked app database (nothing is saved)
+
+    Args:
+        kp (PyKeePass): Unlocked pykeypass app database.
+        index (EntryIndex): Index of 'kp'; kept up to date.
+        databases (list): Validated rows from 'validate_rows'.
+        replace (bool, optional): Replace databases that are already registered instead of skipping
+        them. Defaults to False.
+
+    Returns:
+        list: (name, action) tuples, action being 'added', 'replaced' or 'skipped'.
+    """
+    report = []
+    for database in databases:
+        name = database["name"]
+        if name in index:
+            if not replace:
+                report.append((name, "skipped"))
+                continue
+            entry = index.entry(name)
+            group = entry.group if entry.group.name == name else index.group(name)
+            kp.delete_entry(entry)
+            if group is not None:
+                kp.delete_group(group)
+            index.remove(name)
+            action = "replaced"
+        else:
+            action = "added"
+        group = kp.add_group(kp.root_group, name)
+        # the index already rules out duplicates, skip pykeepass' per-entry search of the tree
+        entry = kp.add_entry(group, name, name, database["password"], url=database["url"], force_creation=True)
+        if database["key"]:
+            entry.set_custom_property("key", database["key"])
+        if database.get("tags"):
+            entry.set_custom_property(TAGS_PROPERTY, ",".join(database["tags"]))
+        if database.get("priority"):
+            entry.set_custom_property(PRIORITY_PROPERTY, str(database["priority"]))
+        index.add(group)
+        report.append((name, action))
+    return report
@@ -0,0 +1,138 @@
+"""Timing spans for 'pykeypass --profile' and 'PYKEYPASS_TRACE'
+
+Commands wrap each phase they go through in a named span:
+
+- path_selection: locating the pykeypass folder, Keepass executable and app database
+- unlock: key derivation (KDF) of the app database password
+- parse: decrypting, decompressing and parsing the app database payload
+- lookup: indexing the app database and finding the requested entries
+- agent: a request to the unlock agent
+- save: writing the app database back to disk
+- journal: reading (replaying) or appending to the change journal
+- launch: starting Keepass for one database ('database' argument)
+
+'--profile' prints a summary of the spans on stderr when the command ends. 'PYKEYPASS_TRACE=<path>'
+writes them to <path> in the Chrome trace event format (open it in chrome://tracing or Perfetto);
+spans recorded from worker threads (e.g. 'pykeypass all') show up as parallel tracks.
+
+Spans cost a single attribute check while profiling is off.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+TRACE_ENV = "PYKEYPASS_TRACE"
+
+_NO_SPAN = nullcontext()
+
+
+class Span:
+    """A finished timing span
+
+    Args:
+        name (str): Phase name.
+        start (float): 'time.perf_counter()' at the start of the span.
+        seconds (float): Duration.
+        thread_id (int): Thread the span was recorded in.
+        args (dict): Extra details (e.g. the database name of a launch).
+    """
+
+    def __init__(self, name, start, seconds, thread_id, args):
+        self.name = name
+        self.start = start
+        self.seconds = seconds
+        self.thread_id = thread_id
+        self.args = args
+
+
+class Tracer:
+    """Collects the spans of one command (thread-safe)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Drop the spans of a previous command and start recording."""
+        self.spans = []
+        self.origin = time.perf_counter()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Context manager timing the enclosed block as span 'name' (no-op while disabled)."""
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, args)
+
+    @contextmanager
+    def _span(self, name, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(Span(name, start, time.perf_counter() - start, threading.get_ident(), args))
+
+    def record(self, name, seconds, **args):
+        """Add a span measured elsewhere (e.g. in a worker process) that ended just now."""
+        if self.enabled:
+            end = time.perf_counter()
+            self._add(Span(name, end - seconds, seconds, threading.get_ident(), args))
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Human readable summary: one line per span name, in order of first appearance
+
+        Returns:
+            list: Lines with the count, total and longest duration of each span name.
+        """
+        phases = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            count, total, longest = phases.get(span.name, (0, 0.0, 0.0))
+            phases[span.name] = (count + 1, total + span.seconds, max(longest, span.seconds))
+        width = max([len("PHASE")] + [len(name) for name in phases])
+        lines = [f"{'PHASE':<{width}}  COUNT     TOTAL ms       MAX ms"]
+        for name, (count, total, longest) in phases.items():
+            lines.append(f"{name:<{width}}  {count:>5}  {total * 1000:>11.1f}  {longest * 1000:>11.1f}")
+        return lines
+
+    def chrome_trace(self):
+        """Spans as a Chrome trace event format document ('X' complete events, microseconds)."""
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": round((span.start - self.origin) * 1_000_000, 1),
+                    "dur": round(span.seconds * 1_000_000, 1),
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": span.args,
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, trace_path):
+        import json
+
+        with open(trace_path, "w", encoding="utf-8") as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
+
+
+tracer = Tracer()
+
+
+def span(name, **args):
+    """Time a block as span 'name' on the process-wide tracer (see 'Tracer.span')."""
+    return tracer.span(name, **args)
@@ -0,0 +1,383 @@
+"""Streaming read-only reader of the pykeypass app database ('list', 'path', 'open')
+
+Loading the app database with pykeepass builds the whole object model: the payload is decrypted
+and decompressed in one piece, parsed into an lxml tree, and every protected value (every stored
+password) is decrypted, even when the command only needs one entry or only the names.
+
+'AppDatabaseReader' reads the same KDBX 4 file as a stream instead:
+
+- the payload blocks are checked (HMAC), decrypted and decompressed one at a time;
+- the XML is parsed incrementally ('lxml.etree.XMLPullParser') and every entry is dropped from the
+  tree as soon as its title, url and custom properties are read;
+- scanning stops as soon as the requested entry is found ('entry'), and resumes from there on the
+  next lookup of the same reader; 'names' and 'databases' scan to the end once;
+- protected values are never decrypted while scanning: only their position in the inner stream
+  cipher is kept, and the value is decrypted when the entry's 'password' is actually read.
+
+Names resolve like 'EntryIndex': entry titles first, then the name of the group holding the entry,
+outside of the recycle bin. Databases the reader cannot stream (KDBX 3, Twofish, ...) raise
+'UnsupportedFormat' before any key derivation, so callers can fall back to pykeepass.
+"""
+import base64
+import hashlib
+import hmac
+import re
+import struct
+import zlib
+from pathlib import Path
+
+from .index import RECYCLE_BIN, TAGS_PROPERTY, split_tags
+from .profiling import span
+
+RESERVED_KEYS = ("Title", "UserName", "Password", "URL", "Tags", "IconID", "Times", "History", "Notes", "otp")
+CHUNK_SIZE = 64 * 1024
+# same clean-up of decrypted values as pykeepass' 'UnprotectedStream'
+INVALID_XML_CHARACTERS = re.compile("[^\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\U00010000-\U0010FFFF]+")
+
+
+class UnsupportedFormat(Exception):
+    """The app database uses a format the streaming reader does not handle."""
+
+
+class ProtectedValue:
+    """A protected string of the inner stream, decrypted on first use
+
+    Args:
+        reader (AppDatabaseReader): Reader holding the inner stream cipher.
+        offset (int): Position of the value in the inner stream.
+        text (str): Base64 ciphertext.
+    """
+
+    def __init__(self, reader, offset, text):
+        self.reader = reader
+        self.offset = offset
+        self.text = text
+        self._value = None
+
+    def __str__(self):
+        if self._value is None:
+            self._value = self.reader.unprotect(self.offset, self.text)
+        return self._value
+
+
+def _string(value):
+    return None if value is None else str(value)
+
+
+class StreamedEntry:
+    """Read-only app database entry found by the streaming reader
+
+    Exposes the same attributes as pykeepass 'Entry' objects used by the CLI (like 'AgentEntry'),
+    with protected values decrypted on first access.
+    """
+
+    def __init__(self, strings):
+        self._strings = strings
+
+    @property
+    def title(self):
+        return _string(self._strings.get("Title"))
+
+    @property
+    def username(self):
+        return _string(self._strings.get("UserName"))
+
+    @property
+    def url(self):
+        return _string(self._strings.get("URL"))
+
+    @property
+    def password(self):
+        return _string(self._strings.get("Password"))
+
+    @property
+    def custom_properties(self):
+        return {key: _string(value) for key, value in self._strings.items() if key not in RESERVED_KEYS}
+
+    def get_custom_property(self, key):
+        return _string(self._strings.get(key))
+
+
+def _protected_length(text):
+    """Length of the bytes encoded by a base64 string, without decoding it."""
+    text = text.strip()
+    return len(text) * 3 // 4 - (len(text) - len(text.rstrip("=")))
+
+
+class AppDatabaseReader:
+    """Streamed lookups in a KDBX 4 app database
+
+    Args:
+        pykeypass_db (Path): pykeypass app database. The (small, encrypted) file is read at once,
+        so a save of the app database during the session never affects the reader.
+
+    Raises:
+        UnsupportedFormat: Not a KDBX 4 database encrypted with AES-256 or ChaCha20.
+    """
+
+    def __init__(self, pykeypass_db):
+        from construct import ConstructError
+        from pykeepass.kdbx_parsing.kdbx import KDBX
+
+        self.data = Path(pykeypass_db).read_bytes()
+        try:
+            header = KDBX.header.parse(self.data)
+        except ConstructError as e:
+            raise UnsupportedFormat(f"unreadable header ({e})") from e
+        if header.value.major_version != 4:
+            raise UnsupportedFormat(f"KDBX {header.value.major_version} database")
+        dynamic_header = header.value.dynamic_header
+        self.cipher_id = dynamic_header.cipher_id.data
+        if self.cipher_id not in ("aes256", "chacha20"):
+            raise UnsupportedFormat(f"{self.cipher_id} payload cipher")
+        self.header = header.data
+        self.master_seed = dynamic_header.master_seed.data
+        self.encryption_iv = dynamic_header.encryption_iv.data
+        self.compressed = dynamic_header.compression_flags.data.compression
+        self.transformed_key = None
+        self._hmac_key = None
+        self._master_key = None
+        self._scan = None
+        self._stream_cipher = None
+        self._stream_position = 0
+        self._titles = {}
+        self._databases = {}
+
+    def unlock(self, transformed_key):
+        """Check 'transformed_key' against the header and start scanning
+
+        Raises:
+            CredentialsError: Wrong key (the header HMAC does not match).
+            HeaderChecksumError: The header is corrupted.
+        """
+        from pykeepass.exceptions import CredentialsError, HeaderChecksumError
+
+        end = len(self.header)
+        if hashlib.sha256(self.header).digest() != self.data[end:end + 32]:
+            raise HeaderChecksumError("app database header checksum does not match")
+        self._hmac_key = hashlib.sha512(self.master_seed + transformed_key + b"\x01").digest()
+        header_key = hashlib.sha512(b"\xff" * 8 + self._hmac_key).digest()
+        header_hmac = hmac.new(header_key, self.header, hashlib.sha256).digest()
+        if not hmac.compare_digest(header_hmac, self.data[end + 32:end + 64]):
+            raise CredentialsError("Invalid credentials")
+        self.transformed_key = transformed_key
+        self._master_key = hashlib.sha256(self.master_seed + transformed_key).digest()
+        self._scan = self._entries(self._xml_chunks(end + 64))
+        return self
+
+    def _blocks(self, offset):
+        """Verified, still encrypted payload blocks."""
+        from pykeepass.exceptions import PayloadChecksumError
+
+        index = 0
+        while True:
+            block_hmac = self.data[offset:offset + 32]
+            (size,) = struct.unpack("<I", self.data[offset + 32:offset + 36])
+            block = self.data[offset + 36:offset + 36 + size]
+            block_key = hashlib.sha512(struct.pack("<Q", index) + self._hmac_key).digest()
+            message = struct.pack("<Q", index) + struct.pack("<I", size) + block
+            if not hmac.compare_digest(hmac.new(block_key, message, hashlib.sha256).digest(), block_hmac):
+                raise PayloadChecksumError(f"payload block {index} checksum does not match")
+            if not size:
+                return
+            yield block
+            offset += 36 + size
+            index += 1
+
+    def _plaintext(self, offset):
+        """Decrypted payload, one block at a time (AES-256-CBC padding removed at the end)."""
+        from Cryptodome.Cipher import AES, ChaCha20
+
+        if self.cipher_id == "chacha20":
+            cipher = ChaCha20.new(key=self._master_key, nonce=self.encryption_iv)
+            for block in self._blocks(offset):
+                yield cipher.decrypt(block)
+            return
+        cipher = AES.new(self._master_key, AES.MODE_CBC, self.encryption_iv)
+        pending = b""
+        for block in self._blocks(offset):
+            pending += block
+            usable = (len(pending) // 16 - 1) * 16  # keep the last AES block back for the padding
+            if usable > 0:
+                yield cipher.decrypt(pending[:usable])
+                pending = pending[usable:]
+        if pending:
+            last = cipher.decrypt(pending)
+            yield last[:-last[-1]] if 0 < last[-1] <= 16 else last
+
+    def _decompressed(self, offset):
+        """Decompressed payload (inner header and XML), in chunks of at most CHUNK_SIZE."""
+        if not self.compressed:
+            yield from self._plaintext(offset)
+            return
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in self._plaintext(offset):
+            while chunk:
+                yield decompressor.decompress(chunk, CHUNK_SIZE)
+                chunk = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+    def _xml_chunks(self, offset):
+        """Chunks of the XML document, after reading the inner header (protected stream cipher)."""
+        chunks = self._decompressed(offset)
+        buffer = b""
+
+        def need(size):
+            nonlocal buffer
+            while len(buffer) < size:
+                buffer += next(chunks)
+            data, buffer = buffer[:size], buffer[size:]
+            return data
+
+        stream_id = stream_key = None
+        while True:
+            item_type, size = struct.unpack("<BI", need(5))
+            data = need(size)
+            if item_type == 0:
+                break
+            if item_type == 1:
+                (stream_id,) = struct.unpack("<I", data)
+            elif item_type == 2:
+                stream_key = data
+        self._stream_cipher = self._inner_cipher(stream_id, stream_key)
+        if buffer:
+            yield buffer
+        yield from chunks
+
+    @staticmethod
+    def _inner_cipher(stream_id, stream_key):
+        """Factory of the inner stream cipher of protected values (None when they are not encrypted)."""
+        from Cryptodome.Cipher import ChaCha20, Salsa20
+
+        if stream_id == 3:
+            key_hash = hashlib.sha512(stream_key).digest()
+            return lambda: ChaCha20.new(key=key_hash[:32], nonce=key_hash[32:44])
+        if stream_id == 2:
+            key = hashlib.sha256(stream_key).digest()
+            return lambda: Salsa20.new(key=key, nonce=b"\xe8\x30\x09\x4b\x97\x20\x5d\x2a")
+        return None
+
+    def unprotect(self, offset, text):
+        """Decrypt one protected value at 'offset' of the inner stream."""
+        if self._stream_cipher is None:
+            return text
+        cipher = self._stream_cipher()
+        if hasattr(cipher, "seek"):
+            cipher.seek(offset)
+        else:
+            cipher.decrypt(bytes(offset))  # Salsa20 cannot seek: skip the keystream
+        try:
+            value = cipher.decrypt(base64.b64decode(text)).decode("utf-8")
+        except (UnicodeDecodeError, ValueError):
+            return text  # pykeepass keeps such values as they are, too
+        return INVALID_XML_CHARACTERS.sub("", value)
+
+    def _entries(self, chunks):
+        """Scan the document; yields once per entry added to the lookup tables
+
+        Only groups, group names and entries reach Python (the 'tag' filter of the parser); the
+        strings of an entry are read from its finished element.
+        """
+        from lxml import etree
+
+        parser = etree.XMLPullParser(events=("start", "end"), tag=("Group", "Name", "Entry", "Meta"))
+        groups = []  # [name, in recycle bin] per open group, outermost (the root group) first
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                tag = element.tag
+                if tag == "Group":
+                    if event == "start":
+                        groups.append([None, bool(groups) and groups[-1][1]])
+                    else:
+                        groups.pop()
+                        self._clear(element)
+                elif event == "start":
+                    continue
+                elif tag == "Entry" and element.getparent().tag == "Group":  # not a history entry
+                    strings = self._strings(element)
+                    self._clear(element)
+                    name, recycled = groups[-1]
+                    if len(groups) > 1 and not recycled and name is not None:
+                        self._add(name, strings)
+                        yield
+                elif tag == "Name" and element.getparent().tag == "Group" and groups[-1][0] is None:
+                    groups[-1][0] = element.text or ""
+                    if len(groups) == 2 and element.text == RECYCLE_BIN:
+                        groups[-1][1] = True
+                elif tag == "Meta":
+                    self._clear(element)
+        parser.close()
+
+    def _strings(self, entry_element):
+        """Strings of an entry; protected ones (also those of its history) advance the inner stream."""
+        strings = {}
+        # plain child loops in document order: lxml's find()/findtext() go through its (Python)
+        # ElementPath module, and pykeepass may write strings after the history of an entry
+        for child in entry_element:
+            if child.tag == "String":
+                key = value = None
+                for field in child:
+                    if field.tag == "Key":
+                        key = field.text
+                    elif field.tag == "Value":
+                        value = self._value(field)
+                strings[key] = value
+            elif child.tag == "History":
+                for value_element in child.iter("Value"):
+                    self._value(value_element)
+        return strings
+
+    def _value(self, value_element):
+        text = value_element.text
+        if text and value_element.get("Protected") == "True":
+            value = ProtectedValue(self, self._stream_position, text)
+            self._stream_position += _protected_length(text)
+            return value
+        return text
+
+    @staticmethod
+    def _clear(element):
+        """Free a finished element and the finished siblings before it (the usual iterparse idiom)."""
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    def _add(self, group_name, strings):
+        entry = StreamedEntry(strings)
+        self._titles.setdefault(_string(strings.get("Title")), entry)
+        self._databases.setdefault(group_name, entry)
+
+    def _scan_all(self):
+        with span("lookup"):
+            for _ in self._scan:
+                pass
+
+    def entry(self, name):
+        """Entry with the title 'name' (or first entry of the group 'name'), None if missing."""
+        with span("lookup"):
+            if name in self._titles:
+                return self._titles[name]
+            for _ in self._scan:
+                if name in self._titles:
+                    return self._titles[name]
+        return self._databases.get(name)
+
+    def names(self):
+        """Names of the configured Keepass databases, in database order."""
+        self._scan_all()
+        return list(self._databases)
+
+    def databases(self):
+        """(name, entry) tuples of the configured Keepass databases, in database order."""
+        self._scan_all()
+        return list(self._databases.items())
+
+    def tagged(self, tag):
+        """Names of the databases tagged 'tag'."""
+        self._scan_all()
+        return [
+            name
+            for name, entry in self._databases.items()
+            if tag in split_tags(entry.get_custom_property(TAGS_PROPERTY))
+        ]
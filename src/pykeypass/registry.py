@@ -0,0 +1,186 @@
+"""Registry of the Keepass processes launched by pykeypass
+
+'pykeypass open' and 'pykeypass all' record every Keepass process they start (database name, PID,
+process start time) in '.pykeypass/processes.json'. Before launching, the registry is checked
+against the live process table, so a database that is already open is not opened a second time
+(a second Keepass holding the same file only costs memory and fights over the lock file).
+
+A PID alone can be reused by an unrelated process once Keepass exits, so the registry also keeps
+the start time the operating system reports for the process and only trusts a PID whose start
+time still matches.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+
+def _linux_start_time(pid):
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as stat_file:
+            stat = stat_file.read()
+    except FileNotFoundError:
+        return None
+    # the process name (field 2) may hold spaces and parentheses, the fields after it do not
+    fields = stat.rsplit(")", 1)[1].split()
+    if fields[0] in ("Z", "X"):
+        return None
+    return int(fields[19])
+
+
+def _windows_start_time(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    try:
+        exit_code = wintypes.DWORD()
+        if kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)) and exit_code.value != 259:
+            return None  # 259: STILL_ACTIVE
+        creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not kernel32.GetProcessTimes(
+            handle, ctypes.byref(creation), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)
+        ):
+            return 0
+        return (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_start_time(pid):
+    """Start time of a running process, as an opaque number
+
+    Args:
+        pid (int): Process id.
+
+    Returns:
+        int: Start time reported by the operating system, 0 when the process runs but its start
+        time is not available on this platform, None when no such process is running.
+    """
+    if pid <= 0:
+        return None
+    if sys.platform == "win32":
+        return _windows_start_time(pid)
+    if os.path.isdir("/proc"):
+        try:
+            return _linux_start_time(pid)
+        except (OSError, ValueError, IndexError):
+            pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return 0
+
+
+def _linux_cpu_time(pid):
+    with open(f"/proc/{pid}/stat", encoding="utf-8") as stat_file:
+        fields = stat_file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+
+def _windows_cpu_time(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    try:
+        creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not kernel32.GetProcessTimes(
+            handle, ctypes.byref(creation), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)
+        ):
+            return None
+        ticks = sum((filetime.dwHighDateTime << 32) | filetime.dwLowDateTime for filetime in (kernel, user))
+        return ticks / 10_000_000  # 100 ns units
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_cpu_time(pid):
+    """CPU time (user and system) a running process used so far, in seconds
+
+    Returns:
+        float: CPU seconds, None when the process is gone or this platform does not report it.
+    """
+    if sys.platform == "win32":
+        return _windows_cpu_time(pid)
+    if os.path.isdir("/proc"):
+        try:
+            return _linux_cpu_time(pid)
+        except (OSError, ValueError, IndexError):
+            return None
+    return None
+
+
+class ProcessRegistry:
+    """Keepass processes launched from a pykeypass folder (thread-safe)
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding 'processes.json'.
+    """
+
+    def __init__(self, pykeypass_folder):
+        self.path = pykeypass_folder / "processes.json"
+        self._lock = threading.Lock()
+        try:
+            self.processes = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.processes = {}
+        if not isinstance(self.processes, dict):
+            self.processes = {}
+
+    def running(self, name):
+        """Registry record of the running Keepass process for 'name', None if it is not running
+
+        Returns:
+            dict: 'pid', 'start_time' and 'started' (epoch seconds) of the process.
+        """
+        record = self.processes.get(name)
+        if record is None:
+            return None
+        try:
+            start_time = process_start_time(record["pid"])
+        except (KeyError, TypeError, OSError):
+            start_time = None
+        recorded = record.get("start_time")
+        if start_time is None or recorded and start_time and recorded != start_time:
+            self.remove(name)
+            return None
+        return record
+
+    def any_running(self):
+        """PID of a running Keepass process started by pykeypass, None if there is none."""
+        for name in list(self.processes):
+            record = self.running(name)
+            if record is not None:
+                return record["pid"]
+        return None
+
+    def add(self, name, pid):
+        """Record that 'name' was opened by the process 'pid' and save the registry."""
+        with self._lock:
+            self.processes[name] = {"pid": pid, "start_time": process_start_time(pid), "started": time.time()}
+            self._save()
+
+    def remove(self, name, pid=None):
+        """Forget 'name' (only if it is still registered to 'pid', when given) and save the registry."""
+        with self._lock:
+            record = self.processes.get(name)
+            if record is None or pid is not None and record.get("pid") != pid:
+                return
+            del self.processes[name]
+            self._save()
+
+    def _save(self):
+        registry_tmp = self.path.with_suffix(".tmp")
+        registry_tmp.write_text(json.dumps(self.processes))
+        os.replace(registry_tmp, self.path)
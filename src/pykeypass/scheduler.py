@@ -0,0 +1,284 @@
+"""Staggered launches of several Keepass databases ('pykeypass all', 'pykeypass open --profile')
+
+Right after it starts, Keepass reads its database from the file server and runs the key derivation.
+Started all at once, N Keepass processes compete for the same share and the same cores, and the
+last one is ready later than if they had been started one after the other. The scheduler starts
+them in waves instead:
+
+- databases are ordered by priority (the 'priority' custom property, highest first, 0 when unset),
+  keeping the database order within a priority;
+- a wave holds at most 'max_concurrent' databases, started at the same time;
+- a gate holds the next wave back: GATE_READY until every process of the wave is ready, GATE_DELAY
+  for a fixed delay, GATE_NONE not at all.
+
+A process is ready once it exited (e.g. handed its database over to a running Keepass) or once it
+stayed idle for SETTLE_SECONDS after using some CPU (or after its expected launch time, for
+processes that barely use any): Keepass idles once the database is decrypted and shown. Where the
+CPU time of a process cannot be read, it is ready after its expected launch time. No process is
+waited for longer than READY_TIMEOUT.
+
+Measured launch times are kept in '.pykeypass/launches.json' (see 'LaunchHistory') and provide the
+defaults: the expected launch time of every database, the delay of GATE_DELAY (the median expected
+launch time) and the wave size with the best measured throughput. Only waves that were waited for
+are measured (not the last one, unless 'wait_last'), and every EXPLORE_EVERY runs the default wave
+size is half or twice the best one, so the history also learns about the sizes next to it.
+"""
+import json
+import os
+import time
+
+PRIORITY_PROPERTY = "priority"
+
+GATE_NONE = "none"
+GATE_DELAY = "delay"
+GATE_READY = "ready"
+GATES = (GATE_READY, GATE_DELAY, GATE_NONE)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_LAUNCH_SECONDS = 2.0
+READY_TIMEOUT = 30.0
+POLL_INTERVAL = 0.05
+SETTLE_SECONDS = 0.5
+MIN_CPU_SECONDS = 0.05
+IDLE_CPU_SECONDS = 0.01
+SMOOTHING = 0.3  # weight of a new measurement in the moving averages of the history
+EXPLORE_EVERY = 5  # runs between two tries of a wave size next to the best one
+
+
+def entry_priority(entry):
+    """Launch priority of an entry (its 'priority' custom property, 0 when unset or invalid)."""
+    try:
+        return int(entry.get_custom_property(PRIORITY_PROPERTY) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def plan_waves(databases, max_concurrent):
+    """Split (name, entry) tuples into launch waves
+
+    Args:
+        databases (list): (name, entry) tuples.
+        max_concurrent (int): Databases per wave.
+
+    Returns:
+        list: Waves (lists of (name, entry) tuples), highest priority first.
+    """
+    ordered = sorted(databases, key=lambda database: -entry_priority(database[1]))
+    size = max(max_concurrent, 1)
+    return [ordered[start:start + size] for start in range(0, len(ordered), size)]
+
+
+class ScheduledLaunch:
+    """One database started by the scheduler
+
+    Args:
+        result (OpenResult): Outcome of the launch (see 'PyKeypassClient.launch_result').
+        wave (int): Wave number, from 0.
+        offset (float): Seconds between the start of the run and the start of the wave.
+    """
+
+    def __init__(self, result, wave, offset):
+        self.name = result.name
+        self.process = result.process
+        self.error = result.error
+        self.wave = wave
+        self.offset = offset
+        self.ready_seconds = None
+        self.cpu_seconds = None
+        self.busy_until = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class LaunchScheduler:
+    """Start databases in prioritized, gated waves
+
+    Args:
+        start (callable): Launches one database: start(name, entry) returns an OpenResult.
+        max_concurrent (int, optional): Databases per wave. Defaults to DEFAULT_CONCURRENCY.
+        gate (str, optional): GATE_READY, GATE_DELAY or GATE_NONE. Defaults to GATE_READY.
+        delay (float, optional): Seconds between waves with GATE_DELAY. Defaults to
+        DEFAULT_LAUNCH_SECONDS.
+        expected (dict, optional): Expected launch time per database name, used when the CPU time
+        of a process cannot be read. Defaults to DEFAULT_LAUNCH_SECONDS for every database.
+        is_ready (callable, optional): Readiness probe: is_ready(launch, elapsed) returns the seconds
+        the launch took to get ready, or None while it is not. Defaults to 'process_ready'.
+        on_start (callable, optional): Called with each ScheduledLaunch once it was started.
+        on_ready (callable, optional): Called with each ScheduledLaunch once a gate saw it ready.
+    """
+
+    def __init__(
+        self,
+        start,
+        max_concurrent=DEFAULT_CONCURRENCY,
+        gate=GATE_READY,
+        delay=None,
+        expected=None,
+        is_ready=None,
+        on_start=None,
+        on_ready=None,
+    ):
+        if gate not in GATES:
+            raise ValueError(f"Unknown gate '{gate}' (use {', '.join(GATES)}).")
+        self.start = start
+        self.max_concurrent = max(max_concurrent, 1)
+        self.gate = gate
+        self.delay = DEFAULT_LAUNCH_SECONDS if delay is None else delay
+        self.expected = expected or {}
+        self.is_ready = is_ready or self.process_ready
+        self.on_start = on_start
+        self.on_ready = on_ready
+        self.launches = []
+        self.waves = []
+        self.seconds = 0.0
+
+    def process_ready(self, launch, elapsed):
+        """Default readiness probe: exited, or idle after using CPU (see the module documentation)."""
+        from .registry import process_cpu_time
+
+        process = launch.process
+        if process is None or process.poll() is not None:
+            return elapsed
+        if elapsed >= READY_TIMEOUT:
+            return elapsed
+        expected = self.expected.get(launch.name, DEFAULT_LAUNCH_SECONDS)
+        cpu_seconds = process_cpu_time(process.pid)
+        if cpu_seconds is None:
+            return elapsed if elapsed >= expected else None
+        if launch.cpu_seconds is None or cpu_seconds - launch.cpu_seconds > IDLE_CPU_SECONDS:
+            launch.busy_until = elapsed
+        launch.cpu_seconds = cpu_seconds
+        settled = elapsed - launch.busy_until >= SETTLE_SECONDS
+        if settled and (cpu_seconds >= MIN_CPU_SECONDS or elapsed >= expected):
+            return launch.busy_until
+        return None
+
+    def _wait_ready(self, launches, wave_start):
+        pending = [launch for launch in launches if launch.ok]
+        while pending:
+            elapsed = time.perf_counter() - wave_start
+            for launch in list(pending):
+                ready_seconds = self.is_ready(launch, elapsed)
+                if ready_seconds is not None:
+                    launch.ready_seconds = ready_seconds
+                    pending.remove(launch)
+                    if self.on_ready is not None:
+                        self.on_ready(launch)
+            if pending:
+                time.sleep(POLL_INTERVAL)
+
+    def run(self, databases, wait_last=False):
+        """Launch every database
+
+        Args:
+            databases (list): (name, entry) tuples.
+            wait_last (bool, optional): With GATE_READY, also wait until the last wave is ready
+            (otherwise the run ends as soon as it is started). Defaults to False.
+
+        Returns:
+            list: ScheduledLaunch per database, in launch order. 'waves' holds (size, seconds) for
+            every wave that was seen ready, 'seconds' the duration of the run.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        run_start = time.perf_counter()
+        self.launches = []
+        self.waves = []
+        waves = plan_waves(databases, self.max_concurrent)
+        if not waves:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrent, len(databases))) as executor:
+            for number, wave in enumerate(waves):
+                wave_start = time.perf_counter()
+                results = executor.map(lambda database: self.start(*database), wave)
+                launches = [ScheduledLaunch(result, number, wave_start - run_start) for result in results]
+                self.launches.extend(launches)
+                if self.on_start is not None:
+                    for launch in launches:
+                        self.on_start(launch)
+                last = number == len(waves) - 1
+                if self.gate == GATE_READY and (wait_last or not last):
+                    self._wait_ready(launches, wave_start)
+                    if any(launch.process is not None for launch in launches):
+                        self.waves.append((len(wave), time.perf_counter() - wave_start))
+                elif self.gate == GATE_DELAY and not last:
+                    time.sleep(self.delay)
+        self.seconds = time.perf_counter() - run_start
+        return self.launches
+
+
+def _average(average, value):
+    return value if average is None else average + SMOOTHING * (value - average)
+
+
+class LaunchHistory:
+    """Launch times measured in earlier runs ('.pykeypass/launches.json')
+
+    Args:
+        pykeypass_folder (Path): pykeypass folder holding the history.
+    """
+
+    def __init__(self, pykeypass_folder):
+        self.path = pykeypass_folder / "launches.json"
+        try:
+            history = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            history = {}
+        if not isinstance(history, dict):
+            history = {}
+        self.databases = history.get("databases", {})
+        self.concurrency_levels = history.get("concurrency", {})
+        self.runs = history.get("runs", 0)
+
+    def expected(self, name):
+        """Expected launch time of a database in seconds (DEFAULT_LAUNCH_SECONDS if never measured)."""
+        record = self.databases.get(name)
+        return record["seconds"] if record else DEFAULT_LAUNCH_SECONDS
+
+    def expected_times(self, names):
+        """Expected launch time per name."""
+        return {name: self.expected(name) for name in names}
+
+    def delay(self, names):
+        """Default delay between waves: the median expected launch time of 'names'."""
+        import statistics
+
+        return statistics.median([self.expected(name) for name in names]) if names else DEFAULT_LAUNCH_SECONDS
+
+    def concurrency(self, explore=True):
+        """Default wave size
+
+        The size with the best measured throughput (DEFAULT_CONCURRENCY while none was measured).
+        With 'explore', every EXPLORE_EVERY runs the neighbour of that size (half or twice it) that
+        was measured least often is returned instead.
+        """
+        best = DEFAULT_CONCURRENCY
+        if self.concurrency_levels:
+            level = max(self.concurrency_levels.items(), key=lambda level: (level[1]["throughput"], -int(level[0])))
+            best = int(level[0])
+        if not explore or self.runs % EXPLORE_EVERY != EXPLORE_EVERY - 1:
+            return best
+        neighbours = sorted({max(best // 2, 1), best * 2} - {best})
+        return min(neighbours, key=lambda size: self.concurrency_levels.get(str(size), {}).get("runs", 0))
+
+    def record(self, scheduler):
+        """Fold the launch and wave times seen ready by a scheduler run into the history."""
+        self.runs += 1
+        for launch in scheduler.launches:
+            if launch.process is not None and launch.ready_seconds is not None:
+                record = self.databases.setdefault(launch.name, {"seconds": None, "runs": 0})
+                record["seconds"] = _average(record["seconds"], launch.ready_seconds)
+                record["runs"] += 1
+        for size, seconds in scheduler.waves:
+            if seconds > 0:
+                level = self.concurrency_levels.setdefault(str(size), {"throughput": None, "runs": 0})
+                level["throughput"] = _average(level["throughput"], size / seconds)
+                level["runs"] += 1
+
+    def save(self):
+        history_tmp = self.path.with_suffix(".tmp")
+        history = {"databases": self.databases, "concurrency": self.concurrency_levels, "runs": self.runs}
+        history_tmp.write_text(json.dumps(history, indent=2))
+        os.replace(history_tmp, self.path)
@@ -0,0 +1,204 @@
+"""Interactive pykeypass session ('pykeypass shell')
+
+Every 'pykeypass <command>' is a new process that unlocks the app database again. The shell
+unlocks it once and runs the usual commands (list, path, open, manage, tag, priority, compact, all,
+verify and status, with the same options and output) against that single unlocked session:
+
+- entry names are completed with TAB (from the unlocked database, no lookup on disk);
+- changes made by 'manage', 'tag' and 'priority' are staged and written in one save when the shell
+  exits, or earlier with 'save';
+- after 'idle_timeout' seconds without a command the staged changes are saved and the session is
+  locked: the decrypted database is dropped from memory and the next command asks for the password
+  again ('lock' does the same right away).
+"""
+import cmd
+import shlex
+import threading
+
+from .client import PyKeypassClient
+from .completion import database_names
+
+DEFAULT_IDLE_TIMEOUT = 300
+
+COMMANDS = ("list", "path", "open", "manage", "tag", "priority", "compact", "all", "verify", "status")
+
+
+class ShellClient(PyKeypassClient):
+    """PyKeypassClient kept open across the commands of a shell session
+
+    The 'with client:' blocks of the commands (e.g. 'manage', 'tag') neither save nor close it: changes
+    stay staged until 'save', 'lock', the idle lock or the end of the shell.
+    """
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class PyKeypassShell(cmd.Cmd):
+    """Command loop of 'pykeypass shell'
+
+    Args:
+        client (ShellClient): Session shared by every command.
+        run (callable): Runs one pykeypass command: run(argv) with argv like ['open', 'work'].
+        idle_timeout (float, optional): Seconds without a command before the session locks (0 never
+        locks). Defaults to DEFAULT_IDLE_TIMEOUT.
+    """
+
+    prompt = "pykeypass> "
+    intro = "pykeypass shell: TAB completes commands and entry names, 'help' lists the commands."
+
+    def __init__(self, client, run, idle_timeout=DEFAULT_IDLE_TIMEOUT, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.client = client
+        self.run = run
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self._timer = None
+
+    def _print(self, text):
+        self.stdout.write(f"{text}\n")
+        self.stdout.flush()
+
+    def onecmd(self, line):
+        with self.lock:
+            return super().onecmd(line)
+
+    def precmd(self, line):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return line
+
+    def postcmd(self, stop, line):
+        if not stop and self.idle_timeout:
+            self._timer = threading.Timer(self.idle_timeout, self.idle_lock)
+            self._timer.daemon = True
+            self._timer.start()
+        return stop
+
+    def emptyline(self):
+        pass
+
+    def default(self, line):
+        self._print(f"ERROR: '{line.split()[0]}' is not available in the pykeypass shell (try 'help').")
+
+    def lock_session(self):
+        """Save staged changes and drop the unlocked database; False if it was already locked."""
+        if not self.client.unlocked:
+            return False
+        self.client.save()
+        self.client.close()
+        return True
+
+    def idle_lock(self):
+        """Timer callback: lock the session after 'idle_timeout' seconds without a command."""
+        with self.lock:
+            if self.lock_session():
+                self._print(
+                    f"\nNOTICE: pykeypass shell locked after {self.idle_timeout:g}s idle; "
+                    "the next command asks for the password again."
+                )
+
+    def _run(self, command, arg):
+        try:
+            argv = shlex.split(arg)
+        except ValueError as e:
+            self._print(f"ERROR: {e}")
+            return
+        self.run([command, *argv])
+
+    def _complete_names(self, text, line, begidx, endidx):
+        if self.client.unlocked:
+            names = self.client.list()
+        else:
+            names = database_names(self.client.pykeypass_folder)
+        return sorted(name for name in names if name.startswith(text))
+
+    def do_list(self, arg):
+        """Lists available Keepass databases to launch."""
+        self._run("list", arg)
+
+    def do_path(self, arg):
+        """path <database>: shows file(s) for a database entry."""
+        self._run("path", arg)
+
+    def do_open(self, arg):
+        """open <database> | --profile <tag> [--wait] [--force] [--cache]: launches Keepass databases."""
+        self._run("open", arg)
+
+    def do_manage(self, arg):
+        """manage <database> | --from-file <manifest>: adds or replaces database entries (saved on exit)."""
+        self._run("manage", arg)
+
+    def do_tag(self, arg):
+        """tag <database> [tags] [--remove]: shows, adds or removes tags (saved on exit)."""
+        self._run("tag", arg)
+
+    def do_priority(self, arg):
+        """priority <database> [N]: shows or sets the launch priority (saved on exit)."""
+        self._run("priority", arg)
+
+    def do_compact(self, arg):
+        """Writes the journaled changes (and the staged ones) into the app database now."""
+        self._run("compact", arg)
+
+    def do_all(self, arg):
+        """all [--workers N] [--gate ready|delay|none] [--wait] [--force] [--cache]: launches all database entries."""
+        self._run("all", arg)
+
+    def do_verify(self, arg):
+        """verify [databases]: test-unlocks databases with their stored credentials."""
+        self._run("verify", arg)
+
+    def do_status(self, arg):
+        """status [databases]: checks which databases are reachable."""
+        self._run("status", arg)
+
+    complete_path = complete_open = complete_manage = complete_tag = complete_priority = _complete_names
+    complete_verify = complete_status = _complete_names
+
+    def do_help(self, arg):
+        """help [command]: lists the commands, or shows the options of one."""
+        if arg in COMMANDS:
+            self.run([arg, "--help"])
+        else:
+            super().do_help(arg)
+
+    def do_save(self, arg):
+        """Writes the staged changes now."""
+        if self.client.dirty:
+            self.client.save()
+            self._print("STATUS: Changes saved.")
+        else:
+            self._print("STATUS: No changes to save.")
+
+    def do_lock(self, arg):
+        """Saves staged changes and locks the session; the next command asks for the password."""
+        self.lock_session()
+        self._print("STATUS: pykeypass shell locked.")
+
+    def do_exit(self, arg):
+        """Saves staged changes and leaves the shell."""
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, arg):
+        """Leaves the shell (Ctrl+D), like 'exit'."""
+        self._print("")
+        return True
+
+    def close(self):
+        """Stop the idle timer, save staged changes and lock the session.
+
+        Returns:
+            bool: True if changes were saved.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        with self.lock:
+            saved = self.client.dirty
+            self.lock_session()
+        return saved
@@ -0,0 +1,102 @@
+"""Reachability of the Keepass database files ('pykeypass status')
+
+Every database and key file is checked with a single 'stat' call, all of them at the same time.
+A 'stat' on a dead network share can hang for a long time and cannot be interrupted, so each one
+runs in its own daemon thread and is given up (reported as timed out) once the timeout expires;
+the command never waits for it.
+"""
+import os
+import threading
+import time
+
+DATABASE = "database"
+KEY = "key"
+
+DEFAULT_TIMEOUT = 2.0
+
+
+class PathStatus:
+    """Result of checking one file
+
+    Args:
+        name (str): Entry name in the app database.
+        kind (str): DATABASE or KEY.
+        path (str): Location of the file (None if the entry has no url).
+    """
+
+    def __init__(self, name, kind, path):
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.size = None
+        self.modified = None
+        self.latency = None
+        self.error = None
+
+    @property
+    def reachable(self):
+        """True if the file answered in time."""
+        return self.size is not None
+
+    def as_dict(self):
+        """JSON-ready form ('modified' as an ISO 8601 UTC timestamp)."""
+        from datetime import datetime, timezone
+
+        modified = None
+        if self.modified is not None:
+            modified = datetime.fromtimestamp(self.modified, timezone.utc).isoformat(timespec="seconds")
+        return {
+            "kind": self.kind,
+            "path": self.path,
+            "reachable": self.reachable,
+            "size": self.size,
+            "modified": modified,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 1),
+            "error": self.error,
+        }
+
+
+def _stat(path, start, answers):
+    try:
+        file_stat = os.stat(path)
+    except OSError as e:
+        answers[path] = (None, None, time.perf_counter() - start, e.strerror or str(e))
+    else:
+        answers[path] = (file_stat.st_size, file_stat.st_mtime, time.perf_counter() - start, None)
+
+
+def check_paths(databases, timeout=DEFAULT_TIMEOUT):
+    """Stat the database and key file of every entry concurrently
+
+    Args:
+        databases (list): (name, entry) tuples; 'entry' may be None for an unknown name.
+        timeout (float, optional): Seconds each file gets to answer. Defaults to DEFAULT_TIMEOUT.
+
+    Returns:
+        list: PathStatus per file, in the order of 'databases' (database before key file).
+    """
+    statuses = []
+    for name, entry in databases:
+        statuses.append(PathStatus(name, DATABASE, getattr(entry, "url", None)))
+        key_file = entry.get_custom_property("key") if entry is not None else None
+        if key_file:
+            statuses.append(PathStatus(name, KEY, key_file))
+    start = time.perf_counter()
+    answers = {}
+    threads = {}
+    for path in dict.fromkeys(status.path for status in statuses if status.path):
+        threads[path] = threading.Thread(target=_stat, args=(path, start, answers), daemon=True)
+        threads[path].start()
+    deadline = start + timeout
+    for thread in threads.values():
+        thread.join(max(deadline - time.perf_counter(), 0))
+    for status in statuses:
+        if not status.path:
+            status.error = "not configured"
+        elif status.path in answers:
+            status.size, status.modified, status.latency, status.error = answers[status.path]
+        else:
+            # still hanging: the thread is left behind, its late answer is ignored
+            status.latency = timeout
+            status.error = f"timed out after {timeout:g}s"
+    return statuses
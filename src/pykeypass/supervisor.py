@@ -0,0 +1,132 @@
+"""Launch supervision for 'pykeypass open --wait' and 'pykeypass all --wait'
+
+A plain launch starts Keepass and returns right away, so a Keepass that fails to start goes
+unnoticed. The supervisor starts every Keepass process from a single asyncio event loop (no thread
+per process) and follows it until it exits:
+
+- stdout and stderr are drained continuously, so a chatty process never blocks on a full pipe;
+  the last OUTPUT_LIMIT bytes are kept for the report.
+- A process is ready once it writes to stdout, or once it is still running after the startup
+  window (Keepass itself does not print anything).
+- A process that exits within the startup window failed to start (or, with exit status 0, handed
+  the database to an already running Keepass).
+"""
+import time
+
+DEFAULT_WINDOW = 5.0
+OUTPUT_LIMIT = 4096
+
+
+class LaunchResult:
+    """Outcome of a supervised launch
+
+    Args:
+        name (str): Entry name in the app database.
+        pid (int, optional): Process id, None if the process could not be started.
+        error (str, optional): Why the process could not be started.
+    """
+
+    def __init__(self, name, pid=None, error=None):
+        self.name = name
+        self.pid = pid
+        self.error = error
+        self.ready_seconds = None
+        self.returncode = None
+        self.seconds = 0.0
+        self.output = ""
+
+    @property
+    def early_exit(self):
+        """True when the process exited within the startup window."""
+        return self.error is None and self.ready_seconds is None
+
+
+async def _drain(stream, output, ready=None):
+    while True:
+        chunk = await stream.read(1024)
+        if not chunk:
+            return
+        output.extend(chunk)
+        del output[:-OUTPUT_LIMIT]
+        if ready is not None:
+            ready.set()
+
+
+async def supervise(name, argv, window=DEFAULT_WINDOW, on_ready=None, stdin=None):
+    """Start one process and follow it until it exits
+
+    Args:
+        name (str): Entry name, used in the result.
+        argv (list): Command line of the process.
+        window (float, optional): Startup window in seconds. Defaults to DEFAULT_WINDOW.
+        on_ready (callable, optional): Called with the LaunchResult as soon as the process is ready.
+        stdin (bytes, optional): Written to the process' stdin (e.g. passwords). Defaults to None.
+
+    Returns:
+        LaunchResult: The result, once the process exited.
+    """
+    import asyncio
+    import subprocess
+
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        result = LaunchResult(name, error=str(e))
+        result.seconds = time.perf_counter() - start
+        return result
+    result = LaunchResult(name, pid=process.pid)
+    if stdin is not None:
+        try:
+            process.stdin.write(stdin)
+            await process.stdin.drain()
+            process.stdin.close()
+        except OSError:
+            pass  # exited early, reported with its exit status
+    output = bytearray()
+    printed = asyncio.Event()
+    drains = asyncio.gather(_drain(process.stdout, output, printed), _drain(process.stderr, output))
+    exited = asyncio.ensure_future(process.wait())
+    ready = asyncio.ensure_future(printed.wait())
+    await asyncio.wait({exited, ready}, timeout=window, return_when=asyncio.FIRST_COMPLETED)
+    ready.cancel()
+    if not exited.done() or printed.is_set():
+        result.ready_seconds = time.perf_counter() - start
+        if on_ready is not None:
+            on_ready(result)
+    result.returncode = await exited
+    await drains
+    result.seconds = time.perf_counter() - start
+    result.output = output.decode("utf-8", errors="replace").strip()
+    return result
+
+
+def supervise_launches(launches, window=DEFAULT_WINDOW, on_ready=None, on_exit=None):
+    """Start and follow several processes concurrently
+
+    Args:
+        launches (list): (name, argv, stdin) tuples ('stdin' bytes or None, see 'supervise').
+        window (float, optional): Startup window in seconds. Defaults to DEFAULT_WINDOW.
+        on_ready (callable, optional): Called with each LaunchResult once its process is ready.
+        on_exit (callable, optional): Called with each LaunchResult once its process exited.
+
+    Returns:
+        list: LaunchResult per launch, in the order of 'launches'.
+    """
+    import asyncio
+
+    async def follow(name, argv, stdin):
+        result = await supervise(name, argv, window, on_ready, stdin)
+        if on_exit is not None:
+            on_exit(result)
+        return result
+
+    async def follow_all():
+        return await asyncio.gather(*(follow(name, argv, stdin) for name, argv, stdin in launches))
+
+    return asyncio.run(follow_all())
@@ -0,0 +1,103 @@
+"""Test-unlock the Keepass databases registered in the pykeypass app database
+
+'pykeypass verify' opens every target database with pykeepass, using the url, password and key
+file stored in the app database, to find stale passwords and moved files before Keepass does.
+Unlocking a target is dominated by its key derivation function, which is CPU bound, so the checks
+run in a process pool: with one worker per core the whole run takes about as long as the slowest
+single unlock.
+"""
+import os
+import time
+
+OK = "OK"
+WRONG_CREDENTIALS = "wrong credentials"
+MISSING_FILE = "missing file"
+MISSING_KEY_FILE = "missing key file"
+NOT_CONFIGURED = "not configured"
+
+
+class VerifyResult:
+    """Outcome of a single test-unlock
+
+    Args:
+        name (str): Entry name in the app database.
+        status (str): OK, WRONG_CREDENTIALS, MISSING_FILE, MISSING_KEY_FILE, NOT_CONFIGURED or
+        "error (<message>)".
+        seconds (float): Time spent checking the database.
+    """
+
+    def __init__(self, name, status, seconds=0.0):
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+
+def verify_database(url, password, key_file=None):
+    """Open a Keepass database to check its credentials (runs in a worker process)
+
+    Args:
+        url (str): Path of the Keepass database.
+        password (str): Keepass database password.
+        key_file (str, optional): Key file path. Defaults to None.
+
+    Returns:
+        tuple: (status, seconds).
+    """
+    from pykeepass import PyKeePass
+    from pykeepass import exceptions as pykeepass_exceptions
+
+    start = time.perf_counter()
+    if not url or not os.path.isfile(url):
+        status = MISSING_FILE
+    elif key_file and not os.path.isfile(key_file):
+        status = MISSING_KEY_FILE
+    else:
+        try:
+            PyKeePass(url, password=password, keyfile=key_file or None)
+            status = OK
+        except pykeepass_exceptions.CredentialsError:
+            status = WRONG_CREDENTIALS
+        except FileNotFoundError:
+            status = MISSING_FILE
+        except Exception as e:  # noqa: BLE001 - reported per database instead of aborting the run
+            status = f"error ({e})"
+    return status, time.perf_counter() - start
+
+
+def verify_entries(databases, workers=None):
+    """Test-unlock databases in parallel
+
+    Args:
+        databases (list): (name, entry) tuples; 'entry' is None for names missing from the app
+        database.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Yields:
+        VerifyResult: One result per database, in completion order.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    targets = []
+    for name, entry in databases:
+        if entry is None:
+            yield VerifyResult(name, NOT_CONFIGURED)
+        else:
+            targets.append((name, (entry.url, entry.password, entry.get_custom_property("key"))))
+    workers = max(min(workers or os.cpu_count() or 1, len(targets)), 1)
+    if workers == 1:
+        # a single check does not make up for starting a worker process
+        for name, arguments in targets:
+            yield VerifyResult(name, *verify_database(*arguments))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(verify_database, *arguments): name for name, arguments in targets}
+        for future in as_completed(futures):
+            try:
+                status, seconds = future.result()
+            except Exception as e:  # noqa: BLE001 - e.g. BrokenProcessPool when a worker died
+                status, seconds = f"error ({e or type(e).__name__})", 0.0
+            yield VerifyResult(futures[future], status, seconds)
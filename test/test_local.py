@@ -1,18 +1,49 @@
 # ruff: noqa: S101
+import json
 import os
 import shutil
+import signal
+import stat
 import subprocess
+import sys
+import threading
 import time
+from multiprocessing.connection import Client
 from pathlib import Path
 
 import pykeepass as keepass
 import pytest
 
 # PyPI
+from click.shell_completion import ShellComplete
 from click.testing import CliRunner
 
 # LOCAL
-from pykeypass import cli
+from pykeypass import cli, path_selection
+from pykeypass import client as pykeypass_client
+from pykeypass import status as pykeypass_status
+from pykeypass import verify as pykeypass_verify
+from pykeypass.agent import Agent, AgentEntry, AgentUnavailable, agent_address, request
+from pykeypass.cache import COPIED, DatabaseCache
+from pykeypass.cache import UP_TO_DATE as CACHE_UP_TO_DATE
+from pykeypass.client import OpenResult, PyKeypassClient
+from pykeypass.completion import NAME_CACHE_ENV, clear_names, store_names
+from pykeypass.index import EntryIndex
+from pykeypass.install import UP_TO_DATE, UPGRADED, bundled_keepass, file_digest, install_keepass
+from pykeypass.journal import ChangeJournal
+from pykeypass.kdf import MIB, calibrate
+from pykeypass.launchers import KeePassLauncher, KeePassXCLauncher, StubLauncher
+from pykeypass.manifest import validate_rows
+from pykeypass.reader import AppDatabaseReader, UnsupportedFormat
+from pykeypass.scheduler import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_LAUNCH_SECONDS,
+    EXPLORE_EVERY,
+    LaunchHistory,
+    LaunchScheduler,
+    plan_waves,
+)
+from pykeypass.shell import PyKeypassShell, ShellClient
 
 test_dir = Path.cwd() / "test"
 test_database_no_key = test_dir / "Database.kdbx"
@@ -22,6 +53,13 @@ test_database_with_key_key = test_dir / "Database_key.key"
 # START CLICK PYTEST FUNCTIONALITY
 runner = CliRunner()
 
+# Wall-clock budgets are measured on Linux; process start and file system are slower on Windows.
+TIMING_ENV = "PYKEYPASS_TIMING_TESTS"
+timing_test = pytest.mark.skipif(
+    sys.platform == "win32" and os.environ.get(TIMING_ENV) != "1",
+    reason=f"timings are unreliable on Windows (set {TIMING_ENV}=1 to run)",
+)
+
 
 # PREPARE TEST DATABASE
 def test_ci_setup():
@@ -46,13 +84,13 @@ def test_ci_setup():
     assert os.path.exists(test_dir / ".pykeypass") is False
 
 
-# def test_ci_pykeypass_all_no_db():
-#     result = runner.invoke(cli, ["all", "-t"], input="12345\n")
-#     assert result.exit_code == 0
-#     assert (
-#         "ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n"
-#         in result.output
-#     )
+def test_ci_pykeypass_all_no_db():
+    result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert (
+        "ERROR: pykeepass app database not found. Use 'pykeypass setup' to get started.\n"
+        in result.output
+    )
 
 
 def test_ci_pykeypass_setup():
@@ -60,6 +98,7 @@ def test_ci_pykeypass_setup():
     result = runner.invoke(cli, ["setup", "-t"], input="12345\n")
     assert result.exit_code == 0
     assert not result.exception
+    assert "STATUS: Keepass executable installed" in result.output
     assert "STEP 1: Create pykeypass app database." in result.output
     assert (
         "DONE: pykeypass app database created.\n"
@@ -99,10 +138,52 @@ def test_ci_pykeypass_setup_again_replace():
     ) in result.output
 
 
-# def test_ci_pykeypass_all_db_empty():
-#     result = runner.invoke(cli, ["all", "-t"], input="12345\n")
-#     assert result.exit_code == 0
-#     assert "NOTICE: No entry created. Use 'pykeypass open <new_name> -s'" in result.output
+def test_ci_pykeypass_setup_calibrated():
+    result = runner.invoke(cli, ["setup", "--target-unlock-ms", "150", "-t"], input="y\n12345\n")
+    assert result.exit_code == 0
+    assert "STATUS: Calibrating the key derivation for a 150 ms unlock." in result.output
+    assert "STATUS: Argon2 memory " in result.output
+    assert json.loads((path_selection(True)[0] / "kdf.json").read_text())["target_ms"] == 150
+    assert "DONE: pykeypass app database created.\n" in result.output
+
+
+def test_ci_pykeypass_setup_install(tmp_path, monkeypatch):
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    result = runner.invoke(cli, ["setup", "-t"], input="n\n")
+    assert "STATUS: Keepass executable is up to date." in result.output
+    manifest = json.loads((pykeypass_folder / "install.json").read_text())
+    assert manifest["installed"]["sha256"] == file_digest(bundled_keepass())
+    assert file_digest(pykeypass_app) == manifest["installed"]["sha256"]
+
+    # a stale executable is replaced; without hard links or reflinks it is copied
+    def no_link(source, target):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    monkeypatch.setattr("pykeypass.install._reflink", no_link)
+    folder = tmp_path / ".pykeypass"
+    folder.mkdir()
+    (folder / "keepass.exe").write_bytes(b"old keepass")
+    assert install_keepass(folder, folder / "keepass.exe") == (UPGRADED, "copy")
+    assert file_digest(folder / "keepass.exe") == manifest["installed"]["sha256"]
+    assert install_keepass(folder, folder / "keepass.exe") == (UP_TO_DATE, "copy")
+    assert not (folder / ".keepass.exe.tmp").exists()
+
+    # failures to write the app database are not reported as installation failures
+    def disk_full(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr("pykeypass.create_app_database", disk_full)
+    result = runner.invoke(cli, ["setup", "-t"], input="y\n12345\n")
+    assert f"ERROR: pykeypass app database could not be created at {pykeypass_db}: " in result.output
+    assert "No space left on device" in result.output
+    assert "Keepass executable could not be installed" not in result.output
+
+
+def test_ci_pykeypass_all_db_empty():
+    result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "NOTICE: No entry created. Use 'pykeypass open <new_name> -s'" in result.output
 
 
 @pytest.mark.filterwarnings("ignore:GetPassWarning")
@@ -144,6 +225,21 @@ def test_ci_pykeypass_path_with_key():
     assert result.exit_code == 0
 
 
+def test_ci_pykeypass_entry_index():
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    index = EntryIndex(kp)
+    assert index.names() == ["new_entry", "new_entry_key"]
+    assert index.entry("new_entry_key") == kp.find_entries(title="new_entry_key", first=True)
+    assert index.entry("new_entry_key").get_custom_property("key") == str(test_database_with_key_key)
+    assert index.group("new_entry").name == "new_entry"
+    assert index.entry("new_entry_fake") is None
+    index.remove("new_entry")
+    assert "new_entry" not in index
+    index.add(kp.find_groups(name="new_entry", first=True))
+    assert index.entry("new_entry").url == str(test_database_no_key)
+
+
 def test_ci_pykeypass_db_invalid_password():
     result = runner.invoke(cli, ["manage", "new_entry", "-t"], input="54321\n")
     assert "ERROR: pykeypass login information invalid.\n" in result.output
@@ -162,6 +258,24 @@ def test_ci_pykeypass_create_no_key_replace():
     assert result.exit_code == 0
 
 
+def test_ci_pykeypass_create_no_key_replace_declined():
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    modified = os.stat(pykeypass_db).st_mtime_ns
+    result = runner.invoke(cli, ["manage", "new_entry", "-t"], input="12345\nn\n")
+    assert result.exit_code == 0
+    assert "new_entry keepass setup cancelled." in result.output
+    assert os.stat(pykeypass_db).st_mtime_ns == modified
+
+
+def test_ci_pykeypass_replace_keeps_single_group():
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")
+    assert len(kp.find_groups(name="new_entry")) == 1
+    assert len(kp.find_entries(title="new_entry")) == 1
+    assert os.listdir(pykeypass_folder).count("pykeepass.kdbx") == 1
+    assert [name for name in os.listdir(pykeypass_folder) if name.endswith(".tmp")] == []
+
+
 @pytest.mark.filterwarnings("ignore:GetPassWarning")
 def test_ci_pykeypass_path_invalid_password():
     result = runner.invoke(cli, ["path", "new_entry", "-t"], input="54321\n")
@@ -204,11 +318,952 @@ def test_ci_pykeypass_open_entry_with_key():
     assert result.exit_code == 0
 
 
-# def test_ci_pykeypass_all():
-#     result = runner.invoke(cli, ["all", "-t"], input="12345\n")
-#     assert result.exit_code == 0
-#     assert "STATUS: new_entry keypass database launched successfully." in result.output
-#     assert "STATUS: new_entry_key keypass database launched successfully." in result.output
+def test_ci_pykeypass_agent():
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    agent = Agent(pykeypass_db)
+    agent.unlock("12345")
+    server = threading.Thread(target=agent.serve, args=(pykeypass_folder,), daemon=True)
+    server.start()
+    for _ in range(100):
+        try:
+            request(pykeypass_folder, "status")
+            break
+        except AgentUnavailable:
+            time.sleep(0.05)
+    # a client that connects and never sends anything does not block the others
+    address, family = agent_address(pykeypass_folder)
+    idle = Client(address, family=family)
+    result = runner.invoke(cli, ["path", "new_entry", "-t"])
+    assert str(test_database_no_key) in result.output
+    assert "password" not in result.output
+    idle.close()
+    result = runner.invoke(cli, ["list", "-t"])
+    assert "ENTRIES AVAILABLE: \nnew_entry" in result.output
+    result = runner.invoke(cli, ["agent", "lock", "-t"])
+    assert "STATUS: pykeypass agent locked." in result.output
+    result = runner.invoke(cli, ["path", "new_entry", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    assert str(test_database_no_key) in result.output
+    result = runner.invoke(cli, ["agent", "stop", "-t"])
+    assert "STATUS: pykeypass agent stopped." in result.output
+    server.join(5)
+    assert server.is_alive() is False
+    result = runner.invoke(cli, ["agent", "status", "-t"])
+    assert "ERROR: pykeypass agent not running" in result.output
+
+
+def test_ci_pykeypass_key_cache(monkeypatch):
+    monkeypatch.setenv("PYKEYPASS_KEY_CACHE_TTL", "60")
+    result = runner.invoke(cli, ["path", "new_entry", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    assert os.path.exists(test_dir / ".pykeypass" / "key.cache")
+    result = runner.invoke(cli, ["path", "new_entry", "-t"])
+    assert "password" not in result.output
+    assert str(test_database_no_key) in result.output
+    result = runner.invoke(cli, ["tag", "new_entry", "-t"])
+    assert "password" not in result.output
+    # changes are never made with the cached key
+    result = runner.invoke(cli, ["tag", "new_entry", "cached", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    result = runner.invoke(cli, ["tag", "new_entry", "cached", "--remove", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    result = runner.invoke(cli, ["compact", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    monkeypatch.setenv("PYKEYPASS_KEY_CACHE_TTL", "0")
+    result = runner.invoke(cli, ["path", "new_entry", "-t"], input="12345\n")
+    assert "pykeypass password: " in result.output
+    assert os.path.exists(test_dir / ".pykeypass" / "key.cache") is False
+
+
+def test_ci_pykeypass_all(monkeypatch):
+    launched = []
+    monkeypatch.setattr(subprocess, "Popen", lambda command, **kwargs: launched.append(command))
+    result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "STATUS: new_entry keypass database launched successfully." in result.output
+    assert "STATUS: new_entry_key keypass database launched successfully." in result.output
+    assert "DONE: 2 of 2 keepass databases launched." in result.output
+    assert len(launched) == 2
+
+
+def test_ci_pykeypass_all_invalid_password():
+    result = runner.invoke(cli, ["all", "-t"], input="54321\n")
+    assert "ERROR: pykeypass login information invalid.\n" in result.output
+    assert result.exit_code == 0
+
+
+def test_ci_pykeypass_manage_from_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYKEYPASS_TEST_PASSWORD", "12345")
+    manifest = tmp_path / "databases.csv"
+    manifest.write_text(
+        "name,url,password,key\n"
+        + f"bulk_no_key,{test_database_no_key},env:PYKEYPASS_TEST_PASSWORD,\n"
+        + f"bulk_key,{test_database_with_key},12345,{test_database_with_key_key}\n"
+        + f"new_entry,{test_database_no_key},12345,\n"
+    )
+    result = runner.invoke(cli, ["manage", "--from-file", str(manifest), "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "ADDED: bulk_no_key" in result.output
+    assert "ADDED: bulk_key" in result.output
+    assert "SKIPPED: new_entry (already exists, use --replace)" in result.output
+    assert "DONE: 2 added, 0 replaced, 1 skipped." in result.output
+    result = runner.invoke(cli, ["path", "bulk_key", "-t"], input="12345\n")
+    assert str(test_database_with_key_key) in result.output
+    result = runner.invoke(
+        cli, ["manage", "--from-file", str(manifest), "--replace", "-t"], input="12345\n"
+    )
+    assert "DONE: 0 added, 3 replaced, 0 skipped." in result.output
+
+
+def test_ci_pykeypass_manage_from_file_invalid(tmp_path):
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    modified = os.stat(pykeypass_db).st_mtime_ns
+    manifest = tmp_path / "databases.json"
+    manifest.write_text(
+        '[{"name": "bulk_invalid", "url": "db.kdbx", "password": "env:PYKEYPASS_UNSET_PASSWORD"},'
+        + ' {"name": "bulk_invalid_2", "password": "12345"}]'
+    )
+    result = runner.invoke(cli, ["manage", "--from-file", str(manifest), "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "ERROR: 2 invalid manifest row(s), nothing was changed:" in result.output
+    assert "- row 1 (bulk_invalid): environment variable 'PYKEYPASS_UNSET_PASSWORD' is not set" in result.output
+    assert "- row 2 (bulk_invalid_2): missing url" in result.output
+    # csv rows with more values than columns
+    manifest = tmp_path / "databases.csv"
+    manifest.write_text("name,url,password,notes\na,b,c,d,e\n")
+    result = runner.invoke(cli, ["manage", "--from-file", str(manifest), "-t"], input="12345\n")
+    assert result.exception is None
+    assert "- row 1 (a): unknown column(s) notes; 1 extra value(s)" in result.output
+    manifest.write_text("name,url,password\nb,c,d,e,f\n")
+    result = runner.invoke(cli, ["manage", "--from-file", str(manifest), "-t"], input="12345\n")
+    assert "- row 1 (b): 2 extra value(s)" in result.output
+    assert "None" not in result.output
+    assert os.stat(pykeypass_db).st_mtime_ns == modified
+
+
+def test_ci_pykeypass_verify(tmp_path):
+    manifest = tmp_path / "databases.csv"
+    manifest.write_text(
+        "name,url,password,key\n"
+        + f"verify_wrong_password,{test_database_no_key},54321,\n"
+        + f"verify_missing_file,{test_dir / 'Missing.kdbx'},12345,\n"
+        + f"verify_missing_key,{test_database_with_key},12345,{test_dir / 'Missing.key'}\n"
+    )
+    result = runner.invoke(cli, ["manage", "--from-file", str(manifest), "-t"], input="12345\n")
+    assert "DONE: 3 added, 0 replaced, 0 skipped." in result.output
+    result = runner.invoke(cli, ["verify", "-t", "-w", "2"], input="12345\n")
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert any(line.startswith("new_entry ") and " OK " in line for line in lines)
+    assert any(line.startswith("new_entry_key ") and " OK " in line for line in lines)
+    assert any(line.startswith("verify_wrong_password ") and "wrong credentials" in line for line in lines)
+    assert any(line.startswith("verify_missing_file ") and "missing file" in line for line in lines)
+    assert any(line.startswith("verify_missing_key ") and "missing key file" in line for line in lines)
+    assert "DONE: 4 of 7 keepass databases verified in " in result.output
+    result = runner.invoke(cli, ["verify", "new_entry_key", "unknown_entry", "-t"], input="12345\n")
+    lines = result.output.splitlines()
+    assert any(line.startswith("new_entry_key ") and " OK " in line for line in lines)
+    assert any(line.startswith("unknown_entry ") and "not configured" in line for line in lines)
+    assert "DONE: 1 of 2 keepass databases verified in " in result.output
+
+
+def test_ci_pykeypass_verify_invalid_password():
+    result = runner.invoke(cli, ["verify", "-t"], input="54321\n")
+    assert "ERROR: pykeypass login information invalid.\n" in result.output
+    assert result.exit_code == 0
+
+
+def crash_verify(*args):
+    """Stand-in for 'verify_database' whose worker process dies (breaks the process pool)."""
+    os._exit(1)
+
+
+def test_ci_pykeypass_verify_broken_pool(monkeypatch):
+    monkeypatch.setattr(pykeypass_verify, "verify_database", crash_verify)
+    databases = [(name, AgentEntry(name, str(test_database_no_key), "12345")) for name in ("broken_a", "broken_b")]
+    results = list(pykeypass_verify.verify_entries(databases, workers=2))
+    assert sorted(result.name for result in results) == ["broken_a", "broken_b"]
+    assert all(not result.ok and result.status.startswith("error (") for result in results)
+
+
+def test_ci_pykeypass_profile(tmp_path, monkeypatch):
+    result = runner.invoke(cli, ["--profile", "path", "new_entry", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert str(test_database_no_key) in result.output
+    for phase in ("path", "path_selection", "unlock", "parse", "lookup"):
+        assert any(line.split()[0] == phase for line in result.output.splitlines() if line.strip())
+    trace_path = tmp_path / "trace.json"
+    monkeypatch.setenv("PYKEYPASS_TRACE", str(trace_path))
+    monkeypatch.setattr(subprocess, "Popen", lambda command, **kwargs: None)
+    result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "PHASE" not in result.output
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [event["name"] for event in events][:2] == ["all", "path_selection"]
+    launches = [event["args"]["database"] for event in events if event["name"] == "launch"]
+    kp = keepass.PyKeePass(path_selection(True)[2], password="12345")  # noqa: S106
+    assert sorted(launches) == sorted(EntryIndex(kp).names())
+
+
+def test_ci_pykeypass_open_wait(tmp_path, monkeypatch):
+    stub = tmp_path / "keepass_stub.py"
+    stub.write_text(
+        "import sys, time\n"
+        + "if 'Missing' in sys.argv[1]:\n"
+        + "    print('cannot open ' + sys.argv[1], file=sys.stderr)\n"
+        + "    sys.exit(2)\n"
+        + "print('ready', flush=True)\n"
+        + "time.sleep(0.5)\n"
+    )
+    monkeypatch.setattr(KeePassLauncher, "arguments", lambda self, entries: [sys.executable, str(stub), entries[0].url])
+    result = runner.invoke(cli, ["open", "new_entry", "--wait", "--window", "5", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "STATUS: new_entry keepass database ready after " in result.output
+    assert "STATUS: new_entry keepass database closed with status 0 after " in result.output
+    result = runner.invoke(cli, ["open", "verify_missing_file", "--wait", "-t"], input="12345\n")
+    assert "ERROR: verify_missing_file keepass database exited with status 2 after " in result.output
+    assert f"OUTPUT: cannot open {test_dir / 'Missing.kdbx'}" in result.output
+    start = time.perf_counter()
+    result = runner.invoke(cli, ["all", "--wait", "-t"], input="12345\n")
+    assert time.perf_counter() - start < 4
+    assert result.output.count("keepass database ready after ") == 6
+    assert "DONE: 6 of 7 keepass databases launched." in result.output
+
+
+def test_ci_pykeypass_open_already_running(tmp_path, monkeypatch):
+    stub = tmp_path / "keepass_stub.py"
+    stub.write_text("import time\ntime.sleep(30)\n")
+    monkeypatch.setattr(KeePassLauncher, "arguments", lambda self, entries: [sys.executable, str(stub)])
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    registry_path = pykeypass_folder / "processes.json"
+    try:
+        result = runner.invoke(cli, ["open", "new_entry", "-t"], input="12345\n")
+        assert result.exit_code == 0
+        first_pid = json.loads(registry_path.read_text())["new_entry"]["pid"]
+        result = runner.invoke(cli, ["open", "new_entry", "-t"], input="12345\n")
+        assert f"NOTICE: new_entry keepass database is already open (pid {first_pid}, started " in result.output
+        result = runner.invoke(cli, ["open", "new_entry", "--force", "-t"], input="12345\n")
+        assert "NOTICE" not in result.output
+        assert json.loads(registry_path.read_text())["new_entry"]["pid"] != first_pid
+        result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+        assert "DONE: 6 of 7 keepass databases launched, 1 already open." in result.output
+        result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+        assert "DONE: 0 of 7 keepass databases launched, 7 already open." in result.output
+        stop_registered_processes(registry_path)
+        os.kill(first_pid, signal.SIGTERM)
+        result = runner.invoke(cli, ["all", "-t"], input="12345\n")
+        assert "DONE: 7 of 7 keepass databases launched." in result.output
+    finally:
+        stop_registered_processes(registry_path)
+
+
+def stop_registered_processes(registry_path):
+    for record in json.loads(registry_path.read_text()).values():
+        try:
+            os.kill(record["pid"], signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def test_ci_pykeypass_all_batch(tmp_path, monkeypatch):
+    # plays a single instance Keepass: the first process stays up, later ones hand over and exit
+    stub = tmp_path / "keepass_stub.py"
+    stub.write_text(
+        "import os, sys, time\n"
+        + f"instance = {str(tmp_path / 'instance')!r}\n"
+        + "try:\n"
+        + "    os.close(os.open(instance, os.O_CREAT | os.O_EXCL))\n"
+        + "except FileExistsError:\n"
+        + f"    with open({str(tmp_path / 'handed_over')!r}, 'a') as handed_over:\n"
+        + "        handed_over.write(sys.argv[1] + '\\n')\n"
+        + "    sys.exit(0)\n"
+        + "time.sleep(30)\n"
+    )
+    monkeypatch.setattr(KeePassLauncher, "arguments", lambda self, entries: [sys.executable, str(stub), entries[0].url])
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    registry_path = pykeypass_folder / "processes.json"
+    try:
+        result = runner.invoke(cli, ["all", "--batch", "--window", "1", "-t"], input="12345\n")
+        assert result.exit_code == 0
+        assert result.output.count("keypass database launched successfully.") == 1
+        assert result.output.count("keypass database handed over to the running Keepass (pid ") == 6
+        assert "DONE: 7 of 7 keepass databases launched." in result.output
+        assert len((tmp_path / "handed_over").read_text().splitlines()) == 6
+        assert len({record["pid"] for record in json.loads(registry_path.read_text()).values()}) == 1
+        result = runner.invoke(cli, ["all", "--batch", "--wait", "-t"], input="12345\n")
+        assert "ERROR: --wait and --batch cannot be combined." in result.output
+    finally:
+        stop_registered_processes(registry_path)
+
+
+def test_ci_pykeypass_launchers(monkeypatch):
+    kp = keepass.PyKeePass(path_selection(True)[2], password="12345")  # noqa: S106
+    index = EntryIndex(kp)
+    assert KeePassLauncher("keepass.exe").arguments([index.entry("new_entry_key")]) == [
+        "keepass.exe",
+        str(test_database_with_key),
+        "-pw:12345",
+        f"-keyfile:{test_database_with_key_key}",
+    ]
+    keepassxc = KeePassXCLauncher("keepassxc")
+    batches = keepassxc.batches([(name, index.entry(name)) for name in ("new_entry", "new_entry_key", "bulk_key")])
+    assert [[name for name, entry in batch] for batch in batches] == [["new_entry"], ["new_entry_key", "bulk_key"]]
+    entries = [entry for name, entry in batches[1]]
+    assert keepassxc.arguments(entries) == [
+        "keepassxc",
+        "--pw-stdin",
+        "--keyfile",
+        str(test_database_with_key_key),
+        str(test_database_with_key),
+        str(test_database_with_key),
+    ]
+    assert keepassxc.stdin(entries) == b"12345\n12345\n"
+    launched = []
+    monkeypatch.setattr(StubLauncher, "start", lambda self, entries: launched.append(len(entries)))
+    result = runner.invoke(cli, ["--launcher", "stub", "all", "--batch", "-t"], input="12345\n")
+    assert "DONE: 7 of 7 keepass databases launched." in result.output
+    assert launched == [7]
+    for command in (["open", "new_entry"], ["all"]):
+        result = runner.invoke(cli, ["--launcher", "stub", *command, "--wait", "-t"], input="12345\n")
+        assert "ERROR: --wait follows Keepass processes, the stub launcher starts none." in result.output
+        assert "failed to launch" not in result.output
+    assert launched == [7]
+    monkeypatch.setenv("PYKEYPASS_LAUNCHER", "stub")
+    result = runner.invoke(cli, ["open", "new_entry", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert launched == [7, 1]
+
+
+def test_ci_pykeypass_status(monkeypatch):
+    result = runner.invoke(cli, ["status", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "DATABASE" in result.output and "LATENCY" in result.output
+    lines = {tuple(line.split()[:3]) for line in result.output.splitlines()}
+    assert ("new_entry_key", "database", "reachable") in lines
+    assert ("new_entry_key", "key", "reachable") in lines
+    assert ("verify_missing_file", "database", "unreachable") in lines
+    assert ("verify_missing_key", "key", "unreachable") in lines
+    assert "DONE: 5 of 7 keepass databases reachable." in result.output
+
+    # a hanging file is reported as timed out without holding up the others
+    original_stat = pykeypass_status._stat
+
+    def hanging_stat(path, start, answers):
+        if path.endswith(".key"):
+            time.sleep(1)
+        original_stat(path, start, answers)
+
+    monkeypatch.setattr(pykeypass_status, "_stat", hanging_stat)
+    json_runner = CliRunner(mix_stderr=False)
+    result = json_runner.invoke(
+        cli, ["status", "new_entry", "new_entry_key", "--timeout", "0.2", "--json", "-t"], input="12345\n"
+    )
+    report = json.loads(result.stdout)
+    assert [(database["database"], database["reachable"]) for database in report] == [
+        ("new_entry", True),
+        ("new_entry_key", False),
+    ]
+    database_file, key_file = report[1]["files"]
+    assert database_file["reachable"] is True
+    assert database_file["size"] == test_database_with_key.stat().st_size
+    assert key_file == {
+        "kind": "key",
+        "path": str(test_database_with_key_key),
+        "reachable": False,
+        "size": None,
+        "modified": None,
+        "latency_ms": 200.0,
+        "error": "timed out after 0.2s",
+    }
+
+
+def test_ci_pykeypass_rekdf():
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    (pykeypass_folder / "kdf.json").unlink()
+    result = runner.invoke(cli, ["rekdf", "-t"], input="12345\n")
+    assert "ERROR: No earlier calibration found." in result.output
+    result = runner.invoke(cli, ["rekdf", "--target-unlock-ms", "100", "-t"], input="wrong\n")
+    assert "ERROR: pykeypass login information invalid." in result.output
+    result = runner.invoke(cli, ["rekdf", "--target-unlock-ms", "100", "-t"], input="12345\n")
+    assert result.exit_code == 0
+    assert "DONE: Argon2 memory " in result.output
+    settings = json.loads((pykeypass_folder / "kdf.json").read_text())
+    assert settings["target_ms"] == 100
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    assert kp.kdf_algorithm == "argon2"
+    header = kp.kdbx.header.value.dynamic_header.kdf_parameters.data.dict
+    assert [header[name].value for name in "MIP"] == [settings[key] for key in ("memory", "iterations", "parallelism")]
+    assert len(kp.find_entries(title=".*", regex=True)) == 7
+    # the stored target is reused
+    result = runner.invoke(cli, ["rekdf", "-t"], input="12345\n")
+    assert "STATUS: Calibrating the key derivation for a 100 ms unlock." in result.output
+    result = runner.invoke(cli, ["path", "new_entry_key", "-t"], input="12345\n")
+    assert f"NEW_ENTRY_KEY PATH: {test_database_with_key}" in result.output
+
+
+def test_ci_pykeypass_kdf_calibrate():
+    def measure(memory, iterations, parallelism, seconds_per_64_mib):
+        return memory / (64 * MIB) * iterations * seconds_per_64_mib
+
+    # fast machine: memory grows while at least four iterations fit, then iterations fill the target
+    kdf, expected = calibrate(1000, parallelism=4, measure=lambda *args: measure(*args, 0.1))
+    assert kdf.as_dict() == {"memory": 256 * MIB, "iterations": 2, "parallelism": 4}
+    assert expected == pytest.approx(0.8)
+    # thin client: memory shrinks down to the minimum
+    kdf, expected = calibrate(200, parallelism=1, measure=lambda *args: measure(*args, 1.0))
+    assert kdf.as_dict() == {"memory": 8 * MIB, "iterations": 1, "parallelism": 1}
+    assert str(kdf) == "memory 8 MiB, 1 iteration, parallelism 1"
+
+
+@pytest.fixture
+def app_database_calls(monkeypatch):
+    """Arguments of the client's calls to 'unlock_app_database' and 'save_app_database': (unlocks, saves)."""
+    unlocks, saves = [], []
+    unlock_app_database, save_app_database = pykeypass_client.unlock_app_database, pykeypass_client.save_app_database
+    monkeypatch.setattr(
+        pykeypass_client,
+        "unlock_app_database",
+        lambda *args, **kwargs: unlocks.append(args) or unlock_app_database(*args, **kwargs),
+    )
+    monkeypatch.setattr(
+        pykeypass_client,
+        "save_app_database",
+        lambda *args, **kwargs: saves.append(args) or save_app_database(*args, **kwargs),
+    )
+    return unlocks, saves
+
+
+def test_ci_pykeypass_client(app_database_calls):
+    pykeypass_db = path_selection(True)[2]
+    unlocks, saves = app_database_calls
+    launcher = StubLauncher()
+    with PyKeypassClient(password="12345", launcher=launcher, test=True) as client:  # noqa: S106
+        assert {"new_entry", "new_entry_key"} <= set(client.list())
+        assert client.path("new_entry_key") == (str(test_database_with_key), str(test_database_with_key_key))
+        assert client.path("new_entry") == (str(test_database_no_key), None)
+        with pytest.raises(KeyError):
+            client.path("client_missing")
+        assert client.upsert("client_a", str(test_database_no_key), "12345") == "added"
+        key = str(test_database_with_key_key)
+        assert client.upsert("client_a", str(test_database_with_key), "12345", key=key) == "replaced"
+        assert client.upsert("client_b", str(test_database_no_key), "12345") == "added"
+        assert client.delete("client_b") is True
+        assert client.delete("client_b") is False
+        assert client.open("client_a") is None
+        results = client.open_many(["new_entry", "client_missing"])
+        assert [(result.name, result.ok) for result in results] == [("new_entry", True), ("client_missing", False)]
+        assert isinstance(results[1].error, KeyError)
+        assert saves == []
+    # one unlock and one save for the whole session
+    assert len(unlocks) == 1
+    assert len(saves) == 1
+    assert launcher.launched == [
+        ["keepass-stub", str(test_database_with_key)],
+        ["keepass-stub", str(test_database_no_key)],
+    ]
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    assert len(kp.find_groups(name="client_a")) == 1
+    assert kp.find_entries(title="client_a", first=True).get_custom_property("key") == key
+    assert kp.find_groups(name="client_b") == []
+
+    # staged changes are dropped when the session ends with an exception
+    with pytest.raises(RuntimeError):
+        with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+            client.delete("client_a")
+            raise RuntimeError
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        assert "client_a" in client
+        client.delete("client_a")
+    assert "client_a" not in PyKeypassClient(password="12345", test=True).list()  # noqa: S106
+
+
+def test_ci_pykeypass_completion(monkeypatch):
+    pykeypass_folder, pykeypass_app, pykeypass_db = path_selection(True)
+    completer = ShellComplete(cli, {}, "pykeypass", "_PYKEYPASS_COMPLETE")
+
+    def complete(args, incomplete):
+        return [item.value for item in completer.get_completions(args, incomplete)]
+
+    monkeypatch.delenv(NAME_CACHE_ENV, raising=False)
+    runner.invoke(cli, ["list", "-t"], input="12345\n")
+    assert not (pykeypass_folder / "names.json").exists()
+    assert complete(["open", "-t"], "new") == []
+
+    # 'list' refreshes the opt-in name cache, completion never asks for the password
+    monkeypatch.setenv(NAME_CACHE_ENV, "1")
+    runner.invoke(cli, ["list", "-t"], input="12345\n")
+    assert "new_entry" in json.loads((pykeypass_folder / "names.json").read_text())["names"]
+    assert complete(["open", "-t"], "new_entry") == ["new_entry", "new_entry_key"]
+    assert complete(["path", "-t"], "new_entry_k") == ["new_entry_key"]
+    assert complete(["manage", "-t"], "zzz") == []
+
+    # saves refresh it too
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.upsert("new_entry_completion", str(test_database_no_key), "12345")
+    assert complete(["open", "-t"], "new_entry_c") == ["new_entry_completion"]
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.delete("new_entry_completion")
+    assert complete(["open", "-t"], "new_entry_c") == []
+
+    # thousands of names
+    names = [f"database_{number:05}" for number in range(5000)]
+    store_names(pykeypass_folder, names)
+    assert len(complete(["open", "-t"], "database_0")) == 5000
+    assert len(complete(["open", "-t"], "database_0499")) == 10
+
+    # without a name cache a running agent answers
+    clear_names(pykeypass_folder)
+    monkeypatch.setenv(NAME_CACHE_ENV, "0")
+    agent = Agent(pykeypass_db)
+    agent.unlock("12345")
+    server = threading.Thread(target=agent.serve, args=(pykeypass_folder,), daemon=True)
+    server.start()
+    for _ in range(100):
+        try:
+            request(pykeypass_folder, "status")
+            break
+        except AgentUnavailable:
+            time.sleep(0.05)
+    assert complete(["open", "-t"], "new_entry") == ["new_entry", "new_entry_key"]
+    request(pykeypass_folder, "lock")
+    assert complete(["open", "-t"], "new_entry") == []
+    request(pykeypass_folder, "stop")
+    server.join(5)
+    assert complete(["open", "-t"], "new_entry") == []
+
+
+@timing_test
+def test_ci_pykeypass_completion_time(monkeypatch):
+    pykeypass_folder = path_selection(True)[0]
+    completer = ShellComplete(cli, {}, "pykeypass", "_PYKEYPASS_COMPLETE")
+    monkeypatch.setenv(NAME_CACHE_ENV, "1")
+    store_names(pykeypass_folder, [f"database_{number:05}" for number in range(5000)])
+    timings = []
+    for _ in range(3):  # best of three, to keep a busy machine from failing the budget
+        start = time.perf_counter()
+        completions = completer.get_completions(["open", "-t"], "database_0")
+        timings.append(time.perf_counter() - start)
+    clear_names(pykeypass_folder)
+    assert len(completions) == 5000
+    assert min(timings) < 0.05
+
+
+def test_ci_pykeypass_shell(app_database_calls):
+    pykeypass_db = path_selection(True)[2]
+    unlocks, saves = app_database_calls
+    commands = [
+        "12345",
+        "list",
+        "path new_entry",
+        "path new_entry_key",
+        "open new_entry",
+        "open new_entry_key",
+        "manage new_entry_shell",
+        str(test_database_no_key),
+        "12345",
+        "n",
+        "path new_entry_shell",
+        "help open",
+        "setup",
+        "exit",
+    ]
+    result = runner.invoke(cli, ["--launcher", "stub", "shell", "-t"], input="\n".join(commands) + "\n")
+    assert "ENTRIES AVAILABLE: \nnew_entry" in result.output
+    assert f"NEW_ENTRY PATH: {test_database_no_key}" in result.output
+    assert f"NEW_ENTRY_KEY KEY: {test_database_with_key_key}" in result.output
+    assert "DONE: new_entry_shell keepass password setup." in result.output
+    assert f"NEW_ENTRY_SHELL PATH: {test_database_no_key}" in result.output
+    assert "Usage: pykeypass open [OPTIONS] [DATABASE]" in result.output
+    assert "ERROR: 'setup' is not available in the pykeypass shell (try 'help')." in result.output
+    assert "DONE: pykeypass shell closed, changes saved." in result.output
+    # one unlock for every command, one save on exit
+    assert len(unlocks) == 1
+    assert len(saves) == 1
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    assert kp.find_entries(title="new_entry_shell", first=True).url == str(test_database_no_key)
+
+    # idle lock: staged changes are saved and the next command unlocks again
+    client = ShellClient(password="12345", test=True)  # noqa: S106
+    shell = PyKeypassShell(client, lambda argv: None, idle_timeout=0.2)
+    shell.onecmd("list")
+    client.delete("new_entry_shell")
+    shell.postcmd(False, "delete")
+    for _ in range(50):
+        if not client.unlocked:
+            break
+        time.sleep(0.05)
+    assert client.unlocked is False
+    assert len(saves) == 2
+    assert "new_entry_shell" not in client.list()  # read again, streamed (see 'pykeypass.reader')
+    assert client.unlocked is True
+    assert len(unlocks) == 2
+    assert shell.close() is False
+
+
+def test_ci_pykeypass_profiles():
+    pykeypass_db = path_selection(True)[2]
+    result = runner.invoke(cli, ["tag", "new_entry", "work", "-t"], input="12345\n")
+    assert "NEW_ENTRY TAGS: work" in result.output
+    result = runner.invoke(cli, ["tag", "new_entry_key", "work,team", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY TAGS: work, team" in result.output
+    result = runner.invoke(cli, ["tag", "new_entry_key", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY TAGS: work, team" in result.output
+    result = runner.invoke(cli, ["tag", "new_entry_missing", "work", "-t"], input="12345\n")
+    assert "ISSUE: All or part of the new_entry_missing Keepass entry was not found." in result.output
+    result = runner.invoke(
+        cli,
+        ["manage", "new_entry_tags", "--tags", "team, lab", "-t"],
+        input=f"12345\n{test_database_no_key}\n12345\nn\n",
+    )
+    assert "DONE: new_entry_tags keepass password setup." in result.output
+
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    index = EntryIndex(kp)
+    assert sorted(index.tagged("work")) == ["new_entry", "new_entry_key"]
+    assert {tag: sorted(names) for tag, names in index.tags().items()} == {
+        "lab": ["new_entry_tags"],
+        "team": ["new_entry_key", "new_entry_tags"],
+        "work": ["new_entry", "new_entry_key"],
+    }
+    assert kp.find_entries(title="new_entry_key", first=True).get_custom_property("tags") == "work,team"
+
+    result = runner.invoke(cli, ["list", "--tag", "work", "-t"], input="12345\n")
+    assert "ENTRIES TAGGED work: \n" in result.output
+    assert sorted(result.output.split("ENTRIES TAGGED work: \n")[1].split()) == ["new_entry", "new_entry_key"]
+    result = runner.invoke(
+        cli, ["--launcher", "stub", "open", "--profile", "work", "-w", "2", "-t"], input="12345\n"
+    )
+    assert "START: Open profile work (2 keepass databases)." in result.output
+    assert "STATUS: new_entry keypass database launched successfully." in result.output
+    assert "STATUS: new_entry_key keypass database launched successfully." in result.output
+    assert "DONE: 2 of 2 keepass databases launched." in result.output
+    result = runner.invoke(cli, ["open", "--profile", "nobody", "-t"], input="12345\n")
+    assert "NOTICE: No keepass database in profile nobody." in result.output
+    result = runner.invoke(cli, ["open", "new_entry", "--profile", "work", "-t"])
+    assert "ERROR: Use either 'pykeypass open <name>' or 'pykeypass open --profile <profile>'." in result.output
+
+    # a replaced entry keeps its tags, a manifest can set them
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.set_tags("new_entry", [])
+        client.delete("new_entry_tags")
+        assert client.tagged("team") == ["new_entry_key"]
+    result = runner.invoke(
+        cli,
+        ["manage", "new_entry_key", "-t"],
+        input=f"12345\ny\n{test_database_with_key}\n12345\ny\n{test_database_with_key_key}\n",
+    )
+    assert "DONE: new_entry_key keepass password setup." in result.output
+    databases, errors = validate_rows(
+        [
+            {"name": "a", "url": "a.kdbx", "password": "1", "tags": "work; lab,work"},
+            {"name": "b", "url": "b.kdbx", "password": "1", "tags": ["x", "y"]},
+        ]
+    )
+    assert errors == []
+    assert [database["tags"] for database in databases] == [["work", "lab"], ["x", "y"]]
+    result = runner.invoke(cli, ["tag", "new_entry_key", "work", "team", "--remove", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY TAGS: -" in result.output
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    assert EntryIndex(kp).tags() == {}
+    assert kp.find_entries(title="new_entry_key", first=True).get_custom_property("tags") is None
+
+
+def test_ci_pykeypass_scheduler(tmp_path):
+    class Entry:
+        def __init__(self, priority=None):
+            self.priority = priority
+
+        def get_custom_property(self, key):
+            return self.priority
+
+    databases = [("a", Entry()), ("b", Entry("2")), ("c", Entry("x")), ("d", Entry("5")), ("e", Entry())]
+    waves = plan_waves(databases, 2)
+    assert [[name for name, entry in wave] for wave in waves] == [["d", "b"], ["a", "c"], ["e"]]
+
+    started = []
+    ready = []
+
+    def start(name, entry):
+        started.append(name)
+        return OpenResult(name, process=object())
+
+    def is_ready(launch, elapsed):
+        # every wave must be ready before the next one starts
+        assert started[-1] in {name for name, entry in waves[launch.wave]}
+        return 0.2 * (launch.wave + 1)
+
+    scheduler = LaunchScheduler(start, max_concurrent=2, is_ready=is_ready, on_ready=ready.append)
+    launches = scheduler.run(databases)
+    assert [launch.name for launch in launches] == ["d", "b", "a", "c", "e"]
+    assert [launch.wave for launch in launches] == [0, 0, 1, 1, 2]
+    assert [launch.name for launch in ready] == ["d", "b", "a", "c"]  # the last wave is not waited for
+    assert [size for size, seconds in scheduler.waves] == [2, 2]
+    with pytest.raises(ValueError):
+        LaunchScheduler(start, gate="later")
+
+    history = LaunchHistory(tmp_path)
+    assert history.concurrency() == DEFAULT_CONCURRENCY
+    assert history.expected("d") == DEFAULT_LAUNCH_SECONDS
+    history.record(scheduler)
+    history.concurrency_levels = {"2": {"throughput": 3.0, "runs": 1}, "8": {"throughput": 1.5, "runs": 1}}
+    history.save()
+    history = LaunchHistory(tmp_path)
+    assert history.expected("d") == pytest.approx(0.2)
+    assert history.expected("a") == pytest.approx(0.4)
+    assert history.delay(["d", "b", "a"]) == pytest.approx(0.2)
+    assert history.concurrency() == 2
+    # every EXPLORE_EVERY runs, the neighbour of the best size measured least often is tried
+    history.runs = EXPLORE_EVERY - 1
+    assert history.concurrency() == 1
+    assert history.concurrency(explore=False) == 2
+    history.concurrency_levels["1"] = {"throughput": 1.0, "runs": 1}
+    assert history.concurrency() == 4
+    history.record(scheduler)
+    history.save()
+    assert LaunchHistory(tmp_path).runs == EXPLORE_EVERY
+    assert LaunchHistory(tmp_path).concurrency() == 2
+
+    result = runner.invoke(cli, ["priority", "new_entry_key", "5", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY PRIORITY: 5" in result.output
+    result = runner.invoke(cli, ["priority", "new_entry_key", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY PRIORITY: 5" in result.output
+    result = runner.invoke(
+        cli, ["--launcher", "stub", "all", "-w", "2", "--gate", "delay", "--delay", "0", "-t"], input="12345\n"
+    )
+    assert "STATUS: Launching 7 keepass databases in 4 waves of up to 2 (0.00s apart)." in result.output
+    launched = [line for line in result.output.splitlines() if line.endswith("launched successfully.")]
+    assert launched[0] == "STATUS: new_entry_key keypass database launched successfully."
+    assert "DONE: 7 of 7 keepass databases launched." in result.output
+    result = runner.invoke(cli, ["all", "--gate", "later", "-t"])
+    assert "Invalid value for '--gate'" in result.output
+    databases, errors = validate_rows(
+        [
+            {"name": "a", "url": "a.kdbx", "password": "1", "priority": "3"},
+            {"name": "b", "url": "b.kdbx", "password": "1", "priority": "soon"},
+        ]
+    )
+    assert [database["priority"] for database in databases] == [3]
+    assert errors == ["row 2 (b): priority 'soon' is not an integer"]
+    result = runner.invoke(cli, ["priority", "new_entry_key", "0", "-t"], input="12345\n")
+    assert "NEW_ENTRY_KEY PRIORITY: 0" in result.output
+    kp = keepass.PyKeePass(path_selection(True)[2], password="12345")  # noqa: S106
+    assert kp.find_entries(title="new_entry_key", first=True).get_custom_property("priority") is None
+
+
+def test_ci_pykeypass_reader(tmp_path, app_database_calls):
+    for cipher in ("aes256", "chacha20"):
+        reader_db = tmp_path / f"reader_{cipher}.kdbx"
+        kp = keepass.create_database(str(reader_db), password="12345")  # noqa: S106
+        if cipher == "chacha20":
+            kp.kdbx.header.value.dynamic_header.cipher_id.data = cipher
+            kp.kdbx.header.value.dynamic_header.encryption_iv.data = os.urandom(12)
+            kp.kdbx.header.pop("data", None)
+        for number in range(12):
+            group = kp.add_group(kp.root_group, f"reader_{number}")
+            entry = kp.add_entry(group, f"reader_{number}", "user", f"pässwörd-{number}", url=f"{number}.kdbx")
+            if number % 3 == 0:
+                entry.set_custom_property("key", f"{number}.key")
+                entry.set_custom_property("secret", f"secret-{number}", protect=True)
+            if number % 4 == 0:
+                entry.save_history()
+                entry.password = f"changed-{number}"
+        kp.add_entry(kp.root_group, "reader_root", "user", "root")
+        nested = kp.add_group(kp.find_groups(name="reader_1", first=True), "reader_nested")
+        kp.add_entry(nested, "reader_nested_entry", "user", "nested", url="nested.kdbx")
+        kp.trash_entry(kp.find_entries(title="reader_7", first=True))
+        kp.save()
+        kp = keepass.PyKeePass(str(reader_db), password="12345")  # noqa: S106
+        index = EntryIndex(kp)
+
+        reader = AppDatabaseReader(reader_db).unlock(kp.transformed_key)
+        assert reader.entry("reader_0").password == "changed-0"
+        assert reader.names() == index.names()
+        for name in [*index.names(), "reader_root", "reader_nested_entry", "reader_7", "Recycle Bin", "missing"]:
+            streamed, indexed = reader.entry(name), index.entry(name)
+            if indexed is None:
+                assert streamed is None
+                continue
+            assert (streamed.title, streamed.url, streamed.password, streamed.custom_properties) == (
+                indexed.title,
+                indexed.url,
+                indexed.password,
+                indexed.custom_properties,
+            )
+        with pytest.raises(keepass.exceptions.CredentialsError):
+            AppDatabaseReader(reader_db).unlock(bytes(32))
+    with pytest.raises(UnsupportedFormat):
+        AppDatabaseReader(test_database_no_key)  # KDBX 3
+    # a lookup stops scanning at its entry: a damaged payload block after it goes unnoticed
+    large_db = tmp_path / "reader_large.kdbx"
+    kp = keepass.create_database(str(large_db), password="12345")  # noqa: S106
+    kp.add_entry(kp.add_group(kp.root_group, "reader_first"), "reader_first", "user", "first", url="first.kdbx")
+    large = kp.add_entry(kp.add_group(kp.root_group, "reader_large"), "reader_large", "user", "large")
+    large.notes = os.urandom(1536 * 1024).hex()  # more than one 1 MiB payload block, even compressed
+    kp.save()
+    transformed_key = keepass.PyKeePass(str(large_db), password="12345").transformed_key  # noqa: S106
+    data = bytearray(large_db.read_bytes())
+    data[-100] ^= 1  # in the last payload block (the final 36 bytes are the empty end block)
+    large_db.write_bytes(bytes(data))
+    reader = AppDatabaseReader(large_db).unlock(transformed_key)
+    assert reader.entry("reader_first").url == "first.kdbx"
+    with pytest.raises(keepass.exceptions.PayloadChecksumError):
+        reader.names()
+
+    # read-only calls stream the app database, the first change unlocks it with the same key
+    unlocks = app_database_calls[0]
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        assert client.path("new_entry_key") == (str(test_database_with_key), str(test_database_with_key_key))
+        assert client.entry("new_entry").password == "12345"
+        assert unlocks == []
+        client.set_tags("new_entry", client.tags("new_entry"))
+    assert len(unlocks) == 1
+    assert unlocks[0][4] is not None  # no second key derivation
+    with PyKeypassClient(password="12345", test=True, streaming=False) as client:  # noqa: S106
+        assert client.path("new_entry") == (str(test_database_no_key), None)
+    assert len(unlocks) == 2
+
+
+def test_ci_pykeypass_journal(monkeypatch):
+    pykeypass_db = path_selection(True)[2]
+    journal = pykeypass_db.with_suffix(".journal")
+    monkeypatch.setenv("PYKEYPASS_JOURNAL", "1")
+    modified = os.stat(pykeypass_db).st_mtime_ns
+
+    # journaled changes leave the app database alone and are replayed by every later command
+    result = runner.invoke(
+        cli,
+        ["manage", "new_entry_journal", "--tags", "journaled", "-t"],
+        input=f"12345\n{test_database_no_key}\n12345\nn\n",
+    )
+    assert "DONE: new_entry_journal keepass password setup." in result.output
+    result = runner.invoke(cli, ["priority", "new_entry_journal", "4", "-t"], input="12345\n")
+    assert "NEW_ENTRY_JOURNAL PRIORITY: 4" in result.output
+    assert os.stat(pykeypass_db).st_mtime_ns == modified
+    assert journal.exists()
+    result = runner.invoke(cli, ["path", "new_entry_journal", "-t"], input="12345\n")
+    assert str(test_database_no_key) in result.output
+    result = runner.invoke(cli, ["list", "--tag", "journaled", "-t"], input="12345\n")
+    assert result.output.split("ENTRIES TAGGED journaled: \n")[1].split() == ["new_entry_journal"]
+    with PyKeypassClient(password="12345", test=True, streaming=False) as client:  # noqa: S106
+        assert client.entry("new_entry_journal").password == "12345"
+        assert client.priority("new_entry_journal") == 4
+        assert client.delete("new_entry_journal")
+        client.upsert("new_entry_journal", str(test_database_no_key), "54321")
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        assert client.entry("new_entry_journal").password == "54321"
+        assert client.tags("new_entry_journal") == []
+        assert client.list()[-1] == "new_entry_journal"
+        assert client._kp is None  # streamed, with the journal applied on top
+
+    # a torn record at the end is ignored, and overwritten by the next append
+    journal_size = journal.stat().st_size
+    with open(journal, "ab") as journal_file:
+        journal_file.write(b"\x40\x00\x00\x00torn")
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.set_priority("new_entry_journal", 2)
+    assert journal.stat().st_size > journal_size
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        assert client.priority("new_entry_journal") == 2
+
+    result = runner.invoke(cli, ["compact", "-t"], input="12345\n")
+    assert "DONE: 4 journaled change(s) written to the pykeypass app database." in result.output
+    assert not journal.exists()
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    entry = kp.find_entries(title="new_entry_journal", first=True)
+    assert (entry.password, entry.get_custom_property("priority")) == ("54321", "2")
+    result = runner.invoke(cli, ["compact", "-t"], input="12345\n")
+    assert "STATUS: No journaled changes to compact." in result.output
+
+    # past the threshold a save compacts the journal; without the journal a save folds it in
+    monkeypatch.setenv("PYKEYPASS_JOURNAL_COMPACT_KB", "0")
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.set_priority("new_entry_journal", 3)
+    assert not journal.exists()
+    monkeypatch.setenv("PYKEYPASS_JOURNAL_COMPACT_KB", "1024")
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        client.delete("new_entry_journal")
+    assert journal.exists()
+    monkeypatch.delenv("PYKEYPASS_JOURNAL")
+    with PyKeypassClient(password="12345", test=True) as client:  # noqa: S106
+        assert "new_entry_journal" not in client
+        client.set_tags("new_entry", client.tags("new_entry"))
+    assert not journal.exists()
+    kp = keepass.PyKeePass(pykeypass_db, password="12345")  # noqa: S106
+    assert kp.find_entries(title="new_entry_journal", first=True) is None
+    assert kp.find_groups(name="new_entry_journal", first=True) is None
+
+
+def test_ci_pykeypass_journal_concurrent(tmp_path):
+    path = tmp_path / "pykeepass.journal"
+    transformed_key = bytes(range(32))
+
+    def save(writer):
+        journal = ChangeJournal(path, transformed_key)
+        for number in range(25):
+            journal.append({f"{writer}_{number}": None})
+
+    # appends of several writers are serialized by the lock, none of them is lost
+    writers = [threading.Thread(target=save, args=(writer,)) for writer in ("a", "b", "c")]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    journal = ChangeJournal(path, transformed_key)
+    assert len(journal.changes()) == 75
+    assert journal.changes_count == 75
+
+    # a journal with changes its writer did not see is kept, a writer whose journal was removed starts a new one
+    stale = ChangeJournal(path, transformed_key)
+    stale.changes()
+    journal.append({"d": None})
+    stale.remove()
+    assert path.exists()
+    journal.remove()
+    assert not path.exists()
+    stale.append({"e": None})
+    assert ChangeJournal(path, transformed_key).changes() == {"e": None}
+
+
+def test_ci_pykeypass_cache(tmp_path, monkeypatch):
+    cache_folder = path_selection(True)[0] / "cache"
+    opened = []
+    monkeypatch.setattr(StubLauncher, "start", lambda self, entries: opened.extend(entries))
+    result = runner.invoke(
+        cli, ["--launcher", "stub", "open", "new_entry_key", "--cache", "-t"], input="12345\n"
+    )
+    assert "STATUS: new_entry_key keepass database copied in cache" in result.output
+    (entry,) = opened
+    assert Path(entry.url).parent == cache_folder
+    assert Path(entry.url).read_bytes() == test_database_with_key.read_bytes()
+    assert Path(entry.get_custom_property("key")).read_bytes() == test_database_with_key_key.read_bytes()
+    assert entry.password == "12345"
+    assert not os.stat(entry.url).st_mode & stat.S_IWUSR
+    result = runner.invoke(cli, ["--launcher", "stub", "all", "--batch", "--cache", "-t"], input="12345\n")
+    assert "STATUS: new_entry keepass database copied in cache" in result.output
+    assert "STATUS: new_entry_key keepass database up to date in cache" in result.output
+    assert "WARNING: verify_missing_file keepass database not cached" in result.output
+    assert "DONE: 7 of 7 keepass databases launched." in result.output
+    cached = [entry for entry in opened[1:] if not entry.title.startswith("verify_missing")]
+    assert {Path(entry.url).parent for entry in cached} == {cache_folder}
+
+    # least recently used files are evicted once the cache is over its limit
+    sources = [tmp_path / f"{name}.kdbx" for name in ("a", "b", "c")]
+    for source in sources:
+        source.write_bytes(b"x" * 1000)
+    cache = DatabaseCache(tmp_path / ".pykeypass", limit=2500)
+    cache.prefetch(sources[:2])
+    time.sleep(0.05)
+    cache.prefetch(sources[:1])
+    time.sleep(0.05)
+    assert cache.prefetch(sources[2:])[str(sources[2])].status == COPIED
+    assert set(cache.files) == {str(sources[0]), str(sources[2])}
+    assert not cache.local_path(sources[1]).exists()
+    # a changed source is copied again, a touched one with the same content is not
+    sources[0].write_bytes(b"y" * 1000)
+    assert cache.prefetch(sources[:1])[str(sources[0])].status == COPIED
+    os.utime(sources[0], ns=(1, 1))
+    assert cache.prefetch(sources[:1])[str(sources[0])].status == CACHE_UP_TO_DATE
+    assert cache.local_path(sources[0]).read_bytes() == b"y" * 1000
 
 
 def test_teardown_install_files():
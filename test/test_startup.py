@@ -0,0 +1,97 @@
+# ruff: noqa: S101, S603
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# 'benchmarks/bench_startup.py' measures the import time and holds the budget
+BENCH_STARTUP = Path(__file__).resolve().parent.parent / "benchmarks" / "bench_startup.py"
+_spec = importlib.util.spec_from_file_location("bench_startup", BENCH_STARTUP)
+bench_startup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench_startup)
+
+# Wall-clock budgets are measured on Linux; process start and file system are slower on Windows.
+TIMING_ENV = "PYKEYPASS_TIMING_TESTS"
+timing_test = pytest.mark.skipif(
+    sys.platform == "win32" and os.environ.get(TIMING_ENV) != "1",
+    reason=f"timings are unreliable on Windows (set {TIMING_ENV}=1 to run)",
+)
+
+# Never needed to print help or complete a command line.
+HEAVY_MODULES = ("pykeepass", "construct", "lxml", "Cryptodome", "argon2", "subprocess", "multiprocessing.connection")
+
+HELP_SCRIPT = """
+import sys
+from pykeypass import cli
+try:
+    cli(["--help"])
+except SystemExit:
+    pass
+print("LOADED:" + ",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+COMPLETE_SCRIPT = """
+import sys
+from pykeypass import cli
+try:
+    cli(prog_name="pykeypass")
+except SystemExit:
+    pass
+print("LOADED:" + ",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+def run_help():
+    return subprocess.run(
+        [sys.executable, "-c", HELP_SCRIPT.format(modules=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    )
+
+
+def test_help_does_not_import_heavy_modules():
+    result = run_help()
+    assert "KEEPASS CLI TOOL" in result.stdout
+    assert result.stdout.splitlines()[-1] == "LOADED:"
+
+
+@timing_test
+def test_help_import_time_budget():
+    # best of three runs, to keep a busy machine from failing the budget
+    timings = [bench_startup.help_import_time_us() / 1000 for _ in range(3)]
+    budget_ms = bench_startup.DEFAULT_BUDGET_MS
+    assert min(timings) < budget_ms, f"pykeypass import took {min(timings):.1f}ms (budget {budget_ms}ms)"
+
+
+def test_completion_does_not_import_heavy_modules(tmp_path):
+    names_folder = tmp_path / ".pykeypass"
+    names_folder.mkdir()
+    names = [f"database_{number:05}" for number in range(5000)]
+    (names_folder / "names.json").write_text(json.dumps({"names": names}))
+    env = {
+        **os.environ,
+        "HOME": str(tmp_path),
+        "USERPROFILE": str(tmp_path),
+        "PYKEYPASS_NAME_CACHE": "1",
+        "_PYKEYPASS_COMPLETE": "bash_complete",
+        "COMP_WORDS": "pykeypass open database_0499",
+        "COMP_CWORD": "2",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", COMPLETE_SCRIPT.format(modules=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+        env=env,
+    )
+    lines = result.stdout.splitlines()
+    assert lines[-1] == "LOADED:"
+    assert [line.split(",")[1] for line in lines[:-1]] == [f"database_0499{digit}" for digit in range(10)]